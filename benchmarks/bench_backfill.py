@@ -0,0 +1,132 @@
+"""
+批量补全演练
+对着本地假 OpenAI 服务（fake_openai_server，每个请求带固定延迟）补全若干天的历史总结：
+1. 规划：只有缺少总结或总结已过期的日期进入补全
+2. 并发：比较并发 1 与配置的并发数下的总耗时
+3. 中断：补全进行到一半时取消（模拟程序退出），再从检查点继续，检查每天只生成一次
+4. 补全期间事件循环的最大延迟（反映界面是否被阻塞）
+
+用法：
+    uv run python -m benchmarks.bench_backfill [天数] [单次请求延迟秒数]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.config import Config
+from src.database import AsyncDatabaseManager, DatabaseManager
+from src.models import DiarySummary, FragMind
+from src.services import Backfiller, LLMService, fragment_hashes
+
+from .fake_openai_server import FakeOpenAIServer
+
+
+FRAGMENTS_PER_DAY = 4
+
+
+async def seed(db: AsyncDatabaseManager, days: int) -> int:
+    """写入 days 天的片段：每 3 天中 1 天总结已是最新、1 天总结过期、1 天没有总结，返回需要补全的天数"""
+    start = datetime(2024, 1, 1, 9, 0)
+    stale = 0
+    for d in range(days):
+        day = start + timedelta(days=d)
+        date = day.strftime("%Y-%m-%d")
+        db.db.add_frag_minds([
+            FragMind(content=f"{date} 的第 {i + 1} 条记录", created_at=day + timedelta(hours=i), date=date)
+            for i in range(FRAGMENTS_PER_DAY)
+        ])
+        entries = await db.get_frag_minds_by_date(date)
+        if d % 3 == 0:
+            db.db.save_diary_summary(DiarySummary(date=date, summary="已是最新", entry_count=len(entries),
+                                                  source_fragments=fragment_hashes(entries)))
+            continue
+        if d % 3 == 1:
+            db.db.save_diary_summary(DiarySummary(date=date, summary="过期的总结", entry_count=len(entries),
+                                                  source_fragments=fragment_hashes(entries[:-1])))
+        stale += 1
+    return stale
+
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """补全期间事件循环的最大调度延迟（毫秒）"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst * 1000
+
+
+async def backfill(db: AsyncDatabaseManager, server: FakeOpenAIServer, days: int, concurrency: int,
+                   interrupt_after: int = 0):
+    """补全整个区间，返回 (耗时, 请求数, 事件循环最大延迟, 补全状态)；interrupt_after 条后取消再继续"""
+    service = LLMService(db, local_todo_parser=False, todo_batch_window_ms=0)
+    end = (datetime(2024, 1, 1) + timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    requests_before = server.requests
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(measure_lag(stop))
+    start = time.perf_counter()
+
+    interrupted = asyncio.Event()
+
+    def on_progress(progress):
+        if interrupt_after and progress.finished >= interrupt_after:
+            interrupted.set()
+
+    backfiller = Backfiller(db, lambda: service, concurrency=concurrency, on_progress=on_progress)
+    run_id = await backfiller.plan("2024-01-01", end)
+    if interrupt_after:
+        task = asyncio.ensure_future(backfiller.run(run_id))
+        await interrupted.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # 重新创建服务与补全器，如同程序重启后继续
+        service = LLMService(db, local_todo_parser=False, todo_batch_window_ms=0)
+        resumed = await db.get_backfill_run()
+        assert resumed is not None and resumed.id == run_id, resumed
+        print(f"  中断时已完成 {resumed.counts.get('done', 0)} 项，未完成 {resumed.counts.get('pending', 0)} 项")
+        backfiller = Backfiller(db, lambda: service, concurrency=concurrency)
+    run = await backfiller.run(run_id)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, server.requests - requests_before, await lag, run
+
+
+async def run(days: int, latency: float):
+    server = FakeOpenAIServer(latency=latency).start()
+    Config.LLM_BASE_URL = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "fake")
+    Config.DEEPSEEK_API_KEY = Config.DEEPSEEK_API_KEY or "fake"
+
+    print(f"{days} 天，每天 {FRAGMENTS_PER_DAY} 条片段，单次请求延迟 {latency * 1000:.0f} ms")
+    cases = [("并发 1", 1, 0), (f"并发 {Config.BACKFILL_CONCURRENCY}", Config.BACKFILL_CONCURRENCY, 0),
+             (f"并发 {Config.BACKFILL_CONCURRENCY}，中途中断后继续", Config.BACKFILL_CONCURRENCY, days // 6 or 1)]
+    try:
+        for name, concurrency, interrupt_after in cases:
+            with tempfile.TemporaryDirectory() as tmp:
+                db = AsyncDatabaseManager(DatabaseManager(str(Path(tmp) / "backfill.db")))
+                stale = await seed(db, days)
+                print(f"{name}：")
+                elapsed, requests, lag, state = await backfill(db, server, days, concurrency, interrupt_after)
+                summaries = [await db.get_diary_summary(d) for d, _ in await db.get_backfill_candidates(
+                    "2024-01-01", "2024-12-31")]
+                outdated = sum(s is None or s.summary == "过期的总结" for s in summaries)
+                print(f"  需要补全 {stale} 天，完成 {state.counts.get('done', 0)} 项，状态 {state.status}，"
+                      f"请求 {requests} 次，用时 {elapsed:.2f}s，事件循环最大延迟 {lag:.1f} ms")
+                assert state.status == "done" and outdated == 0, (state, outdated)
+                db.close()
+    finally:
+        server.stop()
+
+
+def main(days: int = 30, latency: float = 0.2):
+    asyncio.run(run(days, latency))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 30, float(args[1]) if len(args) > 1 else 0.2)
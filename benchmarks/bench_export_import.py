@@ -0,0 +1,101 @@
+"""
+导入导出吞吐基准
+生成 N 条片段（含每日总结与待办）的 JSONL，导入到空库后再分别导出 JSONL 与 Markdown，
+报告每秒行数与进程峰值内存
+注意：峰值常驻内存包含 SQLite mmap 映射的数据库页（最多 mmap_size），并非 Python 堆增长；
+导入耗时主要花在 FTS5 trigram 索引的触发器维护上
+
+用法：
+    uv run python -m benchmarks.bench_export_import [片段数]
+"""
+import json
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.database import DatabaseManager
+from src.database.transfer import WRITE_BUFFER_SIZE, export_jsonl, export_markdown, import_jsonl
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块
+    resource = None
+
+
+ENTRIES_PER_DAY = 20
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB），不支持的平台返回 0"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def write_source(path: Path, n: int):
+    """流式生成源 JSONL 文件"""
+    base = datetime(2000, 1, 1, 8, 0)
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as fp:
+        for i in range(n):
+            created = base + timedelta(days=i // ENTRIES_PER_DAY, minutes=i % ENTRIES_PER_DAY * 30)
+            fp.write(json.dumps({
+                "type": "entry",
+                "date": created.strftime("%Y-%m-%d"),
+                "created_at": created.isoformat(),
+                "content": f"第 {i} 条碎片：今天读了一会儿书，想到了一些新的点子",
+            }, ensure_ascii=False))
+            fp.write("\n")
+            if i % ENTRIES_PER_DAY == ENTRIES_PER_DAY - 1:
+                fp.write(json.dumps({
+                    "type": "summary",
+                    "date": created.strftime("%Y-%m-%d"),
+                    "summary": "今天过得很充实。" * 10,
+                    "entry_count": ENTRIES_PER_DAY,
+                }, ensure_ascii=False))
+                fp.write("\n")
+                fp.write(json.dumps({
+                    "type": "todo",
+                    "title": f"待办 {i}",
+                    "due_date": (created + timedelta(days=1)).isoformat(),
+                    "completed": i % 3 == 0,
+                }, ensure_ascii=False))
+                fp.write("\n")
+
+
+def report(label: str, counts: dict, elapsed: float):
+    """输出一项结果"""
+    rows = sum(counts.values())
+    print(f"{label:<16}{rows:>10} 行  {elapsed:7.2f} s  {rows / elapsed:>10.0f} 行/s  峰值内存 {peak_rss_mb():.0f} MB")
+
+
+def main(n: int = 1_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / "source.jsonl"
+        write_source(source, n)
+        print(f"源文件 {source.stat().st_size / (1 << 20):.0f} MB，基线峰值内存 {peak_rss_mb():.0f} MB")
+
+        db = DatabaseManager(str(tmp / "bench.db"))
+
+        start = time.perf_counter()
+        with open(source, encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as fp:
+            counts = import_jsonl(db, fp)
+        report("导入 JSONL", counts, time.perf_counter() - start)
+
+        for label, exporter, name in (
+            ("导出 JSONL", export_jsonl, "out.jsonl"),
+            ("导出 Markdown", export_markdown, "out.md"),
+        ):
+            start = time.perf_counter()
+            with open(tmp / name, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as fp:
+                counts = exporter(db, fp)
+            report(label, counts, time.perf_counter() - start)
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
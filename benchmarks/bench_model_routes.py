@@ -0,0 +1,86 @@
+"""
+待办提取的模型对比
+在标注语料 todo_corpus.jsonl 上依次用每个候选模型提取待办（不经本地预处理与合并），报告：
+- 质量：待办条目的精确率 / 召回率（标题包含标注关键词且截止时间一致才算正确）
+- 速度：成功调用的平均与 P95 耗时
+- 用量：输入 / 输出 token 与失败次数（取自应用自身的调用记录 llm_call_log）
+据此为 FRAGMIND_TODO_MODEL 选出满足质量要求的最快模型
+
+候选模型的格式同 FRAGMIND_TODO_FALLBACKS："模型名" 或 "模型名@接口地址"（未写地址时使用默认接口）
+
+用法：
+    uv run python -m benchmarks.bench_model_routes deepseek-chat qwen2.5:7b@http://127.0.0.1:11434/v1
+"""
+import asyncio
+import json
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from src.config import Config
+from src.database import AsyncDatabaseManager, DatabaseManager
+from src.services import CircuitBreaker, LLMJobQueue, LLMService, ModelRoute
+
+from .bench_todo_prefilter import CORPUS_PATH, todo_matches
+
+
+async def evaluate(spec: str, records: list, db: AsyncDatabaseManager) -> dict:
+    """用一个候选模型提取整个语料的待办"""
+    model, _, base_url = spec.partition("@")
+    Config.LLM_ROUTES["todo"] = dict(Config.LLM_ROUTES["todo"], model=model, base_url=base_url, fallbacks="")
+    # 对比时每条文本都要真正发出请求，不让熔断器拦下失败较多的模型
+    queue = LLMJobQueue(breaker=CircuitBreaker(failure_threshold=len(records) + 1))
+    service = LLMService(db, queue=queue, local_todo_parser=False, todo_batch_window_ms=0)
+
+    async def extract(record):
+        try:
+            return await service.aparse_todos(
+                record["text"], use_cache=False, now=datetime.fromisoformat(record["now"]), raise_errors=True
+            )
+        except Exception:
+            return None
+
+    results = await asyncio.gather(*(extract(r) for r in records))
+    produced = correct = labels = found = 0
+    for record, todos in zip(records, results):
+        labels += len(record["todos"])
+        if todos is None:
+            continue
+        produced += len(todos)
+        correct += sum(any(todo_matches(label, todo) for label in record["todos"]) for todo in todos)
+        found += sum(any(todo_matches(label, todo) for todo in todos) for label in record["todos"])
+    return {
+        "precision": correct / produced if produced else 0.0,
+        "recall": found / labels if labels else 0.0,
+    }
+
+
+async def run(specs: list):
+    records = [json.loads(line) for line in CORPUS_PATH.read_text(encoding="utf-8").splitlines() if line.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabaseManager(DatabaseManager(str(Path(tmp) / "routes.db")))
+        quality = {spec: await evaluate(spec, records, db) for spec in specs}
+        report = (await db.get_llm_call_report()).get("todo", {})
+        print(f"语料 {len(records)} 条")
+        print(f"{'模型':<40}{'精确率':>8}{'召回率':>8}{'平均耗时':>10}{'P95':>10}{'输入':>8}{'输出':>8}{'失败':>6}")
+        for spec, q in quality.items():
+            model, _, base_url = spec.partition("@")
+            r = report.get(ModelRoute(model, base_url or Config.LLM_BASE_URL).label, {})
+            avg = r.get("avg_latency_ms")
+            p95 = r.get("p95_latency_ms")
+            print(f"{spec:<40}{q['precision']:>8.1%}{q['recall']:>8.1%}"
+                  f"{(f'{avg:.0f} ms' if avg is not None else '-'):>10}{(f'{p95:.0f} ms' if p95 is not None else '-'):>10}"
+                  f"{r.get('input_tokens', 0):>8}{r.get('output_tokens', 0):>8}{r.get('failures', 0):>6}")
+        db.close()
+
+
+def main(specs: list):
+    if not specs:
+        print(__doc__)
+        return
+    asyncio.run(run(specs))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,92 @@
+"""
+离线任务重放演练
+对着本地假 OpenAI 服务（fake_openai_server）模拟一次服务中断：
+1. 服务返回 503：总结与待办提取失败，写入离线任务表，熔断器打开
+2. 中断持续期间统计实际发往服务的请求数（熔断与退避应让其保持很少）
+3. 服务恢复：统计从恢复到所有任务重放完成的耗时，并检查总结与待办已写入
+
+用法：
+    uv run python -m benchmarks.bench_offline_replay [中断秒数]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.config import Config
+from src.database import AsyncDatabaseManager, DatabaseManager
+from src.models import FragMind
+from src.services import CircuitBreaker, LLMJobQueue, LLMJobWorker, LLMService, is_transient_error
+
+from .fake_openai_server import FakeOpenAIServer
+
+
+TODO_TEXTS = ["明天下午交周报", "周五前给房东转房租", "记得预约体检"]
+
+
+async def run(outage_seconds: float):
+    server = FakeOpenAIServer(mode="error").start()
+    Config.LLM_BASE_URL = server.base_url
+    Config.LLM_RETRY_BASE_SECONDS = 0.5
+    Config.LLM_RETRY_MAX_SECONDS = 2.0
+    os.environ.setdefault("DEEPSEEK_API_KEY", "fake")
+    Config.DEEPSEEK_API_KEY = Config.DEEPSEEK_API_KEY or "fake"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabaseManager(DatabaseManager(str(Path(tmp) / "replay.db")))
+        today = datetime.now().strftime("%Y-%m-%d")
+        for i in range(5):
+            await db.add_frag_mind(FragMind(content=f"今天的第 {i + 1} 条记录", created_at=datetime.now()))
+
+        queue = LLMJobQueue(4, CircuitBreaker(failure_threshold=3, reset_timeout=1.0))
+        service = LLMService(db, queue=queue, local_todo_parser=False, todo_batch_window_ms=0)
+        worker = LLMJobWorker(db, lambda: service)
+
+        # 1. 服务中断：失败的调用写入离线任务表
+        start = time.perf_counter()
+        entries = await db.get_frag_minds_by_date(today)
+        try:
+            await service.asummarize(entries, today, raise_errors=True)
+        except Exception as e:
+            assert is_transient_error(e), e
+            await worker.enqueue_summary(today)
+        for text in TODO_TEXTS:
+            try:
+                await service.aparse_todos(text, use_cache=False, raise_errors=True)
+            except Exception as e:
+                assert is_transient_error(e), e
+                await worker.enqueue_todo(text)
+        print(f"中断开始：{time.perf_counter() - start:.2f} 秒内发出 {server.requests} 个请求，"
+              f"熔断器 {queue.breaker.state}，待重放 {(await db.get_llm_job_stats())['pending']} 个任务")
+
+        # 2. 中断持续期间后台重放只发出少量试探请求
+        worker.start()
+        before = server.requests
+        await asyncio.sleep(outage_seconds)
+        print(f"中断持续 {outage_seconds:.0f} 秒：后台重放发出 {server.requests - before} 个请求")
+
+        # 3. 服务恢复，等待所有任务重放完成
+        server.mode = "ok"
+        recovered = time.perf_counter()
+        while (await db.get_llm_job_stats())["pending"]:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - recovered
+        worker.stop()
+
+        summary = await db.get_diary_summary(today)
+        todos = await db.get_active_todos()
+        print(f"服务恢复后 {elapsed:.2f} 秒重放完成：总结{'已' if summary else '未'}写入，"
+              f"新增待办 {len(todos)} 条，失败任务 {(await db.get_llm_job_stats())['failed']} 个")
+        db.close()
+    server.stop()
+
+
+def main(outage_seconds: float = 5.0):
+    asyncio.run(run(outage_seconds))
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
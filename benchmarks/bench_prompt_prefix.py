@@ -0,0 +1,70 @@
+"""
+提示词前缀缓存命中率
+对着模拟 DeepSeek 前缀缓存的本地假服务（fake_openai_server），模拟连续几天中不断追加片段并重新生成总结、
+逐条提取待办，统计输入 token 中命中前缀缓存的比例（服务端统计与应用记录的调用明细）
+
+用法：
+    uv run python -m benchmarks.bench_prompt_prefix [天数] [每天片段数]
+"""
+import asyncio
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from src.config import Config
+from src.database import AsyncDatabaseManager, DatabaseManager
+from src.models import FragMind
+from src.services import LLMJobQueue, LLMService
+
+from .fake_openai_server import FakeOpenAIServer
+
+
+FRAGMENTS = [
+    "早上去公园跑了五公里，空气很好，路上看到一只橘猫在晒太阳。",
+    "上午开会讨论下个季度的计划，大家意见不太一致，有点累。",
+    "中午和同事去吃了新开的拉面店，汤头很浓，下次还想去。",
+    "下午把拖了一周的报告写完了，终于松了一口气。",
+    "傍晚给妈妈打了个电话，她说最近膝盖好多了。",
+    "晚上读了几章《置身事内》，对地方财政有了新的理解。",
+]
+
+
+async def run(days: int, per_day: int):
+    server = FakeOpenAIServer().start()
+    Config.LLM_BASE_URL = server.base_url
+    Config.DEEPSEEK_API_KEY = Config.DEEPSEEK_API_KEY or "fake"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabaseManager(DatabaseManager(str(Path(tmp) / "prefix.db")))
+        service = LLMService(db, queue=LLMJobQueue(4), local_todo_parser=False, todo_batch_window_ms=0)
+        first_day = datetime.now().replace(hour=7, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        for day in range(days):
+            start = first_day + timedelta(days=day)
+            date = start.strftime("%Y-%m-%d")
+            summary = ""
+            for i in range(per_day):
+                created_at = start + timedelta(minutes=90 * i)
+                content = FRAGMENTS[(day + i) % len(FRAGMENTS)]
+                await db.add_frag_mind(FragMind(content=content, created_at=created_at, date=date))
+                entries = await db.get_frag_minds_by_date(date)
+                # 每次追加后全量重写（不带来源记录），参考日记随之变化
+                summary = await service.asummarize(entries, date, summary, use_cache=False, raise_errors=True)
+                await service.aparse_todos(content, use_cache=False, now=created_at, raise_errors=True)
+
+        n = days * per_day
+        print(f"{days} 天共 {n} 次总结 + {n} 次待办提取：服务端输入 {server.prompt_tokens} tokens，"
+              f"命中前缀缓存 {server.cache_hit_tokens}（{server.cache_hit_tokens / server.prompt_tokens:.0%}）")
+        for agent, r in (await db.get_llm_call_report()).items():
+            print(f"  {agent}: {r['calls']} 次，输入 {r['input_tokens']}，命中 {r['cache_hit_tokens']}"
+                  f"（{r['hit_rate']:.0%}），平均耗时 {r['avg_latency_ms']:.1f} ms")
+        db.close()
+    server.stop()
+
+
+def main(days: int = 3, per_day: int = 6):
+    asyncio.run(run(days, per_day))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,107 @@
+"""
+相关性索引基准
+用合成的中英混合片段建立索引，测量：
+1. 首次建立（sync）的耗时与索引文件大小
+2. 查询延迟（p50 / p95），目标为 200k 条片段时 < 20 ms
+3. 增量更新（upsert / remove）的单次耗时、重新打开索引的耗时
+4. 检查：改写过的片段能找回原片段，那年今日只返回往年同日
+
+用法：
+    uv run python -m benchmarks.bench_related_index [片段数]
+"""
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from src.database import RelatedIndex
+
+
+WORDS = (
+    "早上 晚上 跑步 读书 咖啡 地铁 加班 开会 周报 项目 上线 回滚 朋友 吃饭 电影 下雨 天晴 散步 公园 猫 "
+    "想家 焦虑 开心 疲惫 失眠 健身 游泳 做饭 面条 火锅 旅行 机票 酒店 海边 山里 写代码 调试 重构 测试 "
+    "python numpy sqlite qt deadline review meeting coffee bug release"
+).split()
+
+
+def make_fragments(n: int, seed: int = 7):
+    """n 条随机片段 [(id, content, date)]，日期分布在最近 5 年"""
+    rng = random.Random(seed)
+    start = date(2021, 1, 1)
+    return [
+        (i + 1, "，".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))),
+         (start + timedelta(days=rng.randrange(5 * 365))).isoformat())
+        for i in range(n)
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(n: int = 200_000):
+    fragments = make_fragments(n)
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp) / "related"
+        index = RelatedIndex(directory)
+        start = time.perf_counter()
+        added, _ = index.sync(lambda: iter(fragments))
+        build = time.perf_counter() - start
+        size = sum(p.stat().st_size for p in directory.iterdir()) / 1024 / 1024
+        print(f"{n} 条片段：建立索引 {build:.1f}s（{added} 条，{n / build:.0f} 条/s），文件共 {size:.1f} MB")
+
+        queries = [fragments[rng.randrange(n)][1] for _ in range(200)]
+        index.query(queries[0])  # 预热映射页
+        latencies = []
+        for text in queries:
+            start = time.perf_counter()
+            index.query(text, k=5, before="2025-06-01")
+            latencies.append((time.perf_counter() - start) * 1000)
+        p50, p95 = statistics.median(latencies), percentile(latencies, 0.95)
+        print(f"查询：p50 {p50:.1f} ms，p95 {p95:.1f} ms（目标 < 20 ms）")
+
+        # 改写：打乱词序并去掉一个词后，原片段应排在最前
+        found = 0
+        samples = [fragments[rng.randrange(n)] for _ in range(100)]
+        for entry_id, content, _ in samples:
+            words = content.split("，")
+            rng.shuffle(words)
+            hits = index.query("，".join(words[:-1] if len(words) > 4 else words), k=10)
+            found += any(hit == entry_id for hit, _ in hits)
+        print(f"改写后找回原片段（top 10）：{found}/{len(samples)}")
+
+        start = time.perf_counter()
+        for i in range(1000):
+            index.upsert(n + i + 1, queries[i % len(queries)], "2026-01-01")
+        upsert = (time.perf_counter() - start) * 1000 / 1000
+        start = time.perf_counter()
+        for i in range(1000):
+            index.remove(n + i + 1)
+        remove = (time.perf_counter() - start) * 1000 / 1000
+        print(f"增量更新：upsert {upsert:.2f} ms/条，remove {remove:.2f} ms/条")
+
+        today = "2026-03-15"
+        ids = set(index.on_this_day(today, limit=1000))
+        dates = {d for i, _, d in fragments if i in ids}
+        assert all(d[5:] == today[5:] and d < today for d in dates), dates
+        print(f"那年今日（{today[5:]}）：{len(ids)} 条")
+
+        index.close()
+        start = time.perf_counter()
+        reopened = RelatedIndex(directory)
+        reopen = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        resync, removed = reopened.sync(lambda: iter(fragments))
+        print(f"重新打开 {reopen:.0f} ms，与数据库比对 {time.perf_counter() - start:.1f}s"
+              f"（需更新 {resync} 条，移除 {removed} 条）")
+        assert len(reopened) == n and resync == 0 and removed == 0
+        reopened.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,94 @@
+"""
+本地待办预处理评估
+在标注语料 todo_corpus.jsonl 上评估 prefilter_todo_text：
+- 待办检测：判定"可能有待办"的精确率 / 召回率（召回率低意味着漏掉待办且无法被 LLM 补救）
+- 本地生成：本地直接生成的待办中标题关键词与截止时间都正确的比例
+- 节省的 LLM 调用：直接跳过与本地生成的文本占比
+
+语料每行一条：{"now": 参考时刻, "text": 文本, "todos": [{"title": 标题关键词, "due": "YYYY-MM-DD[ HH:MM]" 或 null}]}
+
+用法：
+    uv run python -m benchmarks.bench_todo_prefilter [-v]
+"""
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.services.time_parser import prefilter_todo_text
+
+
+CORPUS_PATH = Path(__file__).with_name("todo_corpus.jsonl")
+
+
+def due_matches(expected, actual) -> bool:
+    """标注只有日期时比较日期，带时刻时精确到分钟；标注为 null 时不检查"""
+    if expected is None:
+        return True
+    if actual is None:
+        return False
+    if len(expected) == 10:
+        return actual.strftime("%Y-%m-%d") == expected
+    return actual.strftime("%Y-%m-%d %H:%M") == expected
+
+
+def todo_matches(label: dict, todo) -> bool:
+    """标题包含标注关键词且截止时间一致"""
+    return label["title"] in todo.title and due_matches(label["due"], todo.due_date)
+
+
+def main(verbose: bool = False):
+    records = [json.loads(line) for line in CORPUS_PATH.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    tp = fp = fn = tn = 0
+    skipped = local = 0
+    local_produced = local_correct = 0
+    start = time.perf_counter()
+    for record in records:
+        now = datetime.fromisoformat(record["now"])
+        result = prefilter_todo_text(record["text"], now)
+        has_todo = bool(record["todos"])
+
+        if result.actionable and has_todo:
+            tp += 1
+        elif result.actionable:
+            fp += 1
+        elif has_todo:
+            fn += 1
+        else:
+            tn += 1
+
+        if not result.actionable:
+            skipped += 1
+            outcome = "跳过"
+        elif result.todos:
+            local += 1
+            outcome = "本地"
+            for todo in result.todos:
+                local_produced += 1
+                ok = any(todo_matches(label, todo) for label in record["todos"])
+                local_correct += ok
+                if verbose and not ok:
+                    print(f"  ✗ 本地结果不符：{record['text']} -> {todo.title} @ {todo.due_date}")
+        else:
+            outcome = "LLM"
+
+        if verbose:
+            mark = "✗" if has_todo != result.actionable else " "
+            print(f"{mark} [{outcome:^4}] {record['text']}")
+    elapsed = time.perf_counter() - start
+
+    total = len(records)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    print(f"语料 {total} 条（有待办 {tp + fn} 条，无待办 {tn + fp} 条），平均 {elapsed / total * 1e6:.0f} µs/条")
+    print(f"待办检测    精确率 {precision:.1%}  召回率 {recall:.1%}")
+    if local_produced:
+        print(f"本地生成    {local_produced} 条，正确 {local_correct} 条（精确率 {local_correct / local_produced:.1%}）")
+    print(f"节省 LLM 调用 {(skipped + local) / total:.1%}（跳过 {skipped} 条，本地生成 {local} 条，"
+          f"仍需 LLM {total - skipped - local} 条）")
+
+
+if __name__ == "__main__":
+    main(verbose="-v" in sys.argv[1:])
@@ -0,0 +1,203 @@
+"""
+本地 OpenAI 兼容的假服务器
+用于在不联网的情况下测试 LLM 调用的失败处理与离线任务重放：
+设置 FRAGMIND_LLM_BASE_URL=http://127.0.0.1:端口/v1 后，应用的所有请求都发往这里
+
+模拟 DeepSeek 的前缀缓存：与之前请求相同的前缀（按 64 字符为单位）计入 prompt_cache_hit_tokens，
+token 数按字符数近似
+
+模式（可随时切换）：
+- ok：正常返回（总结为带请求序号的固定文本，待办按输入文本逐条返回）
+- error：返回 503
+- hang：挂起直到客户端超时
+- ratelimit：返回 429
+每个请求可附加固定延迟（latency 属性，秒），模拟真实服务的响应时间
+
+用法：
+    uv run python -m benchmarks.fake_openai_server [端口] [模式]
+运行中切换模式：
+    curl -X POST http://127.0.0.1:端口/_mode -d ok
+"""
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+SUMMARY_TEXT = "今天过得很充实。"
+_TEXT_SECTION_RE = re.compile(r"【文本 (\d+)】\n(.+)")
+# 前缀缓存的存储单位（字符）
+CACHE_UNIT = 64
+
+
+def _usage(prompt: str, completion: str, cache_hit: int = 0) -> dict:
+    return {
+        "prompt_tokens": len(prompt),
+        "completion_tokens": len(completion),
+        "total_tokens": len(prompt) + len(completion),
+        "prompt_cache_hit_tokens": cache_hit,
+        "prompt_cache_miss_tokens": len(prompt) - cache_hit,
+    }
+
+
+def _flatten_messages(messages: list) -> str:
+    """把全部消息（含系统提示词）拼成一个字符串，用于计算公共前缀"""
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        parts.append(f"<{message['role']}>{content}")
+    return "".join(parts)
+
+
+def _tool_arguments(user_prompt: str) -> dict:
+    """待办提取：批量请求时每段文本返回一条，单条请求返回最后一行文本"""
+    sections = _TEXT_SECTION_RE.findall(user_prompt)
+    if sections:
+        return {"items": [{"index": int(i), "title": text.strip()[:20], "due_date": None} for i, text in sections]}
+    return {"items": [{"title": user_prompt.strip().splitlines()[-1][:20], "due_date": None}]}
+
+
+class FakeOpenAIServer:
+    """在后台线程中运行的假服务器"""
+
+    def __init__(self, port: int = 0, mode: str = "ok", latency: float = 0.0):
+        self.mode = mode
+        self.latency = latency
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cache_hit_tokens = 0
+        self._prefixes: set = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def cache_hit(self, prompt: str) -> int:
+        """返回与之前请求共享的最长前缀长度（按 CACHE_UNIT 取整），并缓存本次请求的各级前缀"""
+        units = [prompt[:end] for end in range(CACHE_UNIT, len(prompt) + 1, CACHE_UNIT)]
+        with self._lock:
+            hit = 0
+            for prefix in units:
+                if prefix not in self._prefixes:
+                    break
+                hit = len(prefix)
+            self._prefixes.update(units)
+            self.prompt_tokens += len(prompt)
+            self.cache_hit_tokens += hit
+        return hit
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+                if self.path == "/_mode":
+                    server.mode = raw.decode().strip()
+                    return self._send_json(200, {"mode": server.mode})
+                if not self.path.endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.mode == "error":
+                    return self._send_json(503, {"error": {"message": "service unavailable"}})
+                if server.mode == "ratelimit":
+                    return self._send_json(429, {"error": {"message": "rate limited"}})
+                if server.mode == "hang":
+                    time.sleep(3600)
+                    return
+
+                body = json.loads(raw)
+                user_prompt = body["messages"][-1]["content"]
+                if isinstance(user_prompt, list):
+                    user_prompt = "".join(part.get("text", "") for part in user_prompt)
+                prompt = _flatten_messages(body["messages"])
+                cache_hit = server.cache_hit(prompt)
+                if body.get("stream"):
+                    return self._stream(body, prompt, cache_hit)
+                if body.get("tools"):
+                    arguments = json.dumps(_tool_arguments(user_prompt), ensure_ascii=False)
+                    message = {"role": "assistant", "content": None, "tool_calls": [{
+                        "id": "call_0", "type": "function",
+                        "function": {"name": body["tools"][0]["function"]["name"], "arguments": arguments},
+                    }]}
+                    completion = arguments
+                else:
+                    completion = f"{SUMMARY_TEXT}（第 {server.requests} 次生成）"
+                    message = {"role": "assistant", "content": completion}
+                self._send_json(200, {
+                    "id": f"chatcmpl-{server.requests}", "object": "chat.completion", "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                    "usage": _usage(prompt, completion, cache_hit),
+                })
+
+            def _stream(self, body: dict, prompt: str, cache_hit: int):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                text = f"{SUMMARY_TEXT}（第 {server.requests} 次生成）"
+                chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+                for i, chunk in enumerate(chunks):
+                    delta = {"content": chunk} | ({"role": "assistant"} if i == 0 else {})
+                    event = {"id": "chatcmpl-stream", "object": "chat.completion.chunk", "created": 0,
+                             "model": body["model"],
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                event = {"id": "chatcmpl-stream", "object": "chat.completion.chunk", "created": 0,
+                         "model": body["model"], "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                         "usage": _usage(prompt, text, cache_hit)}
+                self.wfile.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main(port: int = 8765, mode: str = "ok"):
+    server = FakeOpenAIServer(port, mode)
+    print(f"假 OpenAI 服务运行在 {server.base_url}（模式 {mode}），Ctrl+C 退出")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8765, sys.argv[2] if len(sys.argv) > 2 else "ok")
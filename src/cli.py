@@ -0,0 +1,167 @@
+"""
+FragMind 命令行工具
+无界面地导入导出日记数据：
+    fragmind export [--format jsonl|markdown] [-o 文件] [--db 数据库]
+    fragmind import 文件 [--db 数据库] [--batch-size N]
+    fragmind backfill --from 开始日期 [--to 结束日期] [--todos] [--concurrency N] [--db 数据库]
+    fragmind backfill --resume [--concurrency N] [--db 数据库]
+"""
+import argparse
+import asyncio
+import io
+import sys
+import time
+from datetime import date as date_type
+
+from src.database import DatabaseManager
+from src.database.transfer import WRITE_BUFFER_SIZE, export_jsonl, export_markdown, import_jsonl
+
+
+def _cmd_export(args) -> int:
+    """导出全部数据"""
+    db = DatabaseManager(args.db)
+    exporter = export_markdown if args.format == "markdown" else export_jsonl
+    start = time.perf_counter()
+    try:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as fp:
+                counts = exporter(db, fp)
+        else:
+            fp = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", write_through=False)
+            counts = exporter(db, fp)
+            fp.flush()
+            fp.detach()
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"导出完成：片段 {counts['entry']} 条，总结 {counts['summary']} 篇，"
+        f"待办 {counts['todo']} 项，用时 {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def _cmd_import(args) -> int:
+    """从 JSONL 导入数据"""
+    db = DatabaseManager(args.db)
+    start = time.perf_counter()
+    try:
+        with open(args.input, "r", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as fp:
+            counts = import_jsonl(db, fp, batch_size=args.batch_size)
+    except (OSError, ValueError) as e:
+        print(f"导入失败，未写入任何数据：{e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"导入完成：片段 {counts['entry']} 条，总结 {counts['summary']} 篇，"
+        f"待办 {counts['todo']} 项，用时 {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+async def _backfill(args) -> int:
+    """规划或继续一次补全并处理到结束"""
+    from src.database import AsyncDatabaseManager
+    from src.services import Backfiller, LLMService, close_http_client
+
+    db = AsyncDatabaseManager(DatabaseManager(args.db))
+    try:
+        service = LLMService(db)
+        if not service.is_available():
+            print("AI 服务未配置：请设置 DEEPSEEK_API_KEY 或 FRAGMIND_LLM_BASE_URL", file=sys.stderr)
+            return 1
+
+        def report(progress):
+            mark = "（失败 {}）".format(progress.failed) if progress.failed else ""
+            print(f"[{progress.finished}/{progress.total}] {progress.date} {progress.kind}{mark}", file=sys.stderr)
+
+        backfiller = Backfiller(db, lambda: service, concurrency=args.concurrency, on_progress=report)
+        if args.resume:
+            run = await db.get_backfill_run()
+            if run is None:
+                print("没有未完成的补全", file=sys.stderr)
+                return 0
+            run_id = run.id
+            print(f"继续补全 {run.start_date} ~ {run.end_date}", file=sys.stderr)
+        else:
+            run_id = await backfiller.plan(args.start, args.end, args.todos)
+        start = time.perf_counter()
+        run = await backfiller.run(run_id)
+        elapsed = time.perf_counter() - start
+        counts = run.counts
+        print(
+            f"完成 {counts.get('done', 0)} 项，跳过 {counts.get('skipped', 0)} 项，"
+            f"失败 {counts.get('failed', 0)} 项，未完成 {counts.get('pending', 0)} 项，用时 {elapsed:.2f}s",
+            file=sys.stderr,
+        )
+        if run.status == "running":
+            reason = f"（{backfiller.paused_reason}）" if backfiller.paused_reason else ""
+            print(f"补全已暂停{reason}，可用 fragmind backfill --resume 继续", file=sys.stderr)
+            return 2
+        return 0
+    finally:
+        await close_http_client()
+        db.close()
+
+
+def _cmd_backfill(args) -> int:
+    """批量补全区间内缺失或过期的总结（可选同时提取待办）"""
+    if not args.resume and not args.start:
+        print("请指定 --from 开始日期，或用 --resume 继续上次的补全", file=sys.stderr)
+        return 1
+    try:
+        return asyncio.run(_backfill(args))
+    except KeyboardInterrupt:
+        print("已中断，可用 fragmind backfill --resume 继续", file=sys.stderr)
+        return 130
+
+
+def _date_arg(value: str) -> str:
+    """校验 YYYY-MM-DD 格式的日期参数"""
+    try:
+        return date_type.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为 YYYY-MM-DD：{value}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="fragmind", description="FragMind 命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="导出片段、总结与待办")
+    p_export.add_argument("--format", choices=["jsonl", "markdown"], default="jsonl", help="导出格式")
+    p_export.add_argument("-o", "--output", help="输出文件，缺省时写到标准输出")
+    p_export.add_argument("--db", help="数据库路径，缺省使用应用数据库")
+    p_export.set_defaults(func=_cmd_export)
+
+    p_import = sub.add_parser("import", help="从 JSONL 文件导入")
+    p_import.add_argument("input", help="JSONL 文件路径")
+    p_import.add_argument("--db", help="数据库路径，缺省使用应用数据库")
+    p_import.add_argument("--batch-size", type=int, default=5000, help="每批写入的记录数")
+    p_import.set_defaults(func=_cmd_import)
+
+    p_backfill = sub.add_parser("backfill", help="批量补全缺失或过期的总结与待办")
+    p_backfill.add_argument("--from", dest="start", type=_date_arg, help="开始日期 YYYY-MM-DD")
+    p_backfill.add_argument("--to", dest="end", type=_date_arg, default=date_type.today().isoformat(),
+                            help="结束日期 YYYY-MM-DD，缺省为今天")
+    p_backfill.add_argument("--todos", action="store_true", help="同时重新提取区间内片段中的待办")
+    p_backfill.add_argument("--resume", action="store_true", help="继续上次未完成的补全")
+    p_backfill.add_argument("--concurrency", type=int, help="同时处理的天数")
+    p_backfill.add_argument("--db", help="数据库路径，缺省使用应用数据库")
+    p_backfill.set_defaults(func=_cmd_backfill)
+    return parser
+
+
+def main(argv=None) -> int:
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
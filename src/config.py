@@ -29,6 +29,46 @@ class Config:
         key = settings.value("api_key", "")
         return key if key else cls.DEEPSEEK_API_KEY
     
+    # 分段总结配置：片段总量超过阈值时，按时间切成若干窗口并发提炼后再合成日记
+    SUMMARY_CHUNK_THRESHOLD_TOKENS = int(os.getenv("FRAGMIND_SUMMARY_CHUNK_THRESHOLD", "8000"))
+    SUMMARY_CHUNK_TOKENS = int(os.getenv("FRAGMIND_SUMMARY_CHUNK_TOKENS", "3000"))
+    SUMMARY_MAX_PARALLEL_CHUNKS = int(os.getenv("FRAGMIND_SUMMARY_PARALLEL", "3"))
+    
+    # LLM 请求队列：同时进行的请求数上限；待办提取在该时间窗口内的文本合并为一次请求（0 为不合并）
+    LLM_MAX_CONCURRENCY = int(os.getenv("FRAGMIND_LLM_CONCURRENCY", "4"))
+    TODO_BATCH_WINDOW_MS = int(os.getenv("FRAGMIND_TODO_BATCH_WINDOW_MS", "300"))
+    
+    # LLM 接口：可指向任意 OpenAI 兼容服务（如本地测试服务器），留空时使用 DeepSeek 官方接口
+    LLM_BASE_URL = os.getenv("FRAGMIND_LLM_BASE_URL", "")
+    LLM_TIMEOUT_SECONDS = float(os.getenv("FRAGMIND_LLM_TIMEOUT", "30"))
+    LLM_MODEL = os.getenv("FRAGMIND_LLM_MODEL", "deepseek-chat")
+
+    # 按任务路由模型（summary：日记总结，todo：待办提取），未设置的项沿用上面的默认接口：
+    # FRAGMIND_<任务>_MODEL / _BASE_URL / _TIMEOUT / _API_KEY 指定首选模型；
+    # FRAGMIND_<任务>_FALLBACKS 为逗号分隔的备选模型，格式为 "模型名" 或 "模型名@接口地址"，首选失败时依次尝试
+    LLM_ROUTES = {
+        task: {
+            option: os.getenv(f"FRAGMIND_{task.upper()}_{option.upper()}", "")
+            for option in ("model", "base_url", "timeout", "api_key", "fallbacks")
+        }
+        for task in ("summary", "todo")
+    }
+
+    # 失败任务的重试：指数退避的初始与最大等待（秒）、最多尝试次数；
+    # 连续失败达到次数后熔断，冷却若干秒后再试探
+    LLM_RETRY_BASE_SECONDS = float(os.getenv("FRAGMIND_LLM_RETRY_BASE", "5"))
+    LLM_RETRY_MAX_SECONDS = float(os.getenv("FRAGMIND_LLM_RETRY_MAX", "1800"))
+    LLM_JOB_MAX_ATTEMPTS = int(os.getenv("FRAGMIND_LLM_JOB_MAX_ATTEMPTS", "20"))
+    LLM_BREAKER_FAILURES = int(os.getenv("FRAGMIND_LLM_BREAKER_FAILURES", "3"))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv("FRAGMIND_LLM_BREAKER_RESET", "30"))
+
+    # 批量补全历史总结时同时处理的天数（请求以后台优先级排队，界面操作优先）
+    BACKFILL_CONCURRENCY = int(os.getenv("FRAGMIND_BACKFILL_CONCURRENCY", "2"))
+
+    # 生成总结时附带的往日相关片段数（需在"设置"菜单中开启），输入框下方显示的相关片段数
+    RELATED_CONTEXT_COUNT = int(os.getenv("FRAGMIND_RELATED_CONTEXT", "3"))
+    RELATED_DISPLAY_COUNT = int(os.getenv("FRAGMIND_RELATED_DISPLAY", "5"))
+    
     # 数据库配置
     DATABASE_PATH =  "data/fragmind.db"
     DATABASE_FULL_PATH = BASE_DIR / DATABASE_PATH
@@ -2,5 +2,8 @@
 数据库管理模块
 """
 from .db_manager import DatabaseManager
+from .cache import CachedDatabaseManager
+from .async_db import AsyncDatabaseManager
+from .related_index import RelatedIndex
 
-__all__ = ['DatabaseManager']
+__all__ = ['DatabaseManager', 'CachedDatabaseManager', 'AsyncDatabaseManager', 'RelatedIndex']
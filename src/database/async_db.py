@@ -0,0 +1,124 @@
+"""
+异步数据访问层
+将 DatabaseManager 的同步调用转移到后台线程执行，供 qasync 事件循环中的 UI 代码 await
+"""
+import asyncio
+import functools
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .db_manager import DatabaseManager
+
+
+class AsyncDatabaseManager:
+    """
+    DatabaseManager 的异步外观
+    - 写操作在单一写线程中串行执行，避免 SQLite 写锁竞争
+    - 读操作在读线程池中并发执行（WAL 模式下读写互不阻塞）
+    每个线程持有自己的长连接，GUI 线程上不执行任何 SQL
+    """
+
+    # 只读方法走读线程池，其余公开方法一律走写线程
+    READ_METHODS = frozenset({
+        "get_frag_minds_by_date",
+        "count_frag_minds_by_date",
+        "get_recent_frag_minds",
+        "get_diary_summary",
+        "get_recent_summaries",
+        "get_active_todos",
+        "get_all_todos",
+        "get_frag_minds_page",
+        "get_frag_minds_page_by_day",
+        "get_summaries_page",
+        "get_todos_page",
+        "get_daily_stats",
+        "search",
+        "cache_stats",
+        "get_llm_cache_stats",
+        "get_summary_generation_report",
+        "get_llm_call_report",
+        "get_due_llm_jobs",
+        "get_next_llm_job_time",
+        "get_llm_job_stats",
+        "get_backfill_candidates",
+        "get_backfill_run",
+        "get_pending_backfill_items",
+        "get_summaries_between",
+        "get_rollup_summary",
+        "get_frag_minds_by_ids",
+        "get_fragment_texts_page",
+    })
+
+    # 流式遍历时每次从读线程取回的记录数
+    STREAM_BATCH_SIZE = 200
+
+    def __init__(self, db: Optional[DatabaseManager] = None, read_workers: int = 2):
+        """初始化执行线程"""
+        self.db = db or DatabaseManager()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fragmind-db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="fragmind-db-reader")
+        # 创建者线程（通常为 GUI 线程），之后在该线程上执行的 SQL 会被计数
+        self.db.guard_thread(threading.get_ident())
+
+    async def run_read(self, func: Callable, *args, **kwargs) -> Any:
+        """在读线程池中执行同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(func, *args, **kwargs))
+
+    async def run_write(self, func: Callable, *args, **kwargs) -> Any:
+        """在写线程中执行同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(func, *args, **kwargs))
+
+    async def run_in_transaction(self, func: Callable[..., Any], *args) -> Any:
+        """
+        在写线程中以单个事务执行 func(db, *args)
+        事务是线程绑定的，多步写入必须整体交给写线程完成
+        """
+        def work():
+            with self.db.transaction():
+                return func(self.db, *args)
+        return await self.run_write(work)
+
+    def submit_write(self, func: Callable, *args, **kwargs) -> Future:
+        """不经事件循环直接向写线程提交任务，用于窗口关闭等同步流程"""
+        return self._writer.submit(func, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        """将 DatabaseManager 的公开方法包装为协程函数"""
+        if name == "transaction":
+            raise AttributeError("事务绑定线程，请使用 run_in_transaction()")
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if name.startswith("iter_"):
+            return self._wrap_iterator(attr)
+
+        run = self.run_read if name in self.READ_METHODS else self.run_write
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await run(attr, *args, **kwargs)
+        return call
+
+    def _wrap_iterator(self, iter_method: Callable) -> Callable:
+        """将同步的 iter_* 生成器包装为异步生成器，分批在读线程中推进"""
+        @functools.wraps(iter_method)
+        async def agen(*args, **kwargs):
+            iterator = iter_method(*args, **kwargs)
+            while True:
+                batch = await self.run_read(lambda: list(itertools.islice(iterator, self.STREAM_BATCH_SIZE)))
+                for item in batch:
+                    yield item
+                if len(batch) < self.STREAM_BATCH_SIZE:
+                    return
+        return agen
+
+    def close(self):
+        """等待排队中的操作完成后关闭线程与数据库连接"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,222 @@
+"""
+按日期缓存的数据库管理器
+为日期切换时反复读取的片段列表与日记总结提供有界 LRU 读穿缓存
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.models import FragMind, DiarySummary
+from .db_manager import DatabaseManager
+
+
+# 缓存"该日期没有总结"这一结果，与未缓存区分
+_NO_SUMMARY = object()
+
+
+class CachedDatabaseManager(DatabaseManager):
+    """
+    带 LRU 缓存的数据库管理器
+    - 缓存键为 (类型, 日期)，只缓存 get_frag_minds_by_date 与 get_diary_summary
+    - add/update/delete_frag_mind 与 save_diary_summary 精确失效对应日期
+    - 每个日期维护一个版本号：读取前记录版本，写入后递增，
+      读取期间发生过写入时结果不入缓存，避免并发读把旧数据写回缓存
+    - 事务中的写入在事务结束时再次失效，事务中的读取不入缓存（可能读到未提交数据）
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_dates: int = 64):
+        """初始化缓存"""
+        self.max_entries = max_dates * 2  # 每个日期最多两个键
+        self._cache: "OrderedDict[tuple, object]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # 已缓存片段 id -> 日期，用于按 id 更新/删除时定位失效日期
+        self._entry_dates: Dict[int, str] = {}
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        super().__init__(db_path)
+
+    # ==================== 缓存内部操作 ====================
+
+    def _cache_get(self, key: tuple):
+        """命中时返回缓存值并移到队尾，未命中返回 None"""
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _cache_put(self, key: tuple, value, version: int):
+        """写入缓存，版本号已变化或处于事务中时放弃"""
+        if self._in_transaction():
+            return
+        with self._cache_lock:
+            if self._versions.get(key[1], 0) != version:
+                return
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            if key[0] == "entries":
+                for entry in value:
+                    self._entry_dates[entry.id] = key[1]
+            while len(self._cache) > self.max_entries:
+                old_key, old_value = self._cache.popitem(last=False)
+                self._forget_entries(old_key, old_value)
+                self.evictions += 1
+
+    def _forget_entries(self, key: tuple, value):
+        """移除片段 id -> 日期映射（调用方持有锁）"""
+        if key[0] == "entries":
+            for entry in value:
+                self._entry_dates.pop(entry.id, None)
+
+    def _version(self, date: str) -> int:
+        """读取日期当前版本号"""
+        with self._cache_lock:
+            return self._versions.get(date, 0)
+
+    def _invalidate(self, kind: str, date: Optional[str]):
+        """失效某日期的缓存；处于事务中时记录下来，事务结束后再失效一次"""
+        if date is None:
+            return
+        with self._cache_lock:
+            self._versions[date] = self._versions.get(date, 0) + 1
+            key = (kind, date)
+            value = self._cache.pop(key, None)
+            if value is not None:
+                self._forget_entries(key, value)
+                self.invalidations += 1
+        if self._in_transaction():
+            pending = getattr(self._local, "pending_invalidations", None)
+            if pending is None:
+                pending = self._local.pending_invalidations = set()
+            pending.add((kind, date))
+
+    def _date_of_entry(self, entry_id: int) -> Optional[str]:
+        """查找片段所属日期，优先使用缓存中的映射，否则按主键查询"""
+        with self._cache_lock:
+            date = self._entry_dates.get(entry_id)
+        if date is not None:
+            return date
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT date FROM diary_entries WHERE id = ?", (entry_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    @contextmanager
+    def transaction(self):
+        """在父类事务基础上，于最外层事务结束（提交或回滚）后补做失效"""
+        try:
+            with super().transaction():
+                yield self
+        finally:
+            if not self._in_transaction():
+                pending = getattr(self._local, "pending_invalidations", None)
+                self._local.pending_invalidations = None
+                for kind, date in pending or ():
+                    self._invalidate(kind, date)
+
+    def cache_stats(self) -> dict:
+        """缓存统计：命中、未命中、命中率、淘汰与失效次数"""
+        with self._cache_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._cache),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def clear_cache(self):
+        """清空缓存（统计数据保留）"""
+        with self._cache_lock:
+            for date in list(self._versions):
+                self._versions[date] += 1
+            self._cache.clear()
+            self._entry_dates.clear()
+
+    # ==================== 读穿 ====================
+
+    def get_frag_minds_by_date(self, date: str) -> List[FragMind]:
+        """获取指定日期的所有片段（带缓存）"""
+        key = ("entries", date)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached)
+        version = self._version(date)
+        entries = super().get_frag_minds_by_date(date)
+        self._cache_put(key, tuple(entries), version)
+        return entries
+
+    def count_frag_minds_by_date(self, date: str) -> int:
+        """统计指定日期的片段数量，已缓存时不查询数据库"""
+        cached = self._cache_get(("entries", date))
+        if cached is not None:
+            return len(cached)
+        return super().count_frag_minds_by_date(date)
+
+    def get_diary_summary(self, date: str) -> Optional[DiarySummary]:
+        """获取指定日期的日记总结（带缓存）"""
+        key = ("summary", date)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return None if cached is _NO_SUMMARY else cached
+        version = self._version(date)
+        summary = super().get_diary_summary(date)
+        self._cache_put(key, summary if summary is not None else _NO_SUMMARY, version)
+        return summary
+
+    # ==================== 写入失效 ====================
+
+    def add_frag_mind(self, entry: FragMind) -> int:
+        """添加日记片段并失效该日期的片段缓存"""
+        try:
+            return super().add_frag_mind(entry)
+        finally:
+            self._invalidate("entries", entry.date)
+
+    def add_frag_minds(self, entries: List[FragMind]) -> int:
+        """批量添加日记片段并失效涉及日期的片段缓存"""
+        try:
+            return super().add_frag_minds(entries)
+        finally:
+            for date in {e.date for e in entries}:
+                self._invalidate("entries", date)
+
+    def update_frag_mind_content(self, entry_id: int, new_content: str):
+        """更新日记片段内容并失效所属日期的片段缓存"""
+        date = self._date_of_entry(entry_id)
+        try:
+            super().update_frag_mind_content(entry_id, new_content)
+        finally:
+            self._invalidate("entries", date)
+
+    def delete_frag_mind(self, entry_id: int):
+        """删除日记片段并失效所属日期的片段缓存"""
+        date = self._date_of_entry(entry_id)
+        try:
+            super().delete_frag_mind(entry_id)
+        finally:
+            self._invalidate("entries", date)
+
+    def save_diary_summary(self, summary: DiarySummary) -> int:
+        """保存日记总结并失效该日期的总结缓存"""
+        try:
+            return super().save_diary_summary(summary)
+        finally:
+            self._invalidate("summary", summary.date)
+
+    def save_diary_summaries(self, summaries: List[DiarySummary]) -> int:
+        """批量保存日记总结并失效涉及日期的总结缓存"""
+        try:
+            return super().save_diary_summaries(summaries)
+        finally:
+            for date in {s.date for s in summaries}:
+                self._invalidate("summary", date)
@@ -2,79 +2,206 @@
 数据库管理模块
 使用 SQLite 存储日记片段、总结和待办事项
 """
+import json
+import re
 import sqlite3
-from datetime import datetime
-from typing import List, Optional
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 from pathlib import Path
 from contextlib import contextmanager
 
 from src.config import Config
-from src.models import FragMind, DiarySummary, TodoItem
+from src.models import FragMind, DiarySummary, TodoItem, SearchHit, DailyStats, LLMJob, BackfillRun, RollupSummary
+from .migrations import apply_migrations
+
+T = TypeVar("T")
+
+# 键集分页游标：(created_at, id)，表示"从这条记录之后（更早）开始"
+PageCursor = Tuple[datetime, int]
+
+
+# ==================== 行记录转换 ====================
+# 各查询共用的行 -> 模型转换，统一经 Pydantic 校验构造（时间戳文本由 Pydantic 解析）
+
+
+def _frag_mind_from_row(row) -> FragMind:
+    """(id, content, created_at, date) -> FragMind"""
+    return FragMind(id=row[0], content=row[1], created_at=row[2], date=row[3])
+
+
+def _source_fragments_from_json(text: Optional[str]) -> Optional[Dict[int, str]]:
+    """解析 source_fragments 列（JSON 对象的键为字符串形式的片段 id）"""
+    if text is None:
+        return None
+    return {int(k): v for k, v in json.loads(text).items()}
+
+
+def _diary_summary_from_row(row) -> DiarySummary:
+    """(id, date, summary, entry_count, created_at, updated_at[, source_fragments]) -> DiarySummary"""
+    return DiarySummary(
+        id=row[0],
+        date=row[1],
+        summary=row[2],
+        entry_count=row[3],
+        created_at=row[4],
+        updated_at=row[5],
+        source_fragments=_source_fragments_from_json(row[6]) if len(row) > 6 else None
+    )
+
+
+def _todo_item_from_row(row) -> TodoItem:
+    """(id, title, due_date, completed, created_at, completed_at) -> TodoItem"""
+    return TodoItem(
+        id=row[0],
+        title=row[1],
+        due_date=row[2],
+        completed=bool(row[3]),
+        created_at=row[4],
+        completed_at=row[5]
+    )
+
+
+def _llm_job_from_row(row) -> LLMJob:
+    """(id, kind, job_key, payload, status, attempts, next_attempt_at, last_error, created_at, updated_at) -> LLMJob"""
+    return LLMJob(
+        id=row[0],
+        kind=row[1],
+        job_key=row[2],
+        payload=json.loads(row[3]),
+        status=row[4],
+        attempts=row[5],
+        next_attempt_at=row[6],
+        last_error=row[7],
+        created_at=row[8],
+        updated_at=row[9]
+    )
 
 
 class DatabaseManager:
     """数据库管理器"""
     
+    # 连接级调优参数，每个连接建立时只执行一次
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode = WAL",        # 读写互不阻塞
+        "PRAGMA synchronous = NORMAL",      # WAL 模式下安全且少一次 fsync
+        "PRAGMA cache_size = -16000",       # 页缓存约 16MB
+        "PRAGMA mmap_size = 268435456",     # 256MB 内存映射读
+        "PRAGMA busy_timeout = 5000",       # 锁冲突时最多等待 5 秒
+        "PRAGMA temp_store = MEMORY",
+    )
+    
     def __init__(self, db_path: Optional[str] = None):
         """初始化数据库连接"""
         self.db_path = db_path or str(Config.DATABASE_FULL_PATH)
+        # 每个线程持有一个长连接（UI 线程与 run_in_executor 工作线程互不共享）
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 被监视的线程（如 GUI 线程）及在其上执行的查询次数，用于确认没有阻塞式 SQL
+        self._guarded_thread_id: Optional[int] = None
+        self.guarded_thread_queries = 0
         self._init_database()
     
-    def _get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接（首次调用时创建并调优）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 连接只在所属线程中使用，关闭时由 close() 统一处理，故关闭同线程检查
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in self.CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _in_transaction(self) -> bool:
+        """当前线程是否处于 transaction() 工作单元中"""
+        return getattr(self._local, "tx_depth", 0) > 0
 
     @contextmanager
     def _get_cursor(self, commit=False):
-        """获取数据库游标的上下文管理器"""
+        """获取数据库游标的上下文管理器（处于工作单元中时由其统一提交/回滚）"""
+        if threading.get_ident() == self._guarded_thread_id:
+            self.guarded_thread_queries += 1
         conn = self._get_connection()
         cursor = conn.cursor()
+        in_transaction = self._in_transaction()
         try:
             yield cursor
-            if commit:
+            if commit and not in_transaction:
                 conn.commit()
         except Exception as e:
-            conn.rollback()
+            if not in_transaction:
+                conn.rollback()
             raise e
         finally:
-            conn.close()
+            cursor.close()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        工作单元：块内的所有写操作合并为一次原子提交（一次 fsync）
+        任一步骤抛出异常时整体回滚；嵌套调用会并入最外层事务
+        
+        用法：
+            with db.transaction():
+                db.add_todo_items(todos)
+                db.update_todo_status(todo_id, True)
+        """
+        conn = self._get_connection()
+        depth = getattr(self._local, "tx_depth", 0)
+        if depth == 0:
+            # IMMEDIATE：开始即获取写锁，避免块内读后写时的锁升级冲突
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.tx_depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._local.tx_depth = depth
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            self._local.tx_depth = depth
+            if depth == 0:
+                conn.commit()
+    
+    def guard_thread(self, thread_id: Optional[int]):
+        """监视指定线程，此后在该线程上执行的查询会计入 guarded_thread_queries"""
+        self._guarded_thread_id = thread_id
+        self.guarded_thread_queries = 0
+    
+    def close(self):
+        """关闭所有线程持有的数据库连接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"关闭数据库连接时出错：{e}")
+        # 丢弃所有线程的连接引用，之后的调用会重新建立连接
+        self._local = threading.local()
     
     def _init_database(self):
-        """初始化数据库表结构"""
-        with self._get_cursor(commit=True) as cursor:
-            # 日记片段表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS diary_entries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    date TEXT NOT NULL
-                )
-            """)
-            
-            # 日记总结表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS diary_summaries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT UNIQUE NOT NULL,
-                    summary TEXT NOT NULL,
-                    entry_count INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 待办事项表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS todo_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    due_date TIMESTAMP,
-                    completed BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP
-                )
-            """)
+        """初始化数据库表结构，并将旧数据库升级到最新版本"""
+        apply_migrations(self._get_connection())
+    
+    @staticmethod
+    def _iter_pages(fetch_page: Callable[..., List[T]], next_cursor: Callable[[T], object],
+                    cursor, page_size: int) -> Iterator[T]:
+        """
+        按页拉取并逐条产出记录，内存占用只与 page_size 有关
+        每页都是一次独立的短查询，不会长时间占用连接或读事务
+        """
+        while True:
+            page = fetch_page(cursor, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            cursor = next_cursor(page[-1])
     
     # ==================== 日记片段操作 ====================
     
@@ -87,6 +214,17 @@ class DatabaseManager:
             """, (entry.content, entry.created_at, entry.date))
             return cursor.lastrowid
 
+    def add_frag_minds(self, entries: List[FragMind]) -> int:
+        """批量添加日记片段（单条 executemany 语句），返回插入条数"""
+        if not entries:
+            return 0
+        with self._get_cursor(commit=True) as cursor:
+            cursor.executemany("""
+                INSERT INTO diary_entries (content, created_at, date)
+                VALUES (?, ?, ?)
+            """, [(e.content, e.created_at, e.date) for e in entries])
+            return cursor.rowcount
+
     def update_frag_mind_content(self, entry_id: int, new_content: str):
         """更新日记片段内容"""
         with self._get_cursor(commit=True) as cursor:
@@ -106,15 +244,45 @@ class DatabaseManager:
                 ORDER BY created_at DESC
             """, (date,))
             
-            entries = []
-            for row in cursor.fetchall():
-                entries.append(FragMind(
-                    id=row[0],
-                    content=row[1],
-                    created_at=row[2],
-                    date=row[3]
-                ))
-            return entries
+            return [_frag_mind_from_row(row) for row in cursor.fetchall()]
+    
+    def get_frag_minds_by_ids(self, entry_ids: List[int]) -> List[FragMind]:
+        """按 id 获取片段，保持传入的顺序（不存在的 id 跳过）"""
+        if not entry_ids:
+            return []
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, content, created_at, date
+                FROM diary_entries
+                WHERE id IN ({",".join("?" * len(entry_ids))})
+            """, entry_ids)
+            entries = {row[0]: _frag_mind_from_row(row) for row in cursor.fetchall()}
+        return [entries[i] for i in entry_ids if i in entries]
+    
+    def get_fragment_texts_page(self, after_id: int = 0, page_size: int = 5000) -> List[Tuple[int, str, str]]:
+        """按 id 键集分页获取片段的 (id, content, date)，供相关性索引与数据库比对"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, content, date FROM diary_entries
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (after_id, page_size))
+            return cursor.fetchall()
+    
+    def iter_fragment_texts(self, page_size: int = 5000) -> Iterator[Tuple[int, str, str]]:
+        """按 id 正序流式遍历全部片段的 (id, content, date)"""
+        return self._iter_pages(
+            lambda cur, size: self.get_fragment_texts_page(cur, size),
+            lambda row: row[0],
+            0, page_size
+        )
+    
+    def count_frag_minds_by_date(self, date: str) -> int:
+        """统计指定日期的片段数量"""
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM diary_entries WHERE date = ?", (date,))
+            return cursor.fetchone()[0]
     
     def get_recent_frag_minds(self, limit: int = 10) -> List[FragMind]:
         """获取最近的日记片段"""
@@ -126,15 +294,58 @@ class DatabaseManager:
                 LIMIT ?
             """, (limit,))
             
-            entries = []
-            for row in cursor.fetchall():
-                entries.append(FragMind(
-                    id=row[0],
-                    content=row[1],
-                    created_at=row[2],
-                    date=row[3]
-                ))
-            return entries
+            return [_frag_mind_from_row(row) for row in cursor.fetchall()]
+    
+    def get_frag_minds_page(self, before: Optional[PageCursor] = None, page_size: int = 50) -> List[FragMind]:
+        """
+        键集分页获取日记片段（按时间倒序）
+        :param before: 上一页最后一条的 (created_at, id)，为 None 时从最新一条开始
+        """
+        condition = "WHERE (created_at, id) < (?, ?)" if before else ""
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, content, created_at, date
+                FROM diary_entries
+                {condition}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """, (*(before or ()), page_size))
+            
+            return [_frag_mind_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_frag_minds(self, before: Optional[PageCursor] = None, page_size: int = 500) -> Iterator[FragMind]:
+        """按时间倒序流式遍历全部日记片段"""
+        return self._iter_pages(
+            lambda cur, size: self.get_frag_minds_page(cur, size),
+            lambda e: (e.created_at, e.id),
+            before, page_size
+        )
+    
+    def get_frag_minds_page_by_day(self, after: Optional[Tuple[str, datetime, int]] = None,
+                                   page_size: int = 500) -> List[FragMind]:
+        """
+        键集分页获取日记片段（按日期、时间正序），用于按天导出
+        :param after: 上一页最后一条的 (date, created_at, id)，为 None 时从最早一天开始
+        """
+        condition = "WHERE (date, created_at, id) > (?, ?, ?)" if after else ""
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, content, created_at, date
+                FROM diary_entries
+                {condition}
+                ORDER BY date ASC, created_at ASC, id ASC
+                LIMIT ?
+            """, (*(after or ()), page_size))
+            
+            return [_frag_mind_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_frag_minds_by_day(self, page_size: int = 500) -> Iterator[FragMind]:
+        """按日期、时间正序流式遍历全部日记片段"""
+        return self._iter_pages(
+            lambda cur, size: self.get_frag_minds_page_by_day(cur, size),
+            lambda e: (e.date, e.created_at, e.id),
+            None, page_size
+        )
     
     def delete_frag_mind(self, entry_id: int):
         """删除日记片段"""
@@ -144,19 +355,33 @@ class DatabaseManager:
     # ==================== 日记总结操作 ====================
     
     def save_diary_summary(self, summary: DiarySummary) -> int:
-        """保存或更新日记总结"""
+        """
+        保存或更新日记总结
+        source_fragments 为 None 时（如手动保存修改）保留原有的来源片段记录
+        """
+        sources = None
+        if summary.source_fragments is not None:
+            sources = json.dumps(summary.source_fragments, separators=(",", ":"))
         with self._get_cursor(commit=True) as cursor:
+            # 使用 UPSERT 而非 INSERT OR REPLACE：保留原行 id 与 created_at，
+            # 并让全文索引的 UPDATE 触发器正常生效
             cursor.execute("""
-                INSERT OR REPLACE INTO diary_summaries (date, summary, entry_count, updated_at)
-                VALUES (?, ?, ?, ?)
-            """, (summary.date, summary.summary, summary.entry_count, datetime.now()))
-            return cursor.lastrowid
+                INSERT INTO diary_summaries (date, summary, entry_count, updated_at, source_fragments)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(date) DO UPDATE SET
+                    summary = excluded.summary,
+                    entry_count = excluded.entry_count,
+                    updated_at = excluded.updated_at,
+                    source_fragments = COALESCE(excluded.source_fragments, source_fragments)
+                RETURNING id
+            """, (summary.date, summary.summary, summary.entry_count, datetime.now(), sources))
+            return cursor.fetchone()[0]
     
     def get_diary_summary(self, date: str) -> Optional[DiarySummary]:
-        """获取指定日期的日记总结"""
+        """获取指定日期的日记总结（含来源片段记录）"""
         with self._get_cursor() as cursor:
             cursor.execute("""
-                SELECT id, date, summary, entry_count, created_at, updated_at
+                SELECT id, date, summary, entry_count, created_at, updated_at, source_fragments
                 FROM diary_summaries
                 WHERE date = ?
             """, (date,))
@@ -164,14 +389,7 @@ class DatabaseManager:
             row = cursor.fetchone()
             
             if row:
-                return DiarySummary(
-                    id=row[0],
-                    date=row[1],
-                    summary=row[2],
-                    entry_count=row[3],
-                    created_at=row[4],
-                    updated_at=row[5]
-                )
+                return _diary_summary_from_row(row)
             return None
     
     def get_recent_summaries(self, limit: int = 7) -> List[DiarySummary]:
@@ -184,17 +402,62 @@ class DatabaseManager:
                 LIMIT ?
             """, (limit,))
             
-            summaries = []
-            for row in cursor.fetchall():
-                summaries.append(DiarySummary(
-                    id=row[0],
-                    date=row[1],
-                    summary=row[2],
-                    entry_count=row[3],
-                    created_at=row[4],
-                    updated_at=row[5]
-                ))
-            return summaries
+            return [_diary_summary_from_row(row) for row in cursor.fetchall()]
+    
+    def save_diary_summaries(self, summaries: List[DiarySummary]) -> int:
+        """批量保存日记总结（按日期覆盖，保留记录中的创建/更新时间），返回写入条数"""
+        if not summaries:
+            return 0
+        with self._get_cursor(commit=True) as cursor:
+            cursor.executemany("""
+                INSERT INTO diary_summaries (date, summary, entry_count, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(date) DO UPDATE SET
+                    summary = excluded.summary,
+                    entry_count = excluded.entry_count,
+                    updated_at = excluded.updated_at
+            """, [(s.date, s.summary, s.entry_count, s.created_at, s.updated_at) for s in summaries])
+            return cursor.rowcount
+    
+    def get_summaries_page(self, before_date: Optional[str] = None, page_size: int = 50,
+                           ascending: bool = False) -> List[DiarySummary]:
+        """
+        键集分页获取日记总结（默认按日期倒序）
+        :param before_date: 上一页最后一条的日期，为 None 时从头开始；正序时表示"在此日期之后"
+        :param ascending: 是否按日期正序
+        """
+        condition = ("WHERE date > ?" if ascending else "WHERE date < ?") if before_date else ""
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, date, summary, entry_count, created_at, updated_at
+                FROM diary_summaries
+                {condition}
+                ORDER BY date {"ASC" if ascending else "DESC"}
+                LIMIT ?
+            """, (*((before_date,) if before_date else ()), page_size))
+            
+            return [_diary_summary_from_row(row) for row in cursor.fetchall()]
+    
+    def get_summaries_between(self, start: str, end: str) -> List[DiarySummary]:
+        """日期区间 [start, end] 内的日记总结，按日期正序"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, date, summary, entry_count, created_at, updated_at
+                FROM diary_summaries
+                WHERE date BETWEEN ? AND ?
+                ORDER BY date
+            """, (start, end))
+            
+            return [_diary_summary_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_summaries(self, before_date: Optional[str] = None, page_size: int = 200,
+                       ascending: bool = False) -> Iterator[DiarySummary]:
+        """流式遍历全部日记总结（默认按日期倒序）"""
+        return self._iter_pages(
+            lambda cur, size: self.get_summaries_page(cur, size, ascending),
+            lambda s: s.date,
+            before_date, page_size
+        )
     
     # ==================== 待办事项操作 ====================
     
@@ -207,6 +470,17 @@ class DatabaseManager:
             """, (todo.title, todo.due_date, todo.completed, todo.created_at))
             return cursor.lastrowid
     
+    def add_todo_items(self, todos: List[TodoItem]) -> int:
+        """批量添加待办事项（单条 executemany 语句），返回插入条数"""
+        if not todos:
+            return 0
+        with self._get_cursor(commit=True) as cursor:
+            cursor.executemany("""
+                INSERT INTO todo_items (title, due_date, completed, created_at, completed_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(t.title, t.due_date, t.completed, t.created_at, t.completed_at) for t in todos])
+            return cursor.rowcount
+    
     def get_active_todos(self) -> List[TodoItem]:
         """获取未完成的待办事项"""
         with self._get_cursor() as cursor:
@@ -217,17 +491,7 @@ class DatabaseManager:
                 ORDER BY due_date ASC
             """)
             
-            todos = []
-            for row in cursor.fetchall():
-                todos.append(TodoItem(
-                    id=row[0],
-                    title=row[1],
-                    due_date=row[2],
-                    completed=bool(row[3]),
-                    created_at=row[4],
-                    completed_at=row[5]
-                ))
-            return todos
+            return [_todo_item_from_row(row) for row in cursor.fetchall()]
     
     def get_all_todos(self) -> List[TodoItem]:
         """获取所有待办事项"""
@@ -235,20 +499,42 @@ class DatabaseManager:
             cursor.execute("""
                 SELECT id, title, due_date, completed, created_at, completed_at
                 FROM todo_items
-                ORDER BY completed ASC, created_at DESC
+                ORDER BY completed ASC, created_at DESC, id DESC
             """)
             
-            todos = []
-            for row in cursor.fetchall():
-                todos.append(TodoItem(
-                    id=row[0],
-                    title=row[1],
-                    due_date=row[2],
-                    completed=bool(row[3]),
-                    created_at=row[4],
-                    completed_at=row[5]
-                ))
-            return todos
+            return [_todo_item_from_row(row) for row in cursor.fetchall()]
+    
+    def get_todos_page(self, completed: bool, before: Optional[PageCursor] = None,
+                       page_size: int = 50) -> List[TodoItem]:
+        """
+        键集分页获取待办事项（按创建时间倒序）
+        :param completed: 获取已完成还是未完成的事项
+        :param before: 上一页最后一条的 (created_at, id)，为 None 时从最新一条开始
+        """
+        condition = "AND (created_at, id) < (?, ?)" if before else ""
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, title, due_date, completed, created_at, completed_at
+                FROM todo_items
+                WHERE completed = ? {condition}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """, (completed, *(before or ()), page_size))
+            
+            return [_todo_item_from_row(row) for row in cursor.fetchall()]
+    
+    def iter_todos(self, completed: Optional[bool] = None, page_size: int = 500) -> Iterator[TodoItem]:
+        """
+        流式遍历待办事项，顺序与 get_all_todos 一致（未完成在前，各自按创建时间倒序）
+        :param completed: 仅遍历已完成/未完成的事项，为 None 时遍历全部
+        """
+        groups = [False, True] if completed is None else [completed]
+        for group in groups:
+            yield from self._iter_pages(
+                lambda cur, size, group=group: self.get_todos_page(group, cur, size),
+                lambda t: (t.created_at, t.id),
+                None, page_size
+            )
     
     def update_todo_status(self, todo_id: int, completed: bool):
         """更新待办事项状态"""
@@ -260,16 +546,552 @@ class DatabaseManager:
                 WHERE id = ?
             """, (completed, completed_at, todo_id))
     
+    def update_todos_status(self, todo_ids: List[int], completed: bool):
+        """批量更新待办事项状态"""
+        if not todo_ids:
+            return
+        completed_at = datetime.now() if completed else None
+        with self._get_cursor(commit=True) as cursor:
+            cursor.executemany("""
+                UPDATE todo_items
+                SET completed = ?, completed_at = ?
+                WHERE id = ?
+            """, [(completed, completed_at, todo_id) for todo_id in todo_ids])
+    
     def update_todo_info(self, todo_id: int, title: str = None, due_date: datetime = None):
-        """更新待办事项信息"""
+        """更新待办事项信息（合并为一条 UPDATE）"""
+        assignments = []
+        params = []
+        if title is not None:
+            assignments.append("title = ?")
+            params.append(title)
+        if due_date is not None:
+            assignments.append("due_date = ?")
+            params.append(due_date)
+        if not assignments:
+            return
+        
         with self._get_cursor(commit=True) as cursor:
-            if title is not None:
-                cursor.execute("UPDATE todo_items SET title = ? WHERE id = ?", (title, todo_id))
-            
-            if due_date is not None:
-                cursor.execute("UPDATE todo_items SET due_date = ? WHERE id = ?", (due_date, todo_id))
+            cursor.execute(
+                f"UPDATE todo_items SET {', '.join(assignments)} WHERE id = ?",
+                (*params, todo_id)
+            )
 
     def delete_todo_item(self, todo_id: int):
         """删除待办事项"""
         with self._get_cursor(commit=True) as cursor:
             cursor.execute("DELETE FROM todo_items WHERE id = ?", (todo_id,))
+
+    # ==================== 按日统计 ====================
+    
+    def get_daily_stats(self, start: str, end: str) -> List[DailyStats]:
+        """
+        获取日期区间 [start, end] 内有记录的每日统计（主键范围查询）
+        没有任何记录的日期不会返回，调用方按 0 处理
+        """
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT date, entry_count, has_summary, open_todos
+                FROM daily_stats
+                WHERE date BETWEEN ? AND ?
+                  AND (entry_count > 0 OR has_summary OR open_todos > 0)
+                ORDER BY date
+            """, (start, end))
+            
+            return [DailyStats(
+                date=row[0],
+                entry_count=row[1],
+                has_summary=bool(row[2]),
+                open_todos=row[3]
+            ) for row in cursor.fetchall()]
+    
+    # ==================== LLM 响应缓存 ====================
+    
+    # 缓存上限：条目数与最久未使用天数
+    LLM_CACHE_MAX_ENTRIES = 2000
+    LLM_CACHE_MAX_AGE_DAYS = 90
+    
+    def get_llm_cache(self, key: str, kind: str) -> Optional[str]:
+        """
+        查询 LLM 缓存，命中时刷新最近使用时间
+        同时按 kind 累计命中/未命中次数
+        """
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE llm_cache SET hit_count = hit_count + 1, last_used_at = ?
+                WHERE key = ?
+                RETURNING value, tokens
+            """, (datetime.now(), key))
+            row = cursor.fetchone()
+            hit = row is not None
+            cursor.execute("""
+                INSERT INTO llm_cache_stats (kind, hits, misses, tokens_saved) VALUES (?, ?, ?, ?)
+                ON CONFLICT(kind) DO UPDATE SET
+                    hits = hits + excluded.hits,
+                    misses = misses + excluded.misses,
+                    tokens_saved = tokens_saved + excluded.tokens_saved
+            """, (kind, int(hit), int(not hit), row[1] if hit else 0))
+            return row[0] if hit else None
+    
+    def put_llm_cache(self, key: str, kind: str, model: str, value: str, tokens: int = 0):
+        """写入 LLM 缓存，并按条目数与使用时间淘汰旧记录"""
+        now = datetime.now()
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO llm_cache (key, kind, model, value, tokens, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    tokens = excluded.tokens,
+                    last_used_at = excluded.last_used_at
+            """, (key, kind, model, value, tokens, now, now))
+        self.evict_llm_cache()
+    
+    def evict_llm_cache(self, max_entries: Optional[int] = None, max_age_days: Optional[int] = None) -> int:
+        """淘汰超过保留天数或超出条目上限（按最近使用排序）的缓存，返回删除条数"""
+        max_entries = self.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        max_age_days = self.LLM_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute(
+                "DELETE FROM llm_cache WHERE last_used_at < ?",
+                (datetime.now() - timedelta(days=max_age_days),)
+            )
+            deleted = cursor.rowcount
+            cursor.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_entries,))
+            return deleted + cursor.rowcount
+    
+    def clear_llm_cache(self):
+        """清空 LLM 缓存（统计数据保留）"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("DELETE FROM llm_cache")
+    
+    def get_llm_cache_stats(self) -> dict:
+        """LLM 缓存统计：条目数、占用字节，以及各任务类型的命中率与节省的 token"""
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(length(CAST(value AS BLOB))), 0) FROM llm_cache")
+            entries, size = cursor.fetchone()
+            cursor.execute("SELECT kind, hits, misses, tokens_saved FROM llm_cache_stats ORDER BY kind")
+            kinds = {
+                kind: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                    "tokens_saved": tokens_saved,
+                }
+                for kind, hits, misses, tokens_saved in cursor.fetchall()
+            }
+            return {"entries": entries, "bytes": size, "kinds": kinds}
+    
+    # ==================== 总结生成记录 ====================
+    
+    def log_summary_generation(self, date: str, mode: str, prompt_tokens: int, full_prompt_tokens: int):
+        """记录一次总结生成的方式（full / incremental）与估算的 prompt 大小"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO summary_generation_log (date, mode, prompt_tokens, full_prompt_tokens, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (date, mode, prompt_tokens, full_prompt_tokens, datetime.now()))
+    
+    def get_summary_generation_report(self) -> dict:
+        """按生成方式汇总：次数、平均 prompt 大小，以及相对全量重写平均节省的 prompt tokens"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT mode, COUNT(*), AVG(prompt_tokens), AVG(full_prompt_tokens - prompt_tokens)
+                FROM summary_generation_log
+                GROUP BY mode
+                ORDER BY mode
+            """)
+            return {
+                mode: {"count": count, "avg_prompt_tokens": avg_prompt, "avg_tokens_saved": avg_saved}
+                for mode, count, avg_prompt, avg_saved in cursor.fetchall()
+            }
+    
+    # ==================== LLM 调用记录 ====================
+    
+    def log_llm_call(self, agent: str, model: str, latency_ms: float, input_tokens: int,
+                     cache_hit_tokens: int, output_tokens: int, status: str = "ok", error: str = ""):
+        """记录一次模型调用的耗时与 token 用量，失败的调用 status 为 error 并附带原因"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO llm_call_log
+                    (agent, model, latency_ms, input_tokens, cache_hit_tokens, output_tokens, status, error, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (agent, model, latency_ms, input_tokens, cache_hit_tokens, output_tokens, status, error,
+                  datetime.now()))
+    
+    def get_llm_call_report(self) -> dict:
+        """
+        按 Agent 与模型汇总：调用与失败次数、token 用量、输入 token 中命中前缀缓存的比例，
+        以及成功调用的平均耗时（区分有无缓存命中）与 P95 耗时
+        :return: {agent: {model: 统计}}
+        """
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT agent, model, COUNT(*), SUM(status = 'error'),
+                       SUM(input_tokens), SUM(cache_hit_tokens), SUM(output_tokens),
+                       AVG(CASE WHEN status = 'ok' THEN latency_ms END),
+                       AVG(CASE WHEN status = 'ok' AND cache_hit_tokens > 0 THEN latency_ms END),
+                       AVG(CASE WHEN status = 'ok' AND cache_hit_tokens = 0 THEN latency_ms END)
+                FROM llm_call_log
+                GROUP BY agent, model
+                ORDER BY agent, model
+            """)
+            report: dict = {}
+            for (agent, model, calls, failures, input_tokens, hit_tokens, output_tokens,
+                 avg_latency, hit_latency, miss_latency) in cursor.fetchall():
+                report.setdefault(agent, {})[model] = {
+                    "calls": calls,
+                    "failures": failures,
+                    "input_tokens": input_tokens,
+                    "cache_hit_tokens": hit_tokens,
+                    "output_tokens": output_tokens,
+                    "hit_rate": hit_tokens / input_tokens if input_tokens else 0.0,
+                    "avg_latency_ms": avg_latency,
+                    "avg_hit_latency_ms": hit_latency,
+                    "avg_miss_latency_ms": miss_latency,
+                    "p95_latency_ms": self._latency_percentile(cursor, agent, model, calls - failures, 0.95),
+                }
+            return report
+    
+    @staticmethod
+    def _latency_percentile(cursor, agent: str, model: str, count: int, q: float) -> Optional[float]:
+        """count 次成功调用耗时的分位数"""
+        if not count:
+            return None
+        cursor.execute("""
+            SELECT latency_ms FROM llm_call_log
+            WHERE agent = ? AND model = ? AND status = 'ok'
+            ORDER BY latency_ms
+            LIMIT 1 OFFSET ?
+        """, (agent, model, min(count - 1, int(count * q))))
+        return cursor.fetchone()[0]
+    
+    # ==================== LLM 离线任务 ====================
+    
+    _LLM_JOB_COLUMNS = """
+        id, kind, job_key, payload, status, attempts, next_attempt_at, last_error, created_at, updated_at
+    """
+    
+    def enqueue_llm_job(self, kind: str, job_key: str, payload: dict,
+                        run_at: Optional[datetime] = None) -> int:
+        """
+        记录一个等待重试的 LLM 任务，返回任务 id
+        同一 (kind, job_key) 已有等待中的任务时更新其内容，不重复入队
+        """
+        now = datetime.now()
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO llm_jobs (kind, job_key, payload, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(kind, job_key) WHERE status = 'pending' DO UPDATE SET
+                    payload = excluded.payload,
+                    next_attempt_at = MIN(next_attempt_at, excluded.next_attempt_at),
+                    updated_at = excluded.updated_at
+                RETURNING id
+            """, (kind, job_key, json.dumps(payload, ensure_ascii=False), run_at or now, now, now))
+            return cursor.fetchone()[0]
+    
+    def get_due_llm_jobs(self, limit: int = 20) -> List[LLMJob]:
+        """到期等待重试的任务，按计划时间排序"""
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {self._LLM_JOB_COLUMNS}
+                FROM llm_jobs
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (datetime.now(), limit))
+            return [_llm_job_from_row(row) for row in cursor.fetchall()]
+    
+    def get_next_llm_job_time(self) -> Optional[datetime]:
+        """最近一个等待中任务的计划时间，没有任务时返回 None"""
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT MIN(next_attempt_at) FROM llm_jobs WHERE status = 'pending'")
+            value = cursor.fetchone()[0]
+            return datetime.fromisoformat(value) if value is not None else None
+    
+    def complete_llm_job(self, job_id: int):
+        """任务完成，从队列中删除"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("DELETE FROM llm_jobs WHERE id = ?", (job_id,))
+    
+    def retry_llm_job(self, job_id: int, next_attempt_at: datetime, error: str, count_attempt: bool = True):
+        """记录一次失败并安排下次重试；count_attempt=False 时只推迟、不计入尝试次数"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE llm_jobs
+                SET attempts = attempts + ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, (int(count_attempt), next_attempt_at, error, datetime.now(), job_id))
+    
+    def fail_llm_job(self, job_id: int, error: str):
+        """不可重试或超过重试次数，标记为失败（保留记录供查看）"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE llm_jobs
+                SET status = 'failed', attempts = attempts + 1, last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, (error, datetime.now(), job_id))
+    
+    def get_llm_job_stats(self) -> dict:
+        """离线任务统计：各状态的任务数与最近一次计划重试时间"""
+        with self._get_cursor() as cursor:
+            cursor.execute("SELECT status, COUNT(*) FROM llm_jobs GROUP BY status")
+            counts = dict(cursor.fetchall())
+        return {
+            "pending": counts.get("pending", 0),
+            "failed": counts.get("failed", 0),
+            "next_attempt_at": self.get_next_llm_job_time(),
+        }
+    
+    # ==================== 批量补全 ====================
+    
+    def get_backfill_candidates(self, start: str, end: str) -> List[Tuple[str, Optional[DiarySummary]]]:
+        """日期区间 [start, end] 内有片段的日期及其已有总结（没有总结时为 None），按日期正序"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT d.date, s.id, s.date, s.summary, s.entry_count, s.created_at, s.updated_at,
+                       s.source_fragments
+                FROM daily_stats d
+                LEFT JOIN diary_summaries s ON s.date = d.date
+                WHERE d.date BETWEEN ? AND ? AND d.entry_count > 0
+                ORDER BY d.date
+            """, (start, end))
+            return [
+                (row[0], _diary_summary_from_row(row[1:]) if row[1] is not None else None)
+                for row in cursor.fetchall()
+            ]
+    
+    def create_backfill_run(self, start: str, end: str, include_todos: bool,
+                            items: List[Tuple[str, str]]) -> int:
+        """记录一次批量补全及其全部条目 [(kind, date)]，返回补全 id"""
+        now = datetime.now()
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO backfill_runs (start_date, end_date, include_todos, status, created_at, updated_at)
+                VALUES (?, ?, ?, 'running', ?, ?)
+            """, (start, end, int(include_todos), now, now))
+            run_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO backfill_items (run_id, kind, date, status, updated_at)
+                VALUES (?, ?, ?, 'pending', ?)
+            """, [(run_id, kind, date, now) for kind, date in items])
+        return run_id
+    
+    def get_backfill_run(self, run_id: Optional[int] = None) -> Optional[BackfillRun]:
+        """读取一次批量补全及各状态的条目数；run_id 为 None 时返回最近一次未完成的补全"""
+        with self._get_cursor() as cursor:
+            if run_id is None:
+                cursor.execute("""
+                    SELECT id, start_date, end_date, include_todos, status, created_at, updated_at
+                    FROM backfill_runs WHERE status = 'running' ORDER BY id DESC LIMIT 1
+                """)
+            else:
+                cursor.execute("""
+                    SELECT id, start_date, end_date, include_todos, status, created_at, updated_at
+                    FROM backfill_runs WHERE id = ?
+                """, (run_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute("SELECT status, COUNT(*) FROM backfill_items WHERE run_id = ? GROUP BY status", (row[0],))
+            return BackfillRun(
+                id=row[0],
+                start_date=row[1],
+                end_date=row[2],
+                include_todos=bool(row[3]),
+                status=row[4],
+                counts=dict(cursor.fetchall()),
+                created_at=row[5],
+                updated_at=row[6]
+            )
+    
+    def get_pending_backfill_items(self, run_id: int) -> List[Tuple[str, str]]:
+        """尚未处理的条目 [(kind, date)]，按日期正序、同一天先总结后待办"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT kind, date FROM backfill_items
+                WHERE run_id = ? AND status = 'pending'
+                ORDER BY date, kind
+            """, (run_id,))
+            return cursor.fetchall()
+    
+    def update_backfill_item(self, run_id: int, kind: str, date: str, status: str, error: str = ""):
+        """记录一个条目的处理结果（即进度检查点）"""
+        now = datetime.now()
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE backfill_items SET status = ?, error = ?, updated_at = ?
+                WHERE run_id = ? AND kind = ? AND date = ?
+            """, (status, error, now, run_id, kind, date))
+            cursor.execute("UPDATE backfill_runs SET updated_at = ? WHERE id = ?", (now, run_id))
+    
+    def finish_backfill_run(self, run_id: int, status: str = "done"):
+        """标记补全结束（done：全部处理完，cancelled：放弃剩余条目）"""
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute(
+                "UPDATE backfill_runs SET status = ?, updated_at = ? WHERE id = ?",
+                (status, datetime.now(), run_id)
+            )
+    
+    # ==================== 周 / 月 / 年回顾 ====================
+    
+    def get_rollup_summary(self, period: str, period_key: str) -> Optional[RollupSummary]:
+        """读取保存的回顾（含生成时的来源哈希）"""
+        with self._get_cursor() as cursor:
+            cursor.execute("""
+                SELECT period, period_key, start_date, end_date, summary, source_summaries, created_at, updated_at
+                FROM rollup_summaries
+                WHERE period = ? AND period_key = ?
+            """, (period, period_key))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return RollupSummary(
+                period=row[0],
+                period_key=row[1],
+                start_date=row[2],
+                end_date=row[3],
+                summary=row[4],
+                source_summaries=json.loads(row[5]),
+                created_at=row[6],
+                updated_at=row[7]
+            )
+    
+    def save_rollup_summary(self, rollup: RollupSummary):
+        """保存或覆盖一个时间段的回顾（保留首次生成时间）"""
+        now = datetime.now()
+        with self._get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO rollup_summaries
+                    (period, period_key, start_date, end_date, summary, source_summaries, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(period, period_key) DO UPDATE SET
+                    start_date = excluded.start_date,
+                    end_date = excluded.end_date,
+                    summary = excluded.summary,
+                    source_summaries = excluded.source_summaries,
+                    updated_at = excluded.updated_at
+            """, (
+                rollup.period, rollup.period_key, rollup.start_date, rollup.end_date, rollup.summary,
+                json.dumps(rollup.source_summaries, separators=(",", ":")), now, now
+            ))
+    
+    # ==================== 全文检索 ====================
+    
+    # trigram 分词要求每个检索词至少 3 个字符，更短的词退回 LIKE 扫描
+    _FTS_MIN_TERM_LENGTH = 3
+    
+    def search(self, query: str, limit: int = 20, offset: int = 0,
+               highlight: tuple = ("【", "】")) -> List[SearchHit]:
+        """
+        在碎片片段与日记总结中全文检索
+        多个检索词以空白分隔，需同时命中；结果按相关度排序并附带高亮摘录
+        """
+        terms = [t for t in query.split() if t]
+        if not terms:
+            return []
+        
+        long_terms = [t for t in terms if len(t) >= self._FTS_MIN_TERM_LENGTH]
+        short_terms = [t for t in terms if len(t) < self._FTS_MIN_TERM_LENGTH]
+        if long_terms:
+            return self._search_fts(long_terms, short_terms, limit, offset, highlight)
+        return self._search_like(short_terms, limit, offset, highlight)
+    
+    @staticmethod
+    def _like_patterns(terms: List[str]) -> List[str]:
+        """将检索词转为转义后的 LIKE 模式"""
+        return ["%" + re.sub(r"([\\%_])", r"\\\1", t) + "%" for t in terms]
+    
+    def _search_fts(self, terms: List[str], extra_terms: List[str], limit: int, offset: int,
+                    highlight: tuple) -> List[SearchHit]:
+        """基于 FTS5 索引的检索，extra_terms 为需在命中结果上额外过滤的短词"""
+        # 每个词作为短语加引号，避免用户输入被解析为 FTS 查询语法
+        match_expr = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        patterns = self._like_patterns(extra_terms)
+        entry_filter = "".join(" AND e.content LIKE ? ESCAPE '\\'" for _ in patterns)
+        summary_filter = "".join(" AND s.summary LIKE ? ESCAPE '\\'" for _ in patterns)
+        open_mark, close_mark = highlight
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT 'entry', e.id, e.date,
+                       snippet(diary_entries_fts, 0, ?, ?, '…', 24),
+                       bm25(diary_entries_fts) AS rank, e.created_at
+                FROM diary_entries_fts
+                JOIN diary_entries e ON e.id = diary_entries_fts.rowid
+                WHERE diary_entries_fts MATCH ?{entry_filter}
+                UNION ALL
+                SELECT 'summary', s.id, s.date,
+                       snippet(diary_summaries_fts, 0, ?, ?, '…', 24),
+                       bm25(diary_summaries_fts) AS rank, s.updated_at
+                FROM diary_summaries_fts
+                JOIN diary_summaries s ON s.id = diary_summaries_fts.rowid
+                WHERE diary_summaries_fts MATCH ?{summary_filter}
+                ORDER BY rank ASC
+                LIMIT ? OFFSET ?
+            """, (open_mark, close_mark, match_expr, *patterns,
+                  open_mark, close_mark, match_expr, *patterns,
+                  limit, offset))
+            
+            return [SearchHit(
+                source=row[0],
+                id=row[1],
+                date=row[2],
+                snippet=row[3],
+                rank=row[4],
+                created_at=row[5]
+            ) for row in cursor.fetchall()]
+    
+    def _search_like(self, terms: List[str], limit: int, offset: int, highlight: tuple) -> List[SearchHit]:
+        """
+        全部为短检索词时的 LIKE 检索，按时间倒序（一两个字的词没有有意义的相关度）
+        片段沿 created_at 索引由近及远扫描，命中 offset + limit 条即停止，常见词只需读最近的一小段；
+        总结条数少（每天一条），按更新时间取前 offset + limit 条
+        """
+        patterns = self._like_patterns(terms)
+        window = offset + limit
+        entry_cond = " AND ".join(["content LIKE ? ESCAPE '\\'"] * len(terms))
+        summary_cond = " AND ".join(["summary LIKE ? ESCAPE '\\'"] * len(terms))
+        with self._get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT * FROM (
+                    SELECT 'entry', id, date, content, created_at
+                    FROM diary_entries
+                    WHERE {entry_cond}
+                    ORDER BY created_at DESC
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT 'summary', id, date, summary, updated_at
+                    FROM diary_summaries
+                    WHERE {summary_cond}
+                    ORDER BY updated_at DESC
+                    LIMIT ?
+                )
+                ORDER BY 5 DESC
+                LIMIT ? OFFSET ?
+            """, (*patterns, window, *patterns, window, limit, offset))
+            
+            return [SearchHit(
+                source=row[0],
+                id=row[1],
+                date=row[2],
+                snippet=self._make_snippet(row[3], terms, highlight),
+                created_at=row[4]
+            ) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _make_snippet(text: str, terms: List[str], highlight: tuple, width: int = 24) -> str:
+        """截取首个命中词附近的文本并加上高亮标记"""
+        pos = min((p for p in (text.find(t) for t in terms) if p >= 0), default=0)
+        start = max(0, pos - width // 2)
+        end = min(len(text), start + width * 2)
+        snippet = text[start:end]
+        for term in terms:
+            snippet = snippet.replace(term, f"{highlight[0]}{term}{highlight[1]}")
+        return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
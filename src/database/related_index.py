@@ -0,0 +1,351 @@
+"""
+片段相关性索引
+不依赖远程向量接口：为每条片段计算字符 n-gram 的 TF-IDF 向量，按特征哈希（带符号）折叠到固定维度，
+以 NumPy 数组保存在磁盘上并通过内存映射打开：
+- vectors.f32 / rerank.f32：每条片段一行，两组相互独立的哈希各得一个 L2 归一化的向量
+- ids.i64 / days.i32 / checks.u32：片段 id（空行为 -1）、日期（yyyymmdd）与内容校验值
+- df.i32：各 n-gram 特征的文档频率；meta.json：已用行数、容量与维度
+查询时先用 vectors.f32 一次矩阵-向量乘法得到与全部片段的近似余弦相似度，argpartition 取出候选，
+再用 rerank.f32 的第二组哈希对候选重新打分取平均，抵消维度较低带来的哈希碰撞噪声
+片段增删改时逐条更新；启动时用 sync() 按校验值与数据库比对，补上索引之外的写入（如命令行导入）
+"""
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# 向量维度：200k 条片段的相似度计算约 10ms（单核）
+INDEX_DIM = 128
+# 第一轮取出的候选数，用第二组哈希重新打分
+RERANK_CANDIDATES = 256
+# 文档频率按 2^20 个特征桶统计
+FEATURE_BITS = 20
+# 低于该相似度的结果不返回
+MIN_SCORE = 0.1
+# 索引格式版本，变化时重建
+INDEX_VERSION = 1
+# sync 每批处理的片段数，批与批之间释放锁，不阻塞界面上的增量更新与查询
+SYNC_BATCH_SIZE = 2000
+
+_TOKEN_RE = re.compile(r"\w+")
+_FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+
+def char_ngrams(text: str) -> List[str]:
+    """切分为字符二元组与三元组（中文不分词；单字的词保留本身），忽略空白与标点"""
+    grams = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if len(token) == 1:
+            grams.append(token)
+            continue
+        grams.extend(token[i:i + 2] for i in range(len(token) - 1))
+        grams.extend(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+
+def content_check(text: str) -> int:
+    """规范化内容的校验值，用于发现索引外修改过的片段"""
+    return zlib.crc32(" ".join(text.split()).encode("utf-8"))
+
+
+def _features(text: str) -> Counter:
+    """n-gram 哈希 -> 出现次数"""
+    return Counter(zlib.crc32(gram.encode("utf-8")) for gram in char_ngrams(text))
+
+
+def _day(date: str) -> int:
+    """YYYY-MM-DD -> yyyymmdd"""
+    return int(date.replace("-", ""))
+
+
+def _batches(items: Iterable, size: int = SYNC_BATCH_SIZE) -> Iterator[list]:
+    """把迭代器按 size 条分批"""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class RelatedIndex:
+    """基于内存映射 NumPy 数组的片段相关性索引（线程安全）"""
+
+    def __init__(self, directory, dim: int = INDEX_DIM, initial_capacity: int = 1024):
+        """
+        :param directory: 索引文件所在目录，不存在时创建
+        :param dim: 向量维度，与已有索引不一致时重建
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._lock = threading.RLock()
+        meta = self._read_meta()
+        if meta is None or meta.get("version") != INDEX_VERSION or meta.get("dim") != dim:
+            meta = {"version": INDEX_VERSION, "dim": dim, "count": 0, "capacity": initial_capacity, "documents": 0}
+            for name in ("vectors.f32", "rerank.f32", "ids.i64", "days.i32", "checks.u32", "df.i32"):
+                (self.directory / name).unlink(missing_ok=True)
+        self._count = meta["count"]
+        self._documents = meta["documents"]
+        self._open(meta["capacity"])
+        df_path = self.directory / "df.i32"
+        if df_path.exists():
+            self._df = np.fromfile(df_path, dtype=np.int32)
+        else:
+            self._df = np.zeros(1 << FEATURE_BITS, dtype=np.int32)
+        # 片段 id -> 行号；已删除片段留下的空行供之后复用
+        ids = self._ids[:self._count]
+        self._rows: Dict[int, int] = {int(i): row for row, i in enumerate(ids) if i >= 0}
+        self._free: List[int] = [int(row) for row in np.nonzero(ids < 0)[0]]
+        self._write_meta()
+
+    # ==================== 文件 ====================
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            return json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        """原子写入 meta.json（先写临时文件再替换）"""
+        meta = {
+            "version": INDEX_VERSION, "dim": self.dim, "count": self._count,
+            "capacity": self._capacity, "documents": self._documents,
+        }
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.directory / "meta.json")
+
+    def _map(self, name: str, dtype, shape: tuple, fill=0) -> np.memmap:
+        """以读写方式映射数组文件，文件不足 shape 大小时扩展，新增部分填充 fill"""
+        path = self.directory / name
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        old_size = path.stat().st_size if path.exists() else 0
+        if old_size < size:
+            with open(path, "ab") as fp:
+                fp.truncate(size)
+        array = np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+        if fill and old_size < size:
+            array.reshape(-1)[old_size // np.dtype(dtype).itemsize:] = fill
+        return array
+
+    def _open(self, capacity: int):
+        """按容量映射各数组文件"""
+        self._capacity = capacity
+        self._vectors = self._map("vectors.f32", np.float32, (capacity, self.dim))
+        self._rerank = self._map("rerank.f32", np.float32, (capacity, self.dim))
+        self._ids = self._map("ids.i64", np.int64, (capacity,), fill=-1)
+        self._days = self._map("days.i32", np.int32, (capacity,))
+        self._checks = self._map("checks.u32", np.uint32, (capacity,))
+
+    def _allocate(self) -> int:
+        """取一个空行：优先复用已删除片段的行，容量不足时翻倍扩展文件"""
+        if self._free:
+            return self._free.pop()
+        if self._count == self._capacity:
+            self._flush_arrays()
+            del self._vectors, self._rerank, self._ids, self._days, self._checks
+            self._open(self._capacity * 2)
+        self._count += 1
+        return self._count - 1
+
+    def _flush_arrays(self):
+        for array in (self._vectors, self._rerank, self._ids, self._days, self._checks):
+            array.flush()
+
+    def flush(self):
+        """把映射的数组、文档频率与元信息写回磁盘"""
+        with self._lock:
+            self._flush_arrays()
+            self._df.tofile(self.directory / "df.i32")
+            self._write_meta()
+
+    def close(self):
+        """写回并释放映射"""
+        self.flush()
+
+    # ==================== 向量 ====================
+
+    def _fold(self, hashes: np.ndarray, weights: np.ndarray, shift: int) -> np.ndarray:
+        """按哈希的 shift 位起的若干位把特征折叠到 dim 维，再高一位决定符号以抵消碰撞偏差，L2 归一化"""
+        signs = np.where((hashes >> (shift + 7)) & 1, -1.0, 1.0)
+        vector = np.bincount((hashes >> shift) % self.dim, weights=weights * signs, minlength=self.dim)
+        norm = math.sqrt(float(vector @ vector))
+        return (vector / norm if norm else vector).astype(np.float32)
+
+    def _vector(self, features: Counter) -> Tuple[np.ndarray, np.ndarray]:
+        """TF-IDF 加权的 n-gram 向量，用哈希中互不重叠的两段位各折叠一次（第一轮打分 / 重新打分）"""
+        hashes = np.fromiter(features.keys(), dtype=np.uint32, count=len(features))
+        tf = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+        idf = np.log((self._documents + 1) / (self._df[hashes & _FEATURE_MASK] + 1)) + 1
+        weights = (1 + np.log(tf)) * idf
+        # 低 20 位用于文档频率，第一组取 20~27 位，第二组取 12~19 位
+        return self._fold(hashes, weights, FEATURE_BITS), self._fold(hashes, weights, FEATURE_BITS - 8)
+
+    def _count_document(self, features: Counter):
+        """新片段计入文档频率"""
+        hashes = np.fromiter(features.keys(), dtype=np.uint32, count=len(features))
+        np.add.at(self._df, hashes & _FEATURE_MASK, 1)
+        self._documents += 1
+
+    # ==================== 增量更新 ====================
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._rows
+
+    def upsert(self, entry_id: int, content: str, date: str):
+        """添加或更新一条片段（内容没有可索引的字符时移出索引）"""
+        with self._lock:
+            self._upsert(entry_id, content, date)
+            self._write_meta()
+
+    def _upsert(self, entry_id: int, content: str, date: str):
+        """upsert 的实现，不写元信息（批量更新后由调用方统一写入）"""
+        features = _features(content)
+        if not features:
+            self.remove(entry_id)
+            return
+        row = self._rows.get(entry_id)
+        if row is None:
+            # 修改过的片段不重复计入文档频率（频率只用于加权，少量偏差可以接受）
+            self._count_document(features)
+            row = self._allocate()
+        self._vectors[row], self._rerank[row] = self._vector(features)
+        self._days[row] = _day(date)
+        self._checks[row] = content_check(content)
+        self._ids[row] = entry_id
+        self._rows[entry_id] = row
+
+    def remove(self, entry_id: int):
+        """移出一条片段，空出的行留待复用（行数、容量不变，无需写元信息）"""
+        with self._lock:
+            row = self._rows.pop(entry_id, None)
+            if row is None:
+                return
+            self._ids[row] = -1
+            self._vectors[row] = 0
+            self._rerank[row] = 0
+            self._days[row] = 0
+            self._free.append(row)
+
+    def sync(self, fragments: Callable[[], Iterable[Tuple[int, str, str]]],
+             should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, int]:
+        """
+        与数据库中的全部片段比对：补上缺失或内容已变化的片段，移除已删除的片段
+        片段按批流式处理，内存占用只与批大小有关；元信息与文档频率在结束时写回一次
+        索引为空时先遍历一遍统计全部文档频率再计算向量，使首次建立的索引权重准确
+        :param fragments: 返回遍历全部片段 (id, content, date) 的迭代器的函数，首次建立时调用两次
+        :param should_stop: 每批之间检查，返回 True 时保存已完成的部分后提前结束，下次同步继续
+        :return: (新增或更新的条数, 移除的条数)
+        """
+        stopped = should_stop or (lambda: False)
+        with self._lock:
+            fresh = not self._rows
+            if fresh:
+                # 上次首次建立中途结束时只留下了文档频率，重新统计
+                self._df[:] = 0
+                self._documents = 0
+        if fresh:
+            for batch in _batches(fragments()):
+                if stopped():
+                    self.flush()
+                    return 0, 0
+                with self._lock:
+                    for _, content, _ in batch:
+                        features = _features(content)
+                        if features:
+                            self._count_document(features)
+        done = 0
+        seen = set()
+        for batch in _batches(fragments()):
+            if stopped():
+                self.flush()
+                return done, 0
+            with self._lock:
+                for entry_id, content, date in batch:
+                    seen.add(entry_id)
+                    row = self._rows.get(entry_id)
+                    if row is not None and int(self._checks[row]) == content_check(content):
+                        continue
+                    if fresh and row is None:
+                        # 文档频率已在上一轮统计过，直接写入向量
+                        self._write_row(entry_id, content, date)
+                    else:
+                        self._upsert(entry_id, content, date)
+                    done += 1
+        with self._lock:
+            removed = set(self._rows) - seen
+            for entry_id in removed:
+                self.remove(entry_id)
+        self.flush()
+        return done, len(removed)
+
+    def _write_row(self, entry_id: int, content: str, date: str):
+        """写入新片段的一行（不更新文档频率）"""
+        features = _features(content)
+        if not features:
+            return
+        row = self._allocate()
+        self._vectors[row], self._rerank[row] = self._vector(features)
+        self._days[row] = _day(date)
+        self._checks[row] = content_check(content)
+        self._ids[row] = entry_id
+        self._rows[entry_id] = row
+
+    # ==================== 查询 ====================
+
+    def query(self, text: str, k: int = 5, before: Optional[str] = None,
+              exclude: Iterable[int] = (), min_score: float = MIN_SCORE) -> List[Tuple[int, float]]:
+        """
+        与文本最相关的片段
+        :param before: 只返回该日期（YYYY-MM-DD）之前的片段
+        :param exclude: 不返回的片段 id
+        :return: [(片段 id, 余弦相似度)]，按相似度从高到低
+        """
+        features = _features(text)
+        with self._lock:
+            # 索引中从未出现过的 n-gram 只会因哈希碰撞产生噪声，并压低所有得分，不参与查询
+            features = Counter({h: c for h, c in features.items() if self._df[h & _FEATURE_MASK]})
+            n = self._count
+            if not n or not features:
+                return []
+            coarse, fine = self._vector(features)
+            scores = np.asarray(self._vectors[:n] @ coarse)
+            if before is not None:
+                scores[self._days[:n] >= _day(before)] = -1
+            for entry_id in exclude:
+                row = self._rows.get(entry_id)
+                if row is not None:
+                    scores[row] = -1
+            m = min(max(k, RERANK_CANDIDATES), n)
+            candidates = np.argpartition(scores, n - m)[n - m:]
+            candidates = candidates[scores[candidates] > -1]
+            # 两组独立哈希的估计取平均
+            scores = (scores[candidates] + self._rerank[candidates] @ fine) / 2
+            order = np.argsort(scores)[::-1][:k]
+            return [
+                (int(self._ids[candidates[i]]), float(scores[i]))
+                for i in order if scores[i] >= min_score and self._ids[candidates[i]] >= 0
+            ]
+
+    def on_this_day(self, date: str, limit: int = 10) -> List[int]:
+        """往年同月同日的片段 id，由近及远"""
+        day = _day(date)
+        with self._lock:
+            days = self._days[:self._count]
+            rows = np.nonzero((days % 10000 == day % 10000) & (days < day // 10000 * 10000))[0]
+            rows = rows[np.argsort(days[rows])[::-1]][:limit]
+            return [int(self._ids[row]) for row in rows if self._ids[row] >= 0]
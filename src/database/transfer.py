@@ -0,0 +1,164 @@
+"""
+数据导入导出模块
+以生成器逐条流式读写日记片段、总结与待办，内存占用与数据总量无关
+- JSONL：每行一条记录，可完整导入回数据库
+- Markdown：按天排版的可读日记，仅用于导出
+"""
+import json
+from datetime import datetime
+from itertools import groupby
+from operator import attrgetter
+from typing import Dict, IO, Iterator, List
+
+from src.models import FragMind, DiarySummary, TodoItem
+from .db_manager import DatabaseManager
+
+
+# 写文件时使用的缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def _iso(value):
+    """datetime 转 ISO 8601 字符串，其他值原样返回"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# ==================== JSONL ====================
+
+def iter_jsonl_records(db: DatabaseManager) -> Iterator[dict]:
+    """按 片段 -> 总结 -> 待办 的顺序流式产出导出记录"""
+    for e in db.iter_frag_minds_by_day():
+        yield {"type": "entry", "date": e.date, "created_at": _iso(e.created_at), "content": e.content}
+    for s in db.iter_summaries(ascending=True):
+        yield {
+            "type": "summary",
+            "date": s.date,
+            "summary": s.summary,
+            "entry_count": s.entry_count,
+            "created_at": _iso(s.created_at),
+            "updated_at": _iso(s.updated_at),
+        }
+    for t in db.iter_todos():
+        yield {
+            "type": "todo",
+            "title": t.title,
+            "due_date": _iso(t.due_date),
+            "completed": t.completed,
+            "created_at": _iso(t.created_at),
+            "completed_at": _iso(t.completed_at),
+        }
+
+
+def export_jsonl(db: DatabaseManager, fp: IO[str]) -> Dict[str, int]:
+    """导出为 JSONL，返回各类型记录数"""
+    counts = {"entry": 0, "summary": 0, "todo": 0}
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for record in iter_jsonl_records(db):
+        fp.write(dumps(record))
+        fp.write("\n")
+        counts[record["type"]] += 1
+    return counts
+
+
+def import_jsonl(db: DatabaseManager, fp: IO[str], batch_size: int = 5000) -> Dict[str, int]:
+    """
+    从 JSONL 导入，整个导入在单个事务中完成，任一行出错则全部回滚
+    片段与待办作为新记录追加，总结按日期覆盖
+    :return: 各类型导入条数
+    """
+    counts = {"entry": 0, "summary": 0, "todo": 0}
+    buffers: Dict[str, List] = {"entry": [], "summary": [], "todo": []}
+    writers = {
+        "entry": db.add_frag_minds,
+        "summary": db.save_diary_summaries,
+        "todo": db.add_todo_items,
+    }
+    builders = {"entry": FragMind, "summary": DiarySummary, "todo": TodoItem}
+
+    def flush(kind: str):
+        if buffers[kind]:
+            writers[kind](buffers[kind])
+            counts[kind] += len(buffers[kind])
+            buffers[kind] = []
+
+    with db.transaction():
+        for line_no, line in enumerate(fp, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                kind = record.pop("type", None)
+                if kind not in builders:
+                    raise ValueError(f"未知记录类型 {kind!r}")
+                buffers[kind].append(builders[kind](**record))
+            except Exception as e:
+                raise ValueError(f"第 {line_no} 行无法导入：{e}") from e
+            if len(buffers[kind]) >= batch_size:
+                flush(kind)
+        for kind in buffers:
+            flush(kind)
+    return counts
+
+
+# ==================== Markdown ====================
+
+def _markdown_day(date: str, summary, entries) -> str:
+    """渲染一天的 Markdown"""
+    parts = [f"## {date}\n"]
+    if summary is not None:
+        parts.append(f"\n### 日记\n\n{summary.summary}\n")
+    if entries:
+        parts.append("\n### 碎片\n\n")
+        # 多行内容的续行缩进，保持在同一列表项内
+        parts.extend(
+            f"- [{e.created_at.strftime('%H:%M')}] {e.content.replace(chr(10), chr(10) + '  ')}\n"
+            for e in entries
+        )
+    parts.append("\n")
+    return "".join(parts)
+
+
+def export_markdown(db: DatabaseManager, fp: IO[str]) -> Dict[str, int]:
+    """
+    导出为按天排版的 Markdown
+    片段流与总结流都按日期正序，做归并连接，每次只在内存中保留一天的数据
+    """
+    counts = {"entry": 0, "summary": 0, "todo": 0}
+    fp.write("# FragMind 日记\n\n")
+
+    summaries = db.iter_summaries(ascending=True)
+    pending = next(summaries, None)
+
+    for date, day_entries in groupby(db.iter_frag_minds_by_day(), key=attrgetter("date")):
+        day_entries = list(day_entries)
+        # 先输出只有总结、没有片段的日期
+        while pending is not None and pending.date < date:
+            fp.write(_markdown_day(pending.date, pending, []))
+            counts["summary"] += 1
+            pending = next(summaries, None)
+
+        summary = None
+        if pending is not None and pending.date == date:
+            summary = pending
+            counts["summary"] += 1
+            pending = next(summaries, None)
+
+        fp.write(_markdown_day(date, summary, day_entries))
+        counts["entry"] += len(day_entries)
+
+    while pending is not None:
+        fp.write(_markdown_day(pending.date, pending, []))
+        counts["summary"] += 1
+        pending = next(summaries, None)
+
+    header_written = False
+    for todo in db.iter_todos():
+        if not header_written:
+            fp.write("## 待办事项\n\n")
+            header_written = True
+        mark = "x" if todo.completed else " "
+        due = f"（截止 {todo.due_date.strftime('%Y-%m-%d %H:%M')}）" if todo.due_date else ""
+        fp.write(f"- [{mark}] {todo.title}{due}\n")
+        counts["todo"] += 1
+    return counts
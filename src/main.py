@@ -7,6 +7,7 @@ import asyncio
 import qasync
 from PyQt6.QtWidgets import QApplication, QMessageBox
 
+from src.services import close_http_client
 from src.ui import MainWindow
 
 
@@ -47,6 +48,8 @@ def main():
     # 使用 loop.run_forever() 代替 app.exec()
     with loop:
         loop.run_forever()
+        # 关闭共享的 LLM HTTP 连接池
+        loop.run_until_complete(close_http_client())
 
 
 if __name__ == "__main__":
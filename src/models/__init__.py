@@ -2,7 +2,7 @@
 数据模型定义
 """
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field
 
 
@@ -22,6 +22,7 @@ class DiarySummary(BaseModel):
     entry_count: int = 0  # 关联的片段数量
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+    source_fragments: Optional[Dict[int, str]] = None  # 生成时依据的片段 id -> 内容哈希
 
 
 class TodoItem(BaseModel):
@@ -42,3 +43,59 @@ class TodoItem(BaseModel):
         """取消完成标记"""
         self.completed = False
         self.completed_at = None
+
+
+class LLMJob(BaseModel):
+    """等待后台重试的 LLM 任务"""
+    id: Optional[int] = None
+    kind: str = "summary"  # summary: 日记总结, todo: 待办提取
+    job_key: str = ""  # 同类任务的去重键（总结为日期，待办为文本哈希）
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    status: str = "pending"  # pending: 等待重试, failed: 放弃
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.now)
+    last_error: str = ""
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class BackfillRun(BaseModel):
+    """一次批量补全（按日期区间补全总结与待办）"""
+    id: Optional[int] = None
+    start_date: str = ""
+    end_date: str = ""
+    include_todos: bool = False
+    status: str = "running"  # running: 进行中或被中断, done: 全部处理完, cancelled: 已放弃
+    counts: Dict[str, int] = Field(default_factory=dict)  # 各状态（pending/done/skipped/failed）的条目数
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class RollupSummary(BaseModel):
+    """周 / 月 / 年回顾数据模型（由每日总结或下一级回顾逐级生成）"""
+    period: str = "week"  # week / month / year
+    period_key: str = ""  # 如 2024-W03、2024-03、2024
+    start_date: str = ""
+    end_date: str = ""
+    summary: str = ""
+    source_summaries: Dict[str, str] = Field(default_factory=dict)  # 生成时依据的日期或下一级回顾 -> 内容哈希
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class SearchHit(BaseModel):
+    """全文检索结果"""
+    source: str = "entry"  # entry: 碎片片段, summary: 日记总结
+    id: int
+    date: str
+    snippet: str = ""  # 带高亮标记的上下文摘录
+    rank: float = 0.0  # bm25 得分，越小越相关
+    created_at: Optional[datetime] = None
+
+
+class DailyStats(BaseModel):
+    """按日聚合统计，用于日历热力图"""
+    date: str
+    entry_count: int = 0
+    has_summary: bool = False
+    open_todos: int = 0  # 当天截止的未完成待办数
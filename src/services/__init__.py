@@ -1,6 +1,22 @@
 """
 服务层模块
 """
-from .llm_service import LLMService
+from .cancellation import CancellationToken, RequestTracker
+from .llm_queue import PRIORITY_BACKGROUND, PRIORITY_USER, LLMJobQueue, get_job_queue
+from .llm_service import LLMService, close_http_client, fragment_hashes
+from .job_worker import LLMJobWorker
+from .backfill import Backfiller, BackfillProgress, summary_is_stale
+from .model_router import ModelRoute, task_routes
+from .related import RelatedFragments
+from .rollup import PERIOD_NAMES, PERIODS, RollupBuilder, period_key, period_range, period_title
+from .resilience import CircuitBreaker, CircuitOpenError, is_transient_error
+from .todo_dedup import dedupe_todos, store_extracted_todos
 
-__all__ = ['LLMService']
+__all__ = [
+    'BackfillProgress', 'Backfiller', 'CancellationToken', 'CircuitBreaker', 'CircuitOpenError',
+    'LLMJobQueue', 'LLMJobWorker', 'LLMService', 'ModelRoute', 'PERIOD_NAMES', 'PERIODS',
+    'PRIORITY_BACKGROUND', 'PRIORITY_USER', 'RelatedFragments', 'RequestTracker', 'RollupBuilder',
+    'close_http_client', 'dedupe_todos', 'fragment_hashes', 'get_job_queue', 'is_transient_error',
+    'period_key', 'period_range', 'period_title',
+    'store_extracted_todos', 'summary_is_stale', 'task_routes',
+]
@@ -0,0 +1,143 @@
+"""
+批量补全历史总结与待办
+在日期区间内找出有片段但没有总结或总结已过期的日期，在后台以有限并发逐天生成：
+- 每处理完一条就写入进度检查点（backfill_items），程序崩溃或中途停止后可从未完成的条目继续
+- 所有请求以后台优先级排队，界面上的操作始终优先
+- 与界面共用 RequestTracker：界面上正在处理同一天时该天留待下次继续
+- 遇到断网、熔断等暂时性失败时暂停，未处理的条目保留到下次继续
+"""
+import asyncio
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from src.config import Config
+from src.models import BackfillRun, DiarySummary, FragMind
+from .cancellation import RequestTracker
+from .job_worker import Superseded, refresh_summary
+from .llm_service import LLMService, fragment_hashes
+from .resilience import is_transient_error
+from .todo_dedup import store_extracted_todos
+
+
+def summary_is_stale(summary: Optional[DiarySummary], entries: List[FragMind]) -> bool:
+    """
+    总结是否需要重新生成：没有总结，或片段相对生成时有变化
+    没有来源片段记录的旧总结只能比较片段数
+    """
+    if summary is None:
+        return True
+    if summary.source_fragments is not None:
+        return summary.source_fragments != fragment_hashes(entries)
+    return summary.entry_count != len(entries)
+
+
+class BackfillProgress(NamedTuple):
+    """补全进度"""
+    run_id: int
+    total: int
+    finished: int       # 已处理（完成、跳过或失败）的条目数
+    failed: int
+    kind: str           # 刚处理完的条目
+    date: str
+
+
+class Backfiller:
+    """按日期区间批量补全总结与待办"""
+
+    def __init__(self, db, service: Callable[[], LLMService], tracker: Optional[RequestTracker] = None,
+                 concurrency: Optional[int] = None,
+                 on_progress: Optional[Callable[[BackfillProgress], None]] = None):
+        """
+        :param db: AsyncDatabaseManager
+        :param service: 返回当前 LLMService 的函数
+        :param tracker: 与界面共用的 RequestTracker
+        :param concurrency: 同时处理的天数
+        :param on_progress: 每处理完一条时回调
+        """
+        self.db = db
+        self._service = service
+        self.tracker = tracker or RequestTracker()
+        self.concurrency = concurrency or Config.BACKFILL_CONCURRENCY
+        self.on_progress = on_progress
+        self.paused_reason = ""
+
+    async def plan(self, start: str, end: str, include_todos: bool = False) -> int:
+        """
+        找出区间内需要补全的日期并记录为一次补全，返回补全 id
+        总结：有片段但没有总结或总结已过期的日期；待办：区间内所有有片段的日期
+        """
+        items: List[Tuple[str, str]] = []
+        for date, summary in await self.db.get_backfill_candidates(start, end):
+            if summary is None or summary_is_stale(summary, await self.db.get_frag_minds_by_date(date)):
+                items.append(("summary", date))
+            if include_todos:
+                items.append(("todo", date))
+        return await self.db.create_backfill_run(start, end, include_todos, items)
+
+    async def run(self, run_id: int) -> BackfillRun:
+        """
+        以有限并发处理补全中尚未完成的条目，返回处理后的补全状态
+        全部条目处理完时标记为 done；暂停（见 paused_reason）或被取消时保持 running，之后可继续
+        """
+        self.paused_reason = ""
+        pending = list(await self.db.get_pending_backfill_items(run_id))
+        run = await self.db.get_backfill_run(run_id)
+        total = sum(run.counts.values())
+        finished = total - len(pending)
+        failed = run.counts.get("failed", 0)
+        deferred = 0
+
+        async def worker():
+            nonlocal finished, failed, deferred
+            while pending and not self.paused_reason:
+                kind, date = pending.pop(0)
+                status, error = await self._process(kind, date)
+                if status == "pending":
+                    deferred += 1
+                    continue
+                await self.db.update_backfill_item(run_id, kind, date, status, error)
+                finished += 1
+                failed += status == "failed"
+                if self.on_progress is not None:
+                    self.on_progress(BackfillProgress(run_id, total, finished, failed, kind, date))
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        if not pending and not deferred and not self.paused_reason:
+            await self.db.finish_backfill_run(run_id)
+        return await self.db.get_backfill_run(run_id)
+
+    async def _process(self, kind: str, date: str) -> Tuple[str, str]:
+        """处理一个条目，返回 (状态, 错误信息)；状态为 pending 时条目留待下次继续"""
+        service = self._service()
+        try:
+            if kind == "summary":
+                if not service.is_available():
+                    self.paused_reason = "AI 服务未配置"
+                    return "pending", ""
+                result = await refresh_summary(self.db, service, self.tracker, date)
+                return ("done" if result is not None else "skipped"), ""
+            if not service.is_available("todo"):
+                self.paused_reason = "AI 服务未配置"
+                return "pending", ""
+            return await self._backfill_todos(service, date), ""
+        except Superseded:
+            # 界面上正在处理这一天，下次继续
+            return "pending", ""
+        except Exception as e:
+            if is_transient_error(e):
+                self.paused_reason = str(e)
+                return "pending", ""
+            return "failed", str(e)
+
+    async def _backfill_todos(self, service: LLMService, date: str) -> str:
+        """提取一天所有片段中的待办（按各片段的记录时刻解析相对时间），与全部待办去重后写入"""
+        entries = await self.db.get_frag_minds_by_date(date)
+        if not entries:
+            return "skipped"
+        groups = await asyncio.gather(*(
+            service.aparse_todos(e.content, now=e.created_at, raise_errors=True) for e in entries
+        ))
+        extracted = [todo for group in groups for todo in group]
+        if extracted:
+            # 同时与已完成的待办去重，避免把早已完成的事项重新加入
+            await store_extracted_todos(self.db, extracted, include_completed=True)
+        return "done"
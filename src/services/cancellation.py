@@ -0,0 +1,74 @@
+"""
+LLM 操作的取消与替代
+每个 LLM 操作开始时为其目标（如某天的总结、某条片段的待办提取）领取一个取消令牌，
+令牌记录发起时目标的输入版本：
+- 同一目标发起新的操作时，旧操作被取消（取消其任务，随之关闭底层 HTTP 请求）
+- 目标的输入变化（片段新增、修改、删除）时版本递增，进行中的操作同样被取消
+- 结果写入前用 is_current() 确认令牌仍然有效，过期的结果一律丢弃
+"""
+import asyncio
+from typing import Dict, Hashable, Optional
+
+
+class CancellationToken:
+    """一次 LLM 操作的取消令牌"""
+
+    def __init__(self, target: Hashable, version: int, task: Optional[asyncio.Task]):
+        self.target = target
+        self.version = version
+        self.task = task
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        """取消令牌及其绑定的任务"""
+        self._cancelled = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class RequestTracker:
+    """按目标管理进行中的 LLM 操作与输入版本"""
+
+    def __init__(self):
+        self._versions: Dict[Hashable, int] = {}
+        self._active: Dict[Hashable, CancellationToken] = {}
+
+    def begin(self, target: Hashable) -> CancellationToken:
+        """
+        为当前任务领取 target 的令牌，同一目标上进行中的旧操作被取消
+        应在操作所在的任务中调用
+        """
+        self.cancel(target)
+        token = CancellationToken(target, self._versions.get(target, 0), asyncio.current_task())
+        self._active[target] = token
+        return token
+
+    def active(self, target: Hashable) -> Optional[CancellationToken]:
+        """target 上进行中的操作"""
+        return self._active.get(target)
+
+    def cancel(self, target: Hashable):
+        """取消 target 上进行中的操作"""
+        token = self._active.pop(target, None)
+        if token is not None:
+            token.cancel()
+
+    def invalidate(self, target: Hashable):
+        """target 的输入已变化：版本递增并取消进行中的操作"""
+        self._versions[target] = self._versions.get(target, 0) + 1
+        self.cancel(target)
+
+    def is_current(self, token: CancellationToken) -> bool:
+        """令牌未被取消、未被新操作替代，且目标输入自发起以来没有变化"""
+        return (not token.cancelled
+                and self._active.get(token.target) is token
+                and self._versions.get(token.target, 0) == token.version)
+
+    def finish(self, token: CancellationToken):
+        """操作结束，释放令牌"""
+        if self._active.get(token.target) is token:
+            del self._active[token.target]
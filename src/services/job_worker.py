@@ -0,0 +1,254 @@
+"""
+LLM 离线任务的后台重放
+断网、超时、限流或服务端错误导致失败的总结与待办提取写入 llm_jobs 表，
+由 LLMJobWorker 在到期后重放：
+- 暂时性失败按带抖动的指数退避重新安排，超过最大次数或不可重试的失败标记为 failed
+- 熔断期间不发出请求，熔断恢复（任一请求成功）时立即唤醒
+- 与界面共用 RequestTracker：目标上有进行中的操作时推迟，片段变化时本次重放作废
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from src.config import Config
+from src.models import DiarySummary, LLMJob
+from .cancellation import RequestTracker
+from .llm_queue import PRIORITY_BACKGROUND
+from .llm_service import LLMService, fragment_hashes
+from .resilience import CircuitOpenError, backoff_delay, is_transient_error
+from .todo_dedup import store_extracted_todos
+
+
+# 没有到期任务时最长的休眠时间（秒），兜底处理其他途径写入的任务
+IDLE_POLL_SECONDS = 60.0
+
+
+class Superseded(Exception):
+    """目标上有更新的操作，本次重放作废"""
+
+
+def begin_if_idle(tracker: RequestTracker, target):
+    """目标上没有进行中的操作时领取令牌，否则抛出 Superseded（后台任务不抢占界面上的操作）"""
+    if tracker.active(target) is not None:
+        raise Superseded()
+    return tracker.begin(target)
+
+
+async def refresh_summary(db, service: LLMService, tracker: RequestTracker, date: str,
+                          priority: int = PRIORITY_BACKGROUND) -> Optional[str]:
+    """
+    按当前片段重新生成一天的总结并保存；已有总结与片段一致时直接返回
+    生成期间片段变化或界面上开始了同一天的操作时抛出 Superseded，不保存结果
+    :return: 当天的总结，没有片段时为 None
+    """
+    token = begin_if_idle(tracker, ("summary", date))
+    try:
+        entries = await db.get_frag_minds_by_date(date)
+        if not entries:
+            return None
+        current = await db.get_diary_summary(date)
+        sources = fragment_hashes(entries)
+        if current is not None and current.source_fragments == sources:
+            return current.summary
+        summary = await service.asummarize(
+            entries, date,
+            current.summary if current else "",
+            current.source_fragments if current else None,
+            priority=priority, raise_errors=True
+        )
+
+        def count_and_save(db):
+            db.save_diary_summary(DiarySummary(
+                date=date,
+                summary=summary,
+                entry_count=db.count_frag_minds_by_date(date),
+                source_fragments=sources
+            ))
+
+        if not tracker.is_current(token):
+            raise Superseded()
+        await db.run_in_transaction(count_and_save)
+        return summary
+    finally:
+        tracker.finish(token)
+
+
+class LLMJobWorker:
+    """后台重放 LLM 离线任务"""
+
+    def __init__(self, db, service: Callable[[], LLMService], tracker: Optional[RequestTracker] = None,
+                 on_job_done: Optional[Callable[[LLMJob, object], None]] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        :param db: AsyncDatabaseManager
+        :param service: 返回当前 LLMService 的函数（设置变更后服务会被重建）
+        :param tracker: 与界面共用的 RequestTracker
+        :param on_job_done: 任务完成回调 (任务, 结果)，总结任务的结果为总结文本，待办任务为 TodoDedupResult
+        """
+        self.db = db
+        self._service = service
+        self.tracker = tracker or RequestTracker()
+        self.on_job_done = on_job_done
+        self.max_attempts = max_attempts or Config.LLM_JOB_MAX_ATTEMPTS
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._breaker = None
+
+    # ==================== 入队 ====================
+
+    async def enqueue_summary(self, date: str, delay: float = 0.0) -> int:
+        """记录一天的总结任务（同一天只保留一个）"""
+        job_id = await self.db.enqueue_llm_job(
+            "summary", date, {"date": date}, datetime.now() + timedelta(seconds=delay)
+        )
+        self.wake()
+        return job_id
+
+    async def enqueue_todo(self, text: str, now: Optional[datetime] = None,
+                           entry_id: Optional[int] = None, delay: float = 0.0) -> int:
+        """记录一次待办提取任务；now 为记录时刻，重放时按它解析相对时间"""
+        now = now or datetime.now()
+        key = hashlib.sha256(f"{now:%Y-%m-%d}\n{text}".encode("utf-8")).hexdigest()
+        job_id = await self.db.enqueue_llm_job(
+            "todo", key, {"text": text, "now": now.isoformat(), "entry_id": entry_id},
+            datetime.now() + timedelta(seconds=delay)
+        )
+        self.wake()
+        return job_id
+
+    # ==================== 调度 ====================
+
+    def start(self):
+        """启动后台循环（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        """停止后台循环，进行中的重放被取消、任务保留在表中"""
+        if self._breaker is not None:
+            self._breaker.remove_recovery_listener(self.wake)
+            self._breaker = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self):
+        """立即检查到期任务"""
+        self._wake.set()
+
+    def _watch_breaker(self, service: LLMService):
+        """熔断恢复时唤醒（服务重建后队列不变，只需注册一次）"""
+        breaker = service.queue.breaker
+        if breaker is not self._breaker:
+            if self._breaker is not None:
+                self._breaker.remove_recovery_listener(self.wake)
+            breaker.add_recovery_listener(self.wake)
+            self._breaker = breaker
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self.run_due()
+            except Exception as e:
+                print(f"重放 LLM 任务失败：{e}")
+            if self._service().is_available():
+                timeout = await self._idle_seconds()
+            else:
+                # 未配置服务时到期任务无法重放，不按到期时间轮询，等设置变更后的 wake() 或兜底轮询
+                timeout = IDLE_POLL_SECONDS
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _idle_seconds(self) -> float:
+        """距离下一个到期任务或熔断冷却结束的秒数"""
+        delay = IDLE_POLL_SECONDS
+        next_time = await self.db.get_next_llm_job_time()
+        if next_time is not None:
+            delay = min(delay, (next_time - datetime.now()).total_seconds())
+        if self._breaker is not None and self._breaker.state == "open":
+            delay = max(delay, self._breaker.retry_after())
+        return max(delay, 0.05)
+
+    async def run_due(self) -> int:
+        """重放所有到期的任务，返回完成的任务数"""
+        service = self._service()
+        if not service.is_available():
+            return 0
+        self._watch_breaker(service)
+        done = 0
+        while self._breaker.state != "open":
+            jobs = await self.db.get_due_llm_jobs()
+            if not jobs:
+                break
+            for job in jobs:
+                if self._breaker.state == "open":
+                    break
+                done += await self._process(service, job)
+        return done
+
+    # ==================== 执行 ====================
+
+    async def _process(self, service: LLMService, job: LLMJob) -> bool:
+        """执行一个任务并记录结果，完成时返回 True"""
+        handler = self._replay_summary if job.kind == "summary" else self._replay_todo
+        # 在独立任务中执行：令牌被界面取消时只影响本次重放
+        task = asyncio.ensure_future(handler(service, job))
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        try:
+            result = task.result()
+        except (asyncio.CancelledError, Superseded):
+            # 界面上有同一目标的操作或片段已变化，稍后基于最新内容重放
+            await self.db.retry_llm_job(
+                job.id, datetime.now() + timedelta(seconds=backoff_delay(1)), "已被更新的操作替代",
+                count_attempt=False
+            )
+            return False
+        except CircuitOpenError as e:
+            # 没有真正发出请求，等熔断冷却结束
+            await self.db.retry_llm_job(
+                job.id, datetime.now() + timedelta(seconds=e.retry_after), str(e), count_attempt=False
+            )
+            return False
+        except Exception as e:
+            attempt = job.attempts + 1
+            if is_transient_error(e) and attempt < self.max_attempts:
+                await self.db.retry_llm_job(
+                    job.id, datetime.now() + timedelta(seconds=backoff_delay(attempt)), str(e)
+                )
+            else:
+                await self.db.fail_llm_job(job.id, str(e))
+            return False
+        await self.db.complete_llm_job(job.id)
+        if self.on_job_done is not None:
+            self.on_job_done(job, result)
+        return True
+
+    async def _replay_summary(self, service: LLMService, job: LLMJob) -> Optional[str]:
+        """按当前片段重新生成当天总结；已有总结与片段一致时直接完成"""
+        return await refresh_summary(self.db, service, self.tracker, job.payload["date"])
+
+    async def _replay_todo(self, service: LLMService, job: LLMJob):
+        """重新提取待办，按记录时刻解析相对时间，去重后写入"""
+        entry_id = job.payload.get("entry_id")
+        token = begin_if_idle(self.tracker, ("todo", entry_id)) if entry_id is not None else None
+        try:
+            extracted = await service.aparse_todos(
+                job.payload["text"], now=datetime.fromisoformat(job.payload["now"]), raise_errors=True
+            )
+            result = await store_extracted_todos(
+                self.db, extracted, lambda: token is None or self.tracker.is_current(token)
+            )
+            if result is None:
+                raise Superseded()
+            return result
+        finally:
+            if token is not None:
+                self.tracker.finish(token)
@@ -0,0 +1,215 @@
+"""
+LLM 请求队列
+所有 Agent 调用都经过同一个队列：
+- 并发上限：同时进行的请求数不超过 max_concurrency
+- 优先级：有空位时先放行优先级高（数值小）的请求，同级按提交顺序
+- single-flight：相同 key 的请求在完成前只发出一次，其余调用方共享结果
+- 熔断：请求结果记入 CircuitBreaker，熔断期间直接抛出 CircuitOpenError
+并记录队列深度、等待时间等指标
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.config import Config
+from .resilience import CircuitBreaker, CircuitOpenError, is_transient_error
+
+
+# 用户主动发起的请求（如手动生成总结）
+PRIORITY_USER = 0
+# 后台请求（如自动提取待办）
+PRIORITY_BACKGROUND = 10
+
+
+class _Flight:
+    """一个进行中的 single-flight 请求，priority 为所有共享者中最高的优先级"""
+    __slots__ = ("task", "waiters", "priority", "entry")
+
+    def __init__(self, priority: int):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.priority = priority
+        # 排队等待名额时的队列条目，取得名额后为 None
+        self.entry: Optional[list] = None
+
+
+class LLMJobQueue:
+    """带优先级、并发上限与 single-flight 的请求队列"""
+
+    def __init__(self, max_concurrency: Optional[int] = None, breaker: Optional[CircuitBreaker] = None):
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.breaker = breaker or CircuitBreaker()
+        self._running = 0
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._inflight: Dict[str, _Flight] = {}
+        # 指标
+        self._submitted = 0
+        self._started = 0
+        self._deduplicated = 0
+        self._batches = 0
+        self._batched_texts = 0
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        """正在等待空位的请求数"""
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_BACKGROUND, flight: Optional[_Flight] = None):
+        """
+        占用一个并发名额；没有空位时按优先级排队等待
+        取得名额后经过熔断器检查，退出时按结果记录成功或失败
+        :param flight: 所属的 single-flight 请求，排队期间有更高优先级的调用方加入时随之提升
+        """
+        if flight is not None:
+            priority = flight.priority
+        start = time.perf_counter()
+        self._submitted += 1
+        if self._running < self.max_concurrency and not self._waiters:
+            self._running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = [priority, next(self._seq), future]
+            heapq.heappush(self._waiters, entry)
+            self._max_depth = max(self._max_depth, len(self._waiters))
+            if flight is not None:
+                flight.entry = entry
+            try:
+                # 名额由释放方直接移交，_running 不变
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # 名额已移交但调用方被取消，转交给下一个
+                    self._release()
+                else:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                if flight is not None:
+                    flight.entry = None
+        self._started += 1
+        waited = time.perf_counter() - start
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError:
+            self._release()
+            raise
+        try:
+            yield
+        except Exception as e:
+            # 非暂时性错误（如密钥错误）说明服务可达，不计入熔断
+            if is_transient_error(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self._release()
+
+    def _release(self):
+        """释放名额：有等待者时移交给优先级最高的一个"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    async def _run_in_slot(self, factory: Callable[[], Awaitable[Any]], priority: int,
+                           flight: Optional[_Flight] = None):
+        async with self.slot(priority, flight):
+            return await factory()
+
+    def _promote(self, flight: _Flight, priority: int):
+        """更高优先级的调用方加入进行中的请求：仍在排队时在队列中原地提升，已在执行时无需处理"""
+        if priority >= flight.priority:
+            return
+        flight.priority = priority
+        entry = flight.entry
+        if entry is not None and not entry[2].done():
+            entry[0] = priority
+            heapq.heapify(self._waiters)
+
+    async def run(self, factory: Callable[[], Awaitable[Any]], key: Optional[str] = None,
+                  priority: int = PRIORITY_BACKGROUND) -> Any:
+        """
+        在队列中执行 factory()
+        :param key: single-flight 键；相同键的请求进行中时直接等待其结果
+        所有共享者都取消后，进行中的请求随之取消；
+        排队中的请求按共享者中最高的优先级排队（后台发起的请求被界面操作加入时不再排在其他后台请求之后）
+        """
+        if key is None:
+            return await self._run_in_slot(factory, priority)
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(priority)
+            flight.task = asyncio.ensure_future(self._run_in_slot(factory, priority, flight))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._forget(key, flight))
+        else:
+            self._deduplicated += 1
+            self._promote(flight, priority)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def record_deduplicated(self, count: int = 1):
+        """记录在队列之外合并掉的重复请求（如批处理中的相同文本）"""
+        self._deduplicated += count
+
+    def record_batch(self, size: int):
+        """记录一次合并了 size 段文本的批量请求"""
+        self._batches += 1
+        self._batched_texts += size
+
+    def stats(self) -> dict:
+        """队列指标"""
+        started = self._started
+        return {
+            "running": self._running,
+            "depth": self.depth,
+            "max_depth": self._max_depth,
+            "max_concurrency": self.max_concurrency,
+            "submitted": self._submitted,
+            "deduplicated": self._deduplicated,
+            "batches": self._batches,
+            "batched_texts": self._batched_texts,
+            "avg_wait_ms": self._wait_total / started * 1000 if started else 0.0,
+            "max_wait_ms": self._wait_max * 1000,
+            "breaker": self.breaker.state,
+        }
+
+
+_job_queue: Optional[LLMJobQueue] = None
+
+
+def get_job_queue() -> LLMJobQueue:
+    """进程内共享的请求队列，重建 LLMService 后并发上限与指标仍然连续"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = LLMJobQueue()
+    return _job_queue
@@ -3,19 +3,25 @@ LLM 服务层
 封装与 LLM API 的交互，提供日记总结、Todo 解析等 Agent 功能
 使用 PydanticAI 框架重构
 """
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 from datetime import datetime
+import asyncio
+import hashlib
+import json
 import os
+import time
 import httpx
 
 from PyQt6.QtCore import QSettings
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.providers.deepseek import DeepSeekProvider
 
 from src.config import Config
 from src.models import FragMind, TodoItem
+from .llm_queue import PRIORITY_BACKGROUND, PRIORITY_USER, get_job_queue
+from .model_router import ModelRoute, build_model, task_routes
+from .time_parser import prefilter_todo_text
 
 
 class TodoResult(BaseModel):
@@ -29,149 +35,784 @@ class TodoList(BaseModel):
     items: List[TodoResult] = Field(description="提取出的待办事项列表")
 
 
+class TodoBatchResult(TodoResult):
+    """批量提取中的一条待办"""
+    index: int = Field(description="该待办所属文本的序号（从 1 开始）")
+
+
+class TodoBatch(BaseModel):
+    """批量提取结果容器"""
+    items: List[TodoBatchResult] = Field(description="所有文本中提取出的待办事项列表")
+
+
+# 提示词布局：服务端按请求前缀缓存（DeepSeek 对命中缓存的前缀 token 计费更低、响应更快），
+# 因此不变的规则放在系统提示词中、用户自定义风格紧随其后，日期、片段等每次不同的内容都放在用户消息里，
+# 用户消息中也按"任务 -> 日期 -> 片段 -> 参考日记"的顺序排列，同一天追加片段时前缀尽量保持不变
+SUMMARY_SYSTEM_PROMPT = """你是 FragMind 系统中的 Reflection Agent，负责将用户在一天中记录的碎片化想法整理为一篇日记。
+
+请遵循以下原则：
+1. 保留用户原有的情绪与观点，不夸大、不编造
+2. 用第一人称书写，风格克制、连贯、自然、有一定的文学性、可按时间或逻辑组织
+3. 不进行心理诊断或说教式分析，保持温和的自我反思视角。
+4. 如果有重复或相似的内容，进行适当合并，避免冗余。
+
+用户消息的第一行【任务】标明本次的工作方式：
+- 整理日记：把【今日所有有效片段】整理成一篇流畅、连贯的日记。
+  若附有【参考日记】，说明用户可能修改或删除了部分原始片段：请以【今日所有有效片段】为唯一事实依据重新生成，
+  【参考日记】仅用于参考文风和语调，**绝对不要**保留【参考日记】中存在但【今日所有有效片段】中不存在的信息。
+- 更新日记：在尽量保留【已有日记】原文措辞与结构的前提下，把【新增片段】补充到合适位置，
+  用【修改后的片段】替换日记中同一时间点的原有叙述，输出更新后的**完整**日记。
+- 时段纪要：按时间顺序把【片段】提炼成一段简洁的纪要，供之后整理成完整日记使用；
+  保留所有事实、情绪与观点，不遗漏、不夸大、不编造；只写纪要，不要写成完整日记，不要加开头和结尾。
+- 合成日记：把【各时段纪要】（按时间顺序，唯一事实来源）整理成一篇流畅、连贯的日记。
+- 阶段回顾：把【各日日记】或【各月回顾】（按时间顺序，唯一事实来源）提炼成一篇周 / 月 / 年回顾：
+  概括主要经历、情绪变化与反复出现的主题，篇幅与时间跨度相称，不逐日复述，不编造材料中没有的内容。
+
+用户消息末尾可能附有【往日相关片段】：它们是用户以前某天记下的、与今天内容相关的片段，
+只可用于自然地联想与呼应（如"和去年此时一样……"），**绝对不要**把它们当作今天发生的事写进日记；不需要时可以不提。
+"""
+
+CUSTOM_PROMPT_TEMPLATE = """
+【用户额外指令】：
+{custom_prompt}
+请务必在遵循上述基本原则的同时，优先满足用户的这条额外指令（时段纪要除外）。
+"""
+
+TODO_SYSTEM_PROMPT = """你是 FragMind 系统中的 Todo Agent，负责从用户的日记片段中提取**所有**待办事项、计划、约会、活动安排和日程。
+
+请严格遵循以下规则：
+1. 捕捉休闲计划：即使是口语化的计划（如"去吃炸串"、"看电影"、"和朋友见面"）也必须提取为待办事项。
+2. 提取时间：如果文中提到了时间（如"今晚八点"、"明天下午"），必须将其转换为具体的 `due_date`。
+3. 批量提取：用户消息中有多段【文本 N】时，各段相互独立，用 index 标明每条待办来自第几段文本。
+"""
+
+# 增量重写：变化片段数超过当前片段数的该比例时退回全量重写
+INCREMENTAL_MAX_CHANGE_RATIO = 0.5
+
+# 一次批量待办提取最多合并的文本数，达到后不等时间窗口结束立即发出
+TODO_BATCH_MAX_TEXTS = 8
+
+
+def fragment_hashes(entries: List[FragMind]) -> Dict[int, str]:
+    """片段 id -> 规范化内容的哈希，保存在总结中用于下次计算增量"""
+    return {
+        e.id: hashlib.sha1(" ".join(e.content.split()).encode("utf-8")).hexdigest()[:16]
+        for e in entries if e.id is not None
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 0.6 token/字，其余约 0.3 token/字符"""
+    cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+class SummaryDelta(NamedTuple):
+    """当前片段相对上次生成总结时的变化"""
+    added: List[FragMind]
+    edited: List[FragMind]
+    deleted_ids: List[int]
+
+
+def compute_summary_delta(entries: List[FragMind], sources: Dict[int, str]) -> SummaryDelta:
+    """对比当前片段与总结的来源片段记录，得出新增、修改与删除的片段"""
+    current = fragment_hashes(entries)
+    added = [e for e in entries if e.id not in sources]
+    edited = [e for e in entries if e.id in sources and sources[e.id] != current[e.id]]
+    deleted_ids = [i for i in sources if i not in current]
+    return SummaryDelta(added, edited, deleted_ids)
+
+
+# 共享 HTTP 连接池配置
+HTTP_TIMEOUT = httpx.Timeout(Config.LLM_TIMEOUT_SECONDS, connect=10.0)
+HTTP_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=120.0)
+
+# 进程内共享的 httpx 客户端，LLMService 重建时复用，保持 TCP/TLS 长连接
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的 HTTP/2 长连接客户端（不存在或已关闭时创建）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=HTTP_TIMEOUT,
+            limits=HTTP_LIMITS,
+            # 支持代理（如果环境变量设置了）
+            proxy=os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
+        )
+    return _http_client
+
+
+def _run_usage(result):
+    """取运行结果的 token 用量（较早的 pydantic-ai 版本中 usage 为方法，新版本为属性）"""
+    usage = result.usage
+    return usage() if callable(usage) else usage
+
+
+def _cache_hit_tokens(usage) -> int:
+    """命中服务端前缀缓存的输入 token 数（DeepSeek 报告为 prompt_cache_hit_tokens，OpenAI 为 cached_tokens）"""
+    return usage.cache_read_tokens or usage.details.get("prompt_cache_hit_tokens", 0)
+
+
+async def close_http_client():
+    """关闭共享客户端并释放连接池，应在事件循环退出前调用"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+class _PendingTodo(NamedTuple):
+    """等待合并提取的一段文本"""
+    key: str
+    text: str
+    now: datetime
+    cache: bool
+    future: asyncio.Future
+
+
 class LLMService:
     """LLM 服务类 - 提供 AI Agent 功能"""
     
-    def __init__(self):
-        """初始化 LLM 服务"""
-        self.model = None
+    def __init__(self, db=None, chunk_threshold_tokens: Optional[int] = None,
+                 chunk_tokens: Optional[int] = None, max_parallel_chunks: Optional[int] = None,
+                 local_todo_parser: bool = True, queue=None,
+                 todo_batch_window_ms: Optional[int] = None):
+        """
+        初始化 LLM 服务
+        :param db: AsyncDatabaseManager，提供持久化的响应缓存；为 None 时不使用缓存
+        :param chunk_threshold_tokens: 全量 prompt 超过该估算 token 数时改为分段总结
+        :param chunk_tokens: 分段总结时每个时间窗口的片段 token 上限
+        :param max_parallel_chunks: 同时进行的分段请求数
+        :param local_todo_parser: 提取待办前是否先用本地规则预处理（见 time_parser）
+        :param queue: LLMJobQueue，为 None 时使用进程内共享的队列
+        :param todo_batch_window_ms: 待办提取的合并时间窗口，0 为不合并
+        """
+        self.db = db
+        self.chunk_threshold_tokens = chunk_threshold_tokens or Config.SUMMARY_CHUNK_THRESHOLD_TOKENS
+        self.chunk_tokens = chunk_tokens or Config.SUMMARY_CHUNK_TOKENS
+        self.max_parallel_chunks = max_parallel_chunks or Config.SUMMARY_MAX_PARALLEL_CHUNKS
+        # 提取待办前先用本地规则预处理
+        self.local_todo_parser = local_todo_parser
+        # 所有 Agent 调用都经过请求队列
+        self.queue = queue or get_job_queue()
+        if todo_batch_window_ms is None:
+            todo_batch_window_ms = Config.TODO_BATCH_WINDOW_MS
+        self.todo_batch_window = todo_batch_window_ms / 1000
+        self._todo_pending: List[_PendingTodo] = []
+        self._todo_waiting: Dict[str, asyncio.Future] = {}
+        self._todo_waiters: Dict[str, int] = {}
+        self._todo_flush_handle = None
+        # 已发出的批量请求 -> 其中各文本的键
+        self._todo_batches: Dict[asyncio.Task, List[str]] = {}
+        # 任务 -> [(路由, 模型)]，首选模型在前，失败时依次改用备选模型
+        self.routes: Dict[str, List[Tuple[ModelRoute, OpenAIChatModel]]] = {}
         self.summary_agent = None
         self.todo_agent = None
+        self.todo_batch_agent = None
         self._init_agents()
     
     def _init_agents(self):
-        """初始化 PydanticAI Agents"""
+        """按任务路由创建模型并初始化 PydanticAI Agents"""
         api_key = Config.get_api_key()
         
-        if api_key:
-            # 创建自定义 httpx client 以支持代理（如果环境变量设置了）
-            # 并且设置较长的超时时间
-            http_client = httpx.AsyncClient(
-                timeout=30.0,
-                proxy=os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
-            )
-            
-            self.model = OpenAIChatModel(
-                'deepseek-chat',
-                provider=DeepSeekProvider(
-                    api_key=api_key,
-                    http_client=http_client
-                )
-            )
-
-            
-        if self.model:
-            # 1. 日记总结 Agent
+        for task in ("summary", "todo"):
+            # 所有 LLMService 实例共用一个连接池，修改设置后重建服务不会泄漏客户端
+            routes = task_routes(task)
+            models = [
+                (route, build_model(route, api_key, get_http_client(), has_fallback=i < len(routes) - 1))
+                for i, route in enumerate(routes)
+            ]
+            models = [(route, model) for route, model in models if model is not None]
+            if models:
+                self.routes[task] = models
+        
+        if "summary" in self.routes:
+            # 1. 日记总结 Agent：系统提示词含用户自定义风格，每次请求时读取
             self.summary_agent = Agent(
-                self.model,
-                system_prompt="你是 FragMind 系统中的 Reflection Agent，负责将用户在一天中记录的碎片化想法整理为一篇日记。",
+                self.routes["summary"][0][1],
                 output_type=str
             )
-            
+            self.summary_agent.system_prompt(self._summary_system_prompt)
+        
+        if "todo" in self.routes:
             # 2. Todo 解析 Agent
             self.todo_agent = Agent(
-                self.model,
-                system_prompt="""你是 FragMind 系统中的 Todo Agent，负责从用户的日记片段中提取**所有**待办事项、计划、约会、活动安排和日程。
-
-请严格遵循以下规则：
-1. 捕捉休闲计划：即使是口语化的计划（如"去吃炸串"、"看电影"、"和朋友见面"）也必须提取为待办事项。
-2. 提取时间：如果文中提到了时间（如"今晚八点"、"明天下午"），必须将其转换为具体的 `due_date`。
-""",
+                self.routes["todo"][0][1],
+                system_prompt=TODO_SYSTEM_PROMPT,
                 output_type=TodoList
             )
+            
+            # 3. 批量 Todo 解析 Agent：合并窗口内的多段文本一次提取
+            self.todo_batch_agent = Agent(
+                self.routes["todo"][0][1],
+                system_prompt=TODO_SYSTEM_PROMPT,
+                output_type=TodoBatch
+            )
+    
+    def is_available(self, task: str = "summary") -> bool:
+        """检查任务（summary / todo）是否有可用的模型"""
+        return task in self.routes
+    
+    # ==================== 响应缓存 ====================
+    
+    def _cache_enabled(self, use_cache: bool) -> bool:
+        """本次调用是否使用缓存（调用参数与设置中的总开关同时允许时）"""
+        if not use_cache or self.db is None:
+            return False
+        settings = QSettings("FragMind", "AppConfig")
+        return settings.value("llm_cache_enabled", True, type=bool)
+    
+    def _model_name(self, kind: str) -> str:
+        """任务首选模型的名称（缓存键与缓存记录中使用）"""
+        return self.routes[kind][0][0].label
+    
+    def _cache_key(self, kind: str, system_prompt: str, custom_prompt: str, payload) -> str:
+        """由首选模型、系统提示词、用户自定义提示词与规范化输入计算内容寻址的缓存键"""
+        material = json.dumps(
+            [kind, self._model_name(kind), system_prompt, custom_prompt, payload],
+            ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
     
-    def is_available(self) -> bool:
-        """检查 LLM 服务是否可用"""
-        return self.model is not None
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """规范化输入文本：去掉首尾空白并合并连续空白，避免无意义的差异导致未命中"""
+        return " ".join(text.split())
     
-    def summarize_diary_entries(self, entries: List[FragMind], date: str, current_summary: str = "") -> str:
+    def _summary_cache_key(self, entries: List[FragMind], date: str,
+                           related: Optional[List[FragMind]] = None) -> str:
         """
-        总结多个日记片段为一篇完整日记
+        日记总结的缓存键
+        参考日记只影响文风，不计入键：片段未变时再次生成直接返回已有结果；附带的往日相关片段计入键
         """
-        if not self.is_available():
-            return "LLM 服务未配置，无法生成总结。\n\n" + "\n\n".join([e.content for e in entries])
-        
-        if not entries and not current_summary:
-            return "今天还没有任何记录。"
-        
-        # 构建 prompt
-        entries_text = "\n\n".join([
+        payload = {
+            "date": date,
+            "entries": [
+                [e.created_at.strftime('%H:%M'), self._normalize(e.content)]
+                for e in sorted(entries, key=lambda x: x.created_at)
+            ],
+        }
+        if related:
+            payload["related"] = [[e.date, self._normalize(e.content)] for e in related]
+        return self._cache_key("summary", SUMMARY_SYSTEM_PROMPT, self._custom_prompt(), payload)
+    
+    def _todo_cache_key(self, text: str, now: datetime) -> str:
+        """待办提取的缓存键；相对时间依赖当天日期，因此日期计入键"""
+        payload = {"today": now.strftime('%Y-%m-%d'), "text": self._normalize(text)}
+        return self._cache_key("todo", TODO_SYSTEM_PROMPT, "", payload)
+    
+    async def _cache_get(self, key: str, kind: str) -> Optional[str]:
+        """查询缓存，数据库出错时按未命中处理"""
+        try:
+            return await self.db.get_llm_cache(key, kind)
+        except Exception as e:
+            print(f"读取 LLM 缓存失败：{e}")
+            return None
+    
+    async def _cache_put(self, key: str, kind: str, value: str, tokens: int):
+        """写入缓存，记录生成该结果消耗的 token 以便统计节省量"""
+        try:
+            await self.db.put_llm_cache(key, kind, self._model_name(kind), value, tokens)
+        except Exception as e:
+            print(f"写入 LLM 缓存失败：{e}")
+    
+    def _format_entries(self, entries: List[FragMind]) -> str:
+        """按时间顺序格式化日记片段"""
+        return "\n\n".join([
             f"[{e.created_at.strftime('%H:%M')}] {e.content}"
             for e in sorted(entries, key=lambda x: x.created_at)
         ])
-        
-        # 获取用户自定义 Prompt
+    
+    @staticmethod
+    def _custom_prompt() -> str:
+        """读取用户自定义总结 Prompt"""
         settings = QSettings("FragMind", "AppConfig")
-        user_custom_prompt = settings.value("summary_prompt", "")
-        
-        prompt = f"""请将用户今天（{date}）零散记录的多条碎片化想法，整理成一篇流畅、连贯的日记。
-
-请遵循以下原则：
-1. 保留用户原有的情绪与观点，不夸大、不编造
-2. 用第一人称书写，风格克制、连贯、自然、有一定的文学性、可按时间或逻辑组织
-3. 不进行心理诊断或说教式分析，保持温和的自我反思视角。
-4. 如果有重复或相似的内容，进行适当合并，避免冗余。
-"""
+        return settings.value("summary_prompt", "")
+    
+    def _summary_system_prompt(self) -> str:
+        """总结 Agent 的系统提示词：固定规则 + 用户自定义风格，在各次请求间保持不变"""
+        custom_prompt = self._custom_prompt()
+        if custom_prompt:
+            return SUMMARY_SYSTEM_PROMPT + CUSTOM_PROMPT_TEMPLATE.format(custom_prompt=custom_prompt)
+        return SUMMARY_SYSTEM_PROMPT
+    
+    def _build_summary_prompt(self, entries: List[FragMind], date: str, current_summary: str = "") -> str:
+        """构建日记总结 prompt（片段在前、参考日记在后，追加片段时前缀不变）"""
+        prompt = f"""【任务】整理日记
+【日期】{date}
 
-        if user_custom_prompt:
-            prompt += f"""
-【用户额外指令】：
-{user_custom_prompt}
-请务必在遵循上述基本原则的同时，优先满足用户的这条额外指令。
+【今日所有有效片段】（唯一事实来源）：
+{self._format_entries(entries)}
 """
-
         if current_summary:
             prompt += f"""
-5. **重要：重写模式**。
-用户可能修改或删除了部分原始片段。
-请以**下方的【今日所有有效片段】为唯一事实依据**重新生成日记。
-【参考日记】仅用于参考文风和语调，**绝对不要**保留【参考日记】中存在但【今日所有有效片段】中不存在的信息。
-
 【参考日记】（仅供文风参考）：
 {current_summary}
+"""
+        return prompt
+    
+    def _build_incremental_prompt(self, date: str, current_summary: str, delta: SummaryDelta) -> str:
+        """构建增量更新 prompt：只发送已有日记与变化的片段"""
+        prompt = f"""【任务】更新日记
+【日期】{date}
 
-【今日所有有效片段】（唯一事实来源）：
-{entries_text}
+【已有日记】：
+{current_summary}
+"""
+        if delta.added:
+            prompt += f"""
+【新增片段】：
+{self._format_entries(delta.added)}
 """
-        else:
+        if delta.edited:
             prompt += f"""
-【今日所有有效片段】：
-{entries_text}
+【修改后的片段】：
+{self._format_entries(delta.edited)}
+"""
+        return prompt
+    
+    @staticmethod
+    def _build_related_prompt(related: List[FragMind]) -> str:
+        """附在总结 prompt 末尾的往日相关片段（放在最后，不影响前面的前缀缓存）"""
+        lines = "\n\n".join(f"[{e.date} {e.created_at.strftime('%H:%M')}] {e.content}" for e in related)
+        return f"""
+【往日相关片段】（仅供联想，不是今天的事）：
+{lines}
+"""
+    
+    def _split_windows(self, entries: List[FragMind]) -> List[List[FragMind]]:
+        """按时间顺序把片段切成若干窗口，每个窗口的估算 token 数不超过 chunk_tokens"""
+        windows: List[List[FragMind]] = []
+        current: List[FragMind] = []
+        current_tokens = 0
+        for e in sorted(entries, key=lambda x: x.created_at):
+            tokens = estimate_tokens(e.content) + 4
+            if current and current_tokens + tokens > self.chunk_tokens:
+                windows.append(current)
+                current, current_tokens = [], 0
+            current.append(e)
+            current_tokens += tokens
+        if current:
+            windows.append(current)
+        return windows
+    
+    @staticmethod
+    def _window_label(window: List[FragMind]) -> str:
+        """时间窗口标签，如 08:00–11:30"""
+        return f"{window[0].created_at.strftime('%H:%M')}–{window[-1].created_at.strftime('%H:%M')}"
+    
+    def _build_map_prompt(self, window: List[FragMind], date: str, index: int, total: int) -> str:
+        """分段总结的 map 阶段：把一个时间窗口的片段提炼为纪要"""
+        return f"""【任务】时段纪要
+【日期】{date}
+【时段】{self._window_label(window)}（第 {index}/{total} 段）
+
+【片段】：
+{self._format_entries(window)}
+"""
+    
+    def _build_reduce_prompt(self, date: str, partials: List[Tuple[str, str]]) -> str:
+        """分段总结的 reduce 阶段：把各时段纪要合成为一篇日记"""
+        sections = "\n\n".join(f"【{label}】\n{text}" for label, text in partials)
+        return f"""【任务】合成日记
+【日期】{date}
+
+【各时段纪要】：
+{sections}
+"""
+    
+    def _build_rollup_prompt(self, title: str, source: str, sections: List[Tuple[str, str]]) -> str:
+        """阶段回顾：把各日日记或下一级回顾提炼为一篇回顾"""
+        body = "\n\n".join(f"【{label}】\n{text}" for label, text in sections)
+        return f"""【任务】阶段回顾
+【时间】{title}
+
+【{source}】：
+{body}
 """
+    
+    @staticmethod
+    def _flight_key(kind: str, prompt: str) -> str:
+        """相同 prompt 的请求在队列中只发出一次"""
+        return f"{kind}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+    
+    async def _run_agent(self, name: str, task: str, agent: Agent, prompt: str):
+        """
+        按任务路由执行一次 Agent 调用：首选模型失败时依次改用备选模型，全部失败时抛出最后一个错误
+        每次尝试都记录耗时、token 用量或失败原因
+        """
+        routes = self.routes[task]
+        for i, (route, model) in enumerate(routes):
+            started = time.perf_counter()
+            try:
+                result = await agent.run(prompt, model=model, model_settings={"timeout": route.timeout})
+            except Exception as e:
+                await self._log_call(name, route, started, error=e)
+                if i == len(routes) - 1:
+                    raise
+                continue
+            await self._log_call(name, route, started, _run_usage(result))
+            return result
+    
+    async def _stream_agent(self, name: str, task: str, agent: Agent, prompt: str,
+                            parts: List[str], usages: list) -> AsyncIterator[str]:
+        """
+        流式执行 Agent 调用并逐段产出新增文本（同时追加到 parts），完成后把 token 用量追加到 usages
+        已经产出文本后出错不再改用备选模型，直接抛出
+        """
+        routes = self.routes[task]
+        for i, (route, model) in enumerate(routes):
+            started = time.perf_counter()
+            try:
+                async with agent.run_stream(prompt, model=model, model_settings={"timeout": route.timeout}) as result:
+                    # 不做防抖，首个 token 到达即产出；合并重绘交给界面层
+                    async for delta in result.stream_text(delta=True, debounce_by=None):
+                        parts.append(delta)
+                        yield delta
+                    usage = _run_usage(result)
+            except Exception as e:
+                await self._log_call(name, route, started, error=e)
+                if parts or i == len(routes) - 1:
+                    raise
+                continue
+            await self._log_call(name, route, started, usage)
+            usages.append(usage)
+            return
+    
+    async def _log_call(self, name: str, route: ModelRoute, started: float, usage=None,
+                        error: Optional[Exception] = None):
+        """记录一次模型调用：耗时、输入 token、其中命中服务端前缀缓存的 token、输出 token，或失败原因"""
+        if self.db is None:
+            return
+        latency_ms = (time.perf_counter() - started) * 1000
+        try:
+            if error is not None:
+                await self.db.log_llm_call(
+                    name, route.label, latency_ms, 0, 0, 0, status="error", error=f"{type(error).__name__}: {error}"
+                )
+            else:
+                await self.db.log_llm_call(
+                    name, route.label, latency_ms,
+                    usage.input_tokens, _cache_hit_tokens(usage), usage.output_tokens
+                )
+        except Exception as e:
+            print(f"记录 LLM 调用失败：{e}")
+    
+    async def _map_windows(self, entries: List[FragMind], date: str,
+                           priority: int = PRIORITY_USER) -> Tuple[List[Tuple[str, str]], int, int]:
+        """
+        并发提炼各时间窗口，并发数受 max_parallel_chunks 限制
+        :return: ([(时段标签, 纪要)], map 阶段 prompt 估算 token 数, 实际消耗 token 数)
+        """
+        windows = self._split_windows(entries)
+        semaphore = asyncio.Semaphore(self.max_parallel_chunks)
+        prompts = [self._build_map_prompt(w, date, i + 1, len(windows)) for i, w in enumerate(windows)]
+        
+        async def summarize_window(prompt: str):
+            async with semaphore:
+                return await self.queue.run(
+                    lambda: self._run_agent("map", "summary", self.summary_agent, prompt), self._flight_key("map", prompt), priority
+                )
+        
+        results = await asyncio.gather(*(summarize_window(p) for p in prompts))
+        partials = [(self._window_label(w), r.output) for w, r in zip(windows, results)]
+        prompt_tokens = sum(estimate_tokens(p) for p in prompts)
+        used_tokens = sum(_run_usage(r).total_tokens for r in results)
+        return partials, prompt_tokens, used_tokens
+    
+    async def _prepare_summary_prompt(self, entries: List[FragMind], date: str, current_summary: str,
+                                      sources: Optional[Dict[int, str]], priority: int = PRIORITY_USER,
+                                      related: Optional[List[FragMind]] = None) -> Tuple[str, str, int, int, int]:
+        """
+        选择生成方式并准备最终请求的 prompt
+        - incremental：有已有日记与来源记录、没有删除片段且变化比例不大时，只发送变化的片段；
+          删除的片段只有哈希、无法告诉模型该删掉哪些内容，因此退回全量
+        - chunked：全量 prompt 超过 chunk_threshold_tokens 时，先并发提炼各时间窗口（map），
+          最终请求只包含各时段纪要（reduce）；此时不再附带参考日记
+        - full：其余情况全量重写
+        三种方式下 related（往日相关片段）都附在最终请求的末尾
+        :return: (最终 prompt, 生成方式, 全部请求的 prompt 估算 token 数, 全量 prompt 估算 token 数,
+                  map 阶段实际消耗的 token 数)
+        """
+        extra = self._build_related_prompt(related) if related else ""
+        extra_tokens = estimate_tokens(extra) if extra else 0
+        full_prompt = self._build_summary_prompt(entries, date, current_summary)
+        full_tokens = estimate_tokens(full_prompt)
+        if current_summary and sources:
+            delta = compute_summary_delta(entries, sources)
+            changed = len(delta.added) + len(delta.edited)
+            if (not delta.deleted_ids and changed
+                    and changed <= len(entries) * INCREMENTAL_MAX_CHANGE_RATIO):
+                prompt = self._build_incremental_prompt(date, current_summary, delta) + extra
+                return prompt, "incremental", estimate_tokens(prompt), full_tokens + extra_tokens, 0
+        if full_tokens > self.chunk_threshold_tokens and len(entries) > 1:
+            partials, map_tokens, map_used = await self._map_windows(entries, date, priority)
+            prompt = self._build_reduce_prompt(date, partials) + extra
+            return prompt, "chunked", map_tokens + estimate_tokens(prompt), full_tokens + extra_tokens, map_used
+        return full_prompt + extra, "full", full_tokens + extra_tokens, full_tokens + extra_tokens, 0
+    
+    async def _log_generation(self, date: str, mode: str, prompt_tokens: int, full_tokens: int):
+        """记录本次生成的方式与 prompt 大小"""
+        if self.db is None:
+            return
+        try:
+            await self.db.log_summary_generation(date, mode, prompt_tokens, full_tokens)
+        except Exception as e:
+            print(f"记录总结生成信息失败：{e}")
+    
+    async def asummarize(self, entries: List[FragMind], date: str, current_summary: str = "",
+                         sources: Optional[Dict[int, str]] = None, use_cache: bool = True,
+                         priority: int = PRIORITY_USER, raise_errors: bool = False,
+                         related: Optional[List[FragMind]] = None) -> str:
+        """
+        总结多个日记片段为一篇完整日记
+        片段未变化时直接返回缓存结果；use_cache=False 时强制重新生成
+        传入已有总结的来源片段记录（sources）时，变化较小则只发送增量片段；
+        片段过多时自动分段并发提炼后再合成
+        请求按 priority 在队列中排队，相同 prompt 的并发请求只发出一次
+        related 为附带的往日相关片段，仅供模型联想
+        出错时返回附带原始内容的错误说明；raise_errors=True 时改为抛出异常（供后台重试使用）
+        """
+        if not self.is_available():
+            return "LLM 服务未配置，无法生成总结。\n\n" + "\n\n".join([e.content for e in entries])
+        
+        if not entries and not current_summary:
+            return "今天还没有任何记录。"
+        
+        cache_key = None
+        if self._cache_enabled(use_cache):
+            cache_key = self._summary_cache_key(entries, date, related)
+            cached = await self._cache_get(cache_key, "summary")
+            if cached is not None:
+                return cached
         
         try:
-            result = self.summary_agent.run_sync(prompt)
+            prompt, mode, prompt_tokens, full_tokens, map_used = await self._prepare_summary_prompt(
+                entries, date, current_summary, sources, priority, related
+            )
+            result = await self.queue.run(
+                lambda: self._run_agent("summary", "summary", self.summary_agent, prompt),
+                self._flight_key("summary", prompt), priority
+            )
+            if cache_key:
+                await self._cache_put(cache_key, "summary", result.output, map_used + _run_usage(result).total_tokens)
+            await self._log_generation(date, mode, prompt_tokens, full_tokens)
             return result.output
         
         except Exception as e:
-            return f"生成总结时出错：{str(e)}\n\n原始内容：\n{entries_text}"
+            if raise_errors:
+                raise
+            return f"生成总结时出错：{str(e)}\n\n原始内容：\n{self._format_entries(entries)}"
     
-    def parse_todo_from_text(self, text: str, existing_titles: List[str] = None) -> List[TodoItem]:
+    async def astream_summary(self, entries: List[FragMind], date: str, current_summary: str = "",
+                              sources: Optional[Dict[int, str]] = None, use_cache: bool = True,
+                              priority: int = PRIORITY_USER,
+                              related: Optional[List[FragMind]] = None) -> AsyncIterator[str]:
         """
-        从自然语言中解析待办事项
+        流式生成日记总结，逐段产出新增文本（增量与分段规则同 asummarize，分段时只有最终合成阶段是流式的）
+        调用方取消（关闭生成器或取消任务）时随之关闭底层 HTTP 流；出错时抛出异常
+        缓存命中时一次性产出完整结果；只有完整生成的结果才写入缓存
         """
         if not self.is_available():
+            yield "LLM 服务未配置，无法生成总结。\n\n" + "\n\n".join([e.content for e in entries])
+            return
+        
+        if not entries and not current_summary:
+            yield "今天还没有任何记录。"
+            return
+        
+        cache_key = None
+        if self._cache_enabled(use_cache):
+            cache_key = self._summary_cache_key(entries, date, related)
+            cached = await self._cache_get(cache_key, "summary")
+            if cached is not None:
+                yield cached
+                return
+        
+        prompt, mode, prompt_tokens, full_tokens, map_used = await self._prepare_summary_prompt(
+            entries, date, current_summary, sources, priority, related
+        )
+        parts: List[str] = []
+        usages = []
+        # 流式请求无法与其他调用方共享，只占用队列名额
+        async with self.queue.slot(priority):
+            stream = self._stream_agent("summary", "summary", self.summary_agent, prompt, parts, usages)
+            try:
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+        if cache_key:
+            await self._cache_put(cache_key, "summary", "".join(parts), map_used + usages[0].total_tokens)
+        await self._log_generation(date, mode, prompt_tokens, full_tokens)
+    
+    async def asummarize_period(self, title: str, source: str, sections: List[Tuple[str, str]],
+                                priority: int = PRIORITY_USER) -> str:
+        """
+        生成阶段回顾（周 / 月 / 年），出错时抛出异常
+        :param title: 时间段名称，如 "2024 年 3 月（2024-03-01 至 2024-03-31）"
+        :param source: 材料的名称：各日日记 / 各月回顾
+        :param sections: 按时间顺序的 [(标签, 内容)]
+        """
+        prompt = self._build_rollup_prompt(title, source, sections)
+        result = await self.queue.run(
+            lambda: self._run_agent("rollup", "summary", self.summary_agent, prompt),
+            self._flight_key("rollup", prompt), priority
+        )
+        return result.output
+    
+    async def aparse_todos(self, text: str, use_cache: bool = True, now: Optional[datetime] = None,
+                           raise_errors: bool = False) -> List[TodoItem]:
+        """
+        从自然语言中解析待办事项
+        先经过本地规则预处理：明显没有待办的文本直接返回空列表，简单的单条待办在本地生成，
+        其余交给 Todo Agent；同一天内对相同文本的提取结果会被缓存
+        时间窗口内的多段文本合并为一次请求，相同文本的并发调用共享同一结果；
+        调用方取消时，若没有其他调用方等待，尚未发出的文本被移出批次，已发出的请求在整批都无人等待时取消
+        与已有待办的去重在写入前由 todo_dedup.dedupe_todos 完成，不把待办列表放进 prompt
+        :param now: 解析相对时间的参考时刻，默认为当前时间（重放离线任务时传入记录时刻）
+        :param raise_errors: 出错时抛出异常而不是返回空列表
+        """
+        now = now or datetime.now()
+        if self.local_todo_parser:
+            prefilter = prefilter_todo_text(text, now)
+            if not prefilter.actionable:
+                return []
+            if prefilter.todos:
+                return prefilter.todos
+        
+        if not self.is_available("todo"):
             return []
         
         try:
-            now = datetime.now()
-            current_context = f"今天是 {now.strftime('%Y年%m月%d日')} {now.strftime('%A')}。"
-            
-            prompt = f"{current_context}\n请从以下文本中提取待办事项：\n{text}"
+            key = self._todo_cache_key(text, now)
+            cache = self._cache_enabled(use_cache)
+            if cache:
+                cached = await self._cache_get(key, "todo")
+                if cached is not None:
+                    return self._todos_from_results(TodoList.model_validate_json(cached).items)
             
-            
-            result = self.todo_agent.run_sync(prompt)
-            data_list = result.output.items
-            
-            todos = []
-            for data in data_list:
-                todos.append(TodoItem(
-                    title=data.title,
-                    due_date=data.due_date
-                ))
-            return todos
+            future = self._todo_waiting.get(key)
+            if future is None:
+                future = self._enqueue_todo_text(key, text, now, cache)
+            else:
+                self.queue.record_deduplicated()
+            # 单个调用方取消不影响同一批中的其他文本
+            self._todo_waiters[key] = self._todo_waiters.get(key, 0) + 1
+            try:
+                return self._todos_from_results(await asyncio.shield(future))
+            finally:
+                self._todo_waiters[key] -= 1
+                if not self._todo_waiters[key]:
+                    del self._todo_waiters[key]
+                    if not future.done():
+                        self._abandon_todo_text(key, future)
             
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"解析 Todo 时出错：{e}")
             return []
-
+    
+    def _enqueue_todo_text(self, key: str, text: str, now: datetime, cache: bool) -> asyncio.Future:
+        """把文本加入待合并列表，窗口结束或达到批量上限时发出请求"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # 调用方都已取消时不再报告未读取的异常
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        future.add_done_callback(lambda _, key=key: self._todo_waiting.pop(key, None))
+        self._todo_waiting[key] = future
+        self._todo_pending.append(_PendingTodo(key, text, now, cache, future))
+        
+        if len(self._todo_pending) >= TODO_BATCH_MAX_TEXTS or self.todo_batch_window <= 0:
+            self._flush_todo_batch()
+        elif self._todo_flush_handle is None:
+            self._todo_flush_handle = loop.call_later(self.todo_batch_window, self._flush_todo_batch)
+        return future
+    
+    def _abandon_todo_text(self, key: str, future: asyncio.Future):
+        """文本已无人等待：尚未发出则移出待合并列表，已发出且整批都无人等待则取消请求"""
+        pending = [p for p in self._todo_pending if p.key != key]
+        if len(pending) != len(self._todo_pending):
+            self._todo_pending = pending
+            future.cancel()
+            if not pending and self._todo_flush_handle is not None:
+                self._todo_flush_handle.cancel()
+                self._todo_flush_handle = None
+            return
+        for task, keys in self._todo_batches.items():
+            if key in keys:
+                if not any(k in self._todo_waiters for k in keys):
+                    task.cancel()
+                return
+    
+    def _flush_todo_batch(self):
+        """发出当前待合并的文本"""
+        if self._todo_flush_handle is not None:
+            self._todo_flush_handle.cancel()
+            self._todo_flush_handle = None
+        pending, self._todo_pending = self._todo_pending, []
+        # 相对时间依赖参考日期，不同日期的文本（如重放的离线任务）分开提取
+        batches: Dict[str, List[_PendingTodo]] = {}
+        for p in pending:
+            batches.setdefault(p.now.strftime('%Y-%m-%d'), []).append(p)
+        for batch in batches.values():
+            task = asyncio.ensure_future(self._run_todo_batch(batch))
+            self._todo_batches[task] = [p.key for p in batch]
+            task.add_done_callback(lambda t: self._todo_batches.pop(t, None))
+    
+    async def _run_todo_batch(self, batch: List[_PendingTodo]):
+        """一次请求提取一批文本中的待办，按文本分别返回并写入缓存"""
+        now = batch[0].now
+        # 固定的说明在前，日期与文本在后
+        current_context = f"今天是 {now.strftime('%Y年%m月%d日')} {now.strftime('%A')}。"
+        try:
+            if len(batch) == 1:
+                prompt = f"请从以下文本中提取待办事项。{current_context}\n\n{batch[0].text}"
+                result = await self.queue.run(
+                    lambda: self._run_agent("todo", "todo", self.todo_agent, prompt), priority=PRIORITY_BACKGROUND
+                )
+                groups = [result.output.items]
+            else:
+                texts = "\n\n".join(f"【文本 {i}】\n{p.text}" for i, p in enumerate(batch, 1))
+                prompt = f"请分别提取以下各段文本中的待办事项。{current_context}\n\n{texts}"
+                result = await self.queue.run(
+                    lambda: self._run_agent("todo_batch", "todo", self.todo_batch_agent, prompt), priority=PRIORITY_BACKGROUND
+                )
+                self.queue.record_batch(len(batch))
+                groups = [[] for _ in batch]
+                for item in result.output.items:
+                    if 1 <= item.index <= len(batch):
+                        groups[item.index - 1].append(TodoResult(title=item.title, due_date=item.due_date))
+        except asyncio.CancelledError:
+            for pending in batch:
+                pending.future.cancel()
+            raise
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        
+        for pending, items in zip(batch, groups):
+            if not pending.future.done():
+                pending.future.set_result(items)
+        # 批量请求的 token 按文本数平均计入各条缓存
+        tokens = _run_usage(result).total_tokens // len(batch)
+        for pending, items in zip(batch, groups):
+            if pending.cache:
+                await self._cache_put(pending.key, "todo", TodoList(items=items).model_dump_json(), tokens)
+    
+    @staticmethod
+    def _todos_from_results(data_list: List[TodoResult]) -> List[TodoItem]:
+        """将 Agent 输出转换为待办事项"""
+        todos = []
+        for data in data_list:
+            todos.append(TodoItem(
+                title=data.title,
+                due_date=data.due_date
+            ))
+        return todos
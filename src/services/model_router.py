@@ -0,0 +1,72 @@
+"""
+按任务路由模型
+每个任务（日记总结、待办提取）有一条路由：首选模型加可选的备选模型链，
+每个模型可以指向不同的 OpenAI 兼容接口（包括本地服务），并有各自的超时
+"""
+from typing import List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import httpx
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.deepseek import DeepSeekProvider
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from src.config import Config
+
+
+class ModelRoute(NamedTuple):
+    """路由中的一个模型"""
+    model: str
+    base_url: str = ""      # 为空时使用 DeepSeek 官方接口
+    timeout: float = 30.0   # 单次请求超时（秒）
+    api_key: str = ""       # 为空时使用设置中的 API Key
+
+    @property
+    def label(self) -> str:
+        """用于调用记录的名称：官方接口只记模型名，其他接口附带主机名"""
+        if not self.base_url:
+            return self.model
+        return f"{self.model}@{urlparse(self.base_url).netloc or self.base_url}"
+
+
+def parse_fallbacks(spec: str, primary: ModelRoute) -> List[ModelRoute]:
+    """解析备选模型链 "模型名[@接口地址], ..."，未写接口地址的沿用首选模型的接口"""
+    routes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, base_url = item.partition("@")
+        routes.append(primary._replace(model=model.strip(), base_url=base_url.strip() or primary.base_url))
+    return routes
+
+
+def task_routes(task: str) -> List[ModelRoute]:
+    """读取任务的路由配置：[首选模型, 备选模型...]"""
+    options = Config.LLM_ROUTES.get(task, {})
+    primary = ModelRoute(
+        model=options.get("model") or Config.LLM_MODEL,
+        base_url=options.get("base_url") or Config.LLM_BASE_URL,
+        timeout=float(options.get("timeout") or Config.LLM_TIMEOUT_SECONDS),
+        api_key=options.get("api_key", ""),
+    )
+    return [primary] + parse_fallbacks(options.get("fallbacks", ""), primary)
+
+
+def build_model(route: ModelRoute, api_key: Optional[str], http_client: httpx.AsyncClient,
+                has_fallback: bool = False) -> Optional[OpenAIChatModel]:
+    """
+    为路由创建模型，没有可用的 API Key 时返回 None（本地接口可不需要 Key）
+    has_fallback 为 True 时关闭客户端自带的重试，失败后尽快改用备选模型
+    """
+    api_key = route.api_key or api_key
+    if route.base_url:
+        # 本地服务通常不校验 Key，但 OpenAI 客户端要求非空
+        provider = OpenAIProvider(base_url=route.base_url, api_key=api_key or "local", http_client=http_client)
+    elif api_key:
+        provider = DeepSeekProvider(api_key=api_key, http_client=http_client)
+    else:
+        return None
+    if has_fallback:
+        provider.client.max_retries = 0
+    return OpenAIChatModel(route.model, provider=provider)
@@ -0,0 +1,98 @@
+"""
+往日相关片段
+包装本地的 RelatedIndex：启动时与数据库比对同步，片段增删改后增量更新，
+按正在输入的文本或当天的片段查找相关的往日片段（不调用任何远程接口）
+索引的计算与同步时的数据库遍历都在后台线程中进行，事件循环中只做 await
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from src.database import RelatedIndex
+from src.models import FragMind
+
+
+class RelatedFragments:
+    """
+    相关片段服务
+    - 索引的更新与同步在单一线程中串行执行，查询在另一线程中执行，同步期间查询不必排队
+    - 同步在写线程中按 id 键集分页流式读取数据库，期间的增量更新排在同步之后，不会被过期内容覆盖
+    - 索引打开之前的查询返回空结果、更新直接忽略（随后的同步会从数据库读到这些修改）
+    """
+
+    # 同步时每次从数据库读取的片段数
+    SYNC_PAGE_SIZE = 5000
+
+    def __init__(self, db, directory):
+        """
+        :param db: AsyncDatabaseManager
+        :param directory: 索引文件所在目录
+        """
+        self.db = db
+        self.directory = Path(directory)
+        self.index: Optional[RelatedIndex] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fragmind-related-writer")
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fragmind-related-reader")
+        # 关闭时让进行中的同步在当前批次后结束（首次建立大索引可能需要数十秒），下次启动继续
+        self._closing = False
+
+    async def _write(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(func, *args))
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, functools.partial(func, *args))
+
+    async def start(self) -> Tuple[int, int]:
+        """打开索引并与数据库同步，返回 (新增或更新的条数, 移除的条数)"""
+        if self.index is None:
+            self.index = await self._write(RelatedIndex, self.directory)
+        # 直接使用同步的 DatabaseManager：遍历在索引写线程中进行（该线程持有自己的只读连接）
+        db = self.db.db
+        return await self._write(
+            self.index.sync, lambda: db.iter_fragment_texts(self.SYNC_PAGE_SIZE), lambda: self._closing
+        )
+
+    # ==================== 增量更新 ====================
+
+    async def upsert(self, entry_id: int, content: str, date: str):
+        """片段新增或修改后更新索引"""
+        if self.index is None:
+            return
+        await self._write(self.index.upsert, entry_id, content, date)
+
+    async def remove(self, entry_id: int):
+        """片段删除后移出索引"""
+        if self.index is None:
+            return
+        await self._write(self.index.remove, entry_id)
+
+    # ==================== 查询 ====================
+
+    async def related(self, text: str, limit: int = 5, before: Optional[str] = None,
+                      exclude: Iterable[int] = ()) -> List[FragMind]:
+        """
+        与文本最相关的往日片段，按相关度从高到低
+        :param before: 只返回该日期（YYYY-MM-DD）之前的片段
+        """
+        if self.index is None or not text.strip():
+            return []
+        hits = await self._read(self.index.query, text, limit, before, tuple(exclude))
+        return await self.db.get_frag_minds_by_ids([entry_id for entry_id, _ in hits])
+
+    async def on_this_day(self, date: str, limit: int = 10) -> List[FragMind]:
+        """那年今日：往年同月同日的片段，由近及远"""
+        if self.index is None:
+            return []
+        return await self.db.get_frag_minds_by_ids(await self._read(self.index.on_this_day, date, limit))
+
+    def close(self):
+        """等待排队中的更新完成后写回索引"""
+        self._closing = True
+        self._reader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        if self.index is not None:
+            self.index.close()
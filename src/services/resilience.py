@@ -0,0 +1,114 @@
+"""
+LLM 请求的失败处理
+- is_transient_error：区分可重试的失败（断网、超时、限流、服务端错误）与不可重试的失败（如密钥错误）
+- backoff_delay：带抖动的指数退避
+- CircuitBreaker：连续失败后暂停请求，冷却后放行一个试探请求
+"""
+import asyncio
+import random
+import time
+from typing import Callable, List, Optional
+
+import httpx
+from pydantic_ai.exceptions import ModelAPIError, ModelHTTPError
+
+from src.config import Config
+
+
+# 视为暂时性失败的 HTTP 状态码
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝发出请求"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"AI 服务暂时不可用，{retry_after:.0f} 秒后重试")
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """是否为可重试的暂时性失败"""
+    if isinstance(error, ModelHTTPError):
+        return error.status_code in TRANSIENT_STATUS_CODES or error.status_code >= 500
+    return isinstance(error, (ModelAPIError, CircuitOpenError, httpx.TransportError,
+                              asyncio.TimeoutError, OSError))
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """
+    第 attempt 次失败后的等待秒数（attempt 从 1 开始）
+    指数增长并封顶，取其一半加上随机抖动，避免多个任务同时重试
+    """
+    base = Config.LLM_RETRY_BASE_SECONDS if base is None else base
+    cap = Config.LLM_RETRY_MAX_SECONDS if cap is None else cap
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    - closed：正常放行，连续暂时性失败达到 failure_threshold 次后打开
+    - open：拒绝请求，reset_timeout 秒后进入 half_open
+    - half_open：只放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold or Config.LLM_BREAKER_FAILURES
+        self.reset_timeout = Config.LLM_BREAKER_RESET_SECONDS if reset_timeout is None else reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        """距离可以再次尝试的秒数，未熔断时为 0"""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def before_request(self):
+        """发出请求前调用，熔断期间抛出 CircuitOpenError"""
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise CircuitOpenError(self.retry_after() or self.reset_timeout)
+        if state == "half_open":
+            self._probing = True
+
+    def record_success(self):
+        recovered = self._opened_at is not None
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        if recovered:
+            for listener in list(self._listeners):
+                listener()
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+    def release_probe(self):
+        """试探请求被取消、没有得出结果时归还试探名额"""
+        self._probing = False
+
+    def add_recovery_listener(self, listener: Callable[[], None]):
+        """熔断恢复（试探请求成功）时回调"""
+        self._listeners.append(listener)
+
+    def remove_recovery_listener(self, listener: Callable[[], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
@@ -0,0 +1,131 @@
+"""
+周 / 月 / 年回顾
+回顾不直接读取原始片段，而是逐级由已生成的总结提炼：
+- 周、月回顾由区间内的每日总结生成
+- 年回顾由 12 个月回顾生成，年度回顾因此只需约 12 次短请求加 1 次合成
+每个回顾保存生成时依据的每日总结或月回顾的内容哈希，读取时与当前内容比对：
+只有参与的某一天的总结变化后，对应的周、月回顾（以及所在的年回顾）才会重新生成
+"""
+import asyncio
+import calendar
+import hashlib
+from datetime import date as date_type, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.models import RollupSummary
+from .llm_queue import PRIORITY_USER
+from .llm_service import LLMService
+
+
+PERIODS = ("week", "month", "year")
+PERIOD_NAMES = {"week": "周", "month": "月", "year": "年"}
+
+
+def text_hash(text: str) -> str:
+    """规范化文本的内容哈希"""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def period_key(period: str, date: str) -> str:
+    """日期所在时间段的键：周为 ISO 周（2024-W03），月为 2024-03，年为 2024"""
+    day = date_type.fromisoformat(date)
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == "month":
+        return day.strftime("%Y-%m")
+    if period == "year":
+        return str(day.year)
+    raise ValueError(f"未知的时间段：{period}")
+
+
+def period_range(period: str, key: str) -> Tuple[str, str]:
+    """时间段的起止日期（含）"""
+    if period == "week":
+        year, week = key.split("-W")
+        start = date_type.fromisocalendar(int(year), int(week), 1)
+        return start.isoformat(), (start + timedelta(days=6)).isoformat()
+    if period == "month":
+        year, month = map(int, key.split("-"))
+        return f"{key}-01", f"{key}-{calendar.monthrange(year, month)[1]:02d}"
+    if period == "year":
+        return f"{key}-01-01", f"{key}-12-31"
+    raise ValueError(f"未知的时间段：{period}")
+
+
+def period_title(period: str, key: str) -> str:
+    """时间段的名称，如 2024 年第 3 周（2024-01-15 至 2024-01-21）"""
+    start, end = period_range(period, key)
+    if period == "week":
+        year, week = key.split("-W")
+        return f"{year} 年第 {int(week)} 周（{start} 至 {end}）"
+    if period == "month":
+        year, month = key.split("-")
+        return f"{year} 年 {int(month)} 月"
+    return f"{key} 年"
+
+
+class RollupBuilder:
+    """按需生成并缓存周 / 月 / 年回顾"""
+
+    def __init__(self, db, service: Callable[[], LLMService], priority: int = PRIORITY_USER):
+        """
+        :param db: AsyncDatabaseManager
+        :param service: 返回当前 LLMService 的函数
+        :param priority: 请求在队列中的优先级
+        """
+        self.db = db
+        self._service = service
+        self.priority = priority
+        # 同一时间段的并发请求共享一次生成（如年回顾与单独查看的月回顾）
+        self._building: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def build(self, period: str, key: str) -> Optional[RollupSummary]:
+        """
+        返回时间段的最新回顾：来源未变化时直接使用保存的结果，否则逐级重新生成并保存
+        区间内还没有任何每日总结时返回 None；生成出错时抛出异常
+        """
+        target = (period, key)
+        future = self._building.get(target)
+        if future is None:
+            future = asyncio.ensure_future(self._build(period, key))
+            self._building[target] = future
+            # 调用方都已取消时不再报告未读取的异常
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            future.add_done_callback(lambda _: self._building.pop(target, None))
+        return await asyncio.shield(future)
+
+    async def _sources(self, period: str, key: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """生成回顾的材料：(材料名称, 按时间顺序的 [(标签或键, 内容)])"""
+        start, end = period_range(period, key)
+        if period == "year":
+            months = [f"{key}-{month:02d}" for month in range(1, 13)]
+            rollups = await asyncio.gather(*(self.build("month", m) for m in months))
+            return "各月回顾", [(r.period_key, r.summary) for r in rollups if r is not None]
+        summaries = await self.db.get_summaries_between(start, end)
+        return "各日日记", [(s.date, s.summary) for s in summaries if s.summary.strip()]
+
+    async def _build(self, period: str, key: str) -> Optional[RollupSummary]:
+        """比对来源哈希，变化时重新生成并保存"""
+        source, sections = await self._sources(period, key)
+        if not sections:
+            return None
+        sources = {label: text_hash(text) for label, text in sections}
+        current = await self.db.get_rollup_summary(period, key)
+        if current is not None and current.source_summaries == sources:
+            return current
+
+        if period == "year":
+            sections = [(period_title("month", label), text) for label, text in sections]
+        summary = await self._service().asummarize_period(period_title(period, key), source, sections, self.priority)
+        start, end = period_range(period, key)
+        rollup = RollupSummary(
+            period=period,
+            period_key=key,
+            start_date=start,
+            end_date=end,
+            summary=summary,
+            source_summaries=sources
+        )
+        await self.db.save_rollup_summary(rollup)
+        return rollup
@@ -0,0 +1,309 @@
+"""
+本地时间与计划解析
+在调用 Todo Agent 之前，用确定性的规则识别中文时间表达（今晚八点、明天下午、下周三、周末…）
+与计划语气，并解析为相对当前时间的具体时刻：
+- 既没有将来的时间、也没有计划语气的文本直接判定为无待办，不调用 LLM
+- 只有一句话、一个时间、一件事的简单情况直接生成 TodoItem
+- 其余情况交给 Todo Agent
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from typing import List, NamedTuple, Optional
+
+from src.models import TodoItem
+
+
+# 只给出日期、没有给出时刻时使用的默认时刻
+DEFAULT_DUE_HOUR = 9
+
+# 时段词及其默认时刻
+PERIOD_HOURS = {
+    "凌晨": 5, "早上": 8, "早晨": 8, "上午": 9, "中午": 12,
+    "下午": 15, "傍晚": 18, "晚上": 20, "夜里": 22, "半夜": 23,
+}
+# 这些时段中的 1~11 点按下午/晚上理解
+_PM_PERIODS = {"下午", "傍晚", "晚上", "夜里", "半夜"}
+
+# 相对日期词
+DAY_OFFSETS = {
+    "今天": 0, "今日": 0, "今儿": 0,
+    "明天": 1, "明日": 1, "明儿": 1,
+    "后天": 2, "大后天": 3,
+}
+# 日期与时段合写的词
+DAY_PERIODS = {
+    "今早": (0, "早上"), "今晚": (0, "晚上"), "今夜": (0, "夜里"),
+    "明早": (1, "早上"), "明晚": (1, "晚上"),
+}
+
+_WEEKDAYS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "日": 7, "天": 7}
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+_NUM = r"(?:\d{1,2}|[零〇一二两三四五六七八九十]{1,3})"
+
+# 时间表达的基本单元，相邻单元（中间无其他字符）合并为一个时间表达
+_ATOM_RE = re.compile(
+    rf"(?P<rel>(?P<rel_n>{_NUM}|半)个?(?P<rel_unit>天|小时|钟头|分钟)(?:以?后|之后))"
+    rf"|(?P<date>(?:(?P<year>\d{{4}})年)?(?P<month>{_NUM})月(?P<mday>{_NUM})[日号])"
+    rf"|(?P<day_period>{'|'.join(DAY_PERIODS)})"
+    rf"|(?P<day>{'|'.join(sorted(DAY_OFFSETS, key=len, reverse=True))})"
+    r"|(?P<week>(?P<week_prefix>下下个?|下个?|这个?|本)?(?:周|星期|礼拜)(?P<weekday>[一二三四五六日天]))"
+    r"|(?P<weekend>(?P<weekend_prefix>下个?|这个?|本)?周末)"
+    rf"|(?P<only_mday>(?P<only_mday_n>{_NUM})号)"
+    rf"|(?P<period>{'|'.join(PERIOD_HOURS)})"
+    rf"|(?P<clock>(?P<hour>{_NUM})(?:点钟?|:|：)(?P<minute>半|一刻|三刻|\d{{1,2}}|{_NUM})?分?)"
+)
+
+# 计划 / 待办语气
+_PLAN_RE = re.compile(
+    r"记得|别忘|不要忘|提醒我?|打算|计划|准备|想去|要去|得去|需要|必须|要把|得把|"
+    r"约了|约好|预约|安排|截止|报名|deadline|ddl|待办",
+    re.IGNORECASE,
+)
+# 已完成语气
+_PAST_RE = re.compile(r"已经|刚刚|刚才|了[。！!，,]?$")
+# 描述状态 / 感受的语气，没有计划语气时多半不是待办
+_DESCRIPTIVE_RE = re.compile(r"有点|有些|很|真|太|挺|好像|感觉|觉得")
+# 一句话中包含多件事的连接词
+_MULTI_TASK_RE = re.compile(r"然后|还要|另外|以及|顺便|再去|、")
+# 分句
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+")
+# 标题开头的主语与语气词
+_TITLE_PREFIX_RE = re.compile(
+    r"^(?:[，,\s]|我们|我|咱们|要|得|记得|别忘了|别忘|不要忘了|需要|必须|准备|打算|计划|提醒我?|还要|一定要|的)+"
+)
+_TITLE_SUFFIX_RE = re.compile(r"[，,。！!～~\s吧呀啊哦呢]+$")
+
+
+class TimeExpression(NamedTuple):
+    """一个解析出的时间表达"""
+    start: int
+    end: int
+    text: str
+    when: datetime
+    has_time: bool      # 是否给出了时刻（时段或钟点），否则 when 取默认时刻
+    is_future: bool     # 是否明确指向将来
+
+
+class TodoPrefilter(NamedTuple):
+    """本地预处理结论"""
+    actionable: bool                    # 可能包含待办，需要继续处理
+    todos: Optional[List[TodoItem]]     # 简单情况下本地直接生成的待办；None 表示需要交给 LLM
+    expressions: List[TimeExpression]
+
+
+def cn_to_int(text: str) -> Optional[int]:
+    """解析 0~99 的阿拉伯数字或中文数字（十五、二十三、两…）"""
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        if len(tens) > 1 or len(ones) > 1:
+            return None
+        tens_value = _CN_DIGITS.get(tens, None) if tens else 1
+        ones_value = _CN_DIGITS.get(ones, None) if ones else 0
+        if tens_value is None or ones_value is None:
+            return None
+        return tens_value * 10 + ones_value
+    if len(text) == 1:
+        return _CN_DIGITS.get(text)
+    return None
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    """构造日期，非法日期返回 None"""
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _resolve_weekday(prefix: Optional[str], weekday: int, today: date) -> date:
+    """解析 周X / 下周X / 这周X；无前缀时取今天起最近的一个"""
+    monday = today - timedelta(days=today.weekday())
+    prefix = (prefix or "").rstrip("个")
+    if prefix.startswith("下下"):
+        return monday + timedelta(weeks=2, days=weekday - 1)
+    if prefix.startswith("下"):
+        return monday + timedelta(weeks=1, days=weekday - 1)
+    target = monday + timedelta(days=weekday - 1)
+    if not prefix and target < today:
+        target += timedelta(weeks=1)
+    return target
+
+
+def _resolve_minute(text: Optional[str]) -> Optional[int]:
+    """解析钟点后的分钟部分"""
+    if not text:
+        return 0
+    return {"半": 30, "一刻": 15, "三刻": 45}.get(text, cn_to_int(text))
+
+
+def _resolve_group(atoms: List[re.Match], now: datetime) -> Optional[datetime]:
+    """把一组相邻的时间单元解析为具体时刻，无法解析时返回 None"""
+    today = now.date()
+    day: Optional[date] = None
+    period: Optional[str] = None
+    hour: Optional[int] = None
+    minute = 0
+
+    for m in atoms:
+        kind = m.lastgroup
+        if kind == "rel":
+            n = 0.5 if m.group("rel_n") == "半" else cn_to_int(m.group("rel_n"))
+            if n is None:
+                return None
+            unit = m.group("rel_unit")
+            if unit == "天":
+                return datetime.combine(today + timedelta(days=int(n)), time(DEFAULT_DUE_HOUR))
+            delta = timedelta(minutes=n) if unit == "分钟" else timedelta(hours=n)
+            return (now + delta).replace(second=0, microsecond=0)
+        if kind == "date":
+            year = int(m.group("year")) if m.group("year") else today.year
+            month, mday = cn_to_int(m.group("month")), cn_to_int(m.group("mday"))
+            day = _safe_date(year, month, mday) if month and mday else None
+            if day is None:
+                return None
+        elif kind == "only_mday":
+            mday = cn_to_int(m.group("only_mday_n"))
+            day = _safe_date(today.year, today.month, mday) if mday else None
+            if day is not None and day < today:
+                # 已过去的号数指下个月
+                next_month = today.replace(day=1) + timedelta(days=32)
+                day = _safe_date(next_month.year, next_month.month, mday)
+            if day is None:
+                return None
+        elif kind == "day":
+            day = today + timedelta(days=DAY_OFFSETS[m.group("day")])
+        elif kind == "day_period":
+            offset, period = DAY_PERIODS[m.group("day_period")]
+            day = today + timedelta(days=offset)
+        elif kind == "week":
+            day = _resolve_weekday(m.group("week_prefix"), _WEEKDAYS[m.group("weekday")], today)
+        elif kind == "weekend":
+            day = _resolve_weekday(m.group("weekend_prefix"), 6, today)
+            if not m.group("weekend_prefix") and today.weekday() == 6:
+                day = today
+        elif kind == "period":
+            period = m.group("period")
+        elif kind == "clock":
+            hour = cn_to_int(m.group("hour"))
+            minute = _resolve_minute(m.group("minute"))
+            if hour is None or minute is None or hour > 24 or minute > 59:
+                return None
+
+    if hour is not None:
+        if period in _PM_PERIODS and hour < 12:
+            hour += 12
+        elif period == "中午" and hour < 6:
+            hour += 12
+        elif period is None and day is None and hour < 12 and now.hour >= hour:
+            # 只说"八点"且今天的八点已过，按晚上八点理解
+            hour += 12
+        if hour == 24:
+            hour = 0
+            day = (day or today) + timedelta(days=1)
+    elif period is not None:
+        hour = PERIOD_HOURS[period]
+
+    if day is None and hour is None:
+        return None
+    base = day or today
+    return datetime.combine(base, time(hour if hour is not None else DEFAULT_DUE_HOUR, minute))
+
+
+def _group_atoms(text: str) -> List[List[re.Match]]:
+    """把相邻（中间最多一个空格）的时间单元分组"""
+    groups: List[List[re.Match]] = []
+    for m in _ATOM_RE.finditer(text):
+        if groups and m.start() - groups[-1][-1].end() <= 1 and text[groups[-1][-1].end():m.start()].strip() == "":
+            groups[-1].append(m)
+        else:
+            groups.append([m])
+    return groups
+
+
+def _is_ambiguous_clock(atoms: List[re.Match]) -> bool:
+    """
+    孤立的中文小数字钟点（"一点"、"两点"）常见于"快一点"、"有两点想法"等非时间用法，
+    没有日期、时段或分钟修饰时不视为时间
+    """
+    if len(atoms) != 1 or atoms[0].lastgroup != "clock":
+        return False
+    m = atoms[0]
+    return not m.group("hour").isdigit() and not m.group("minute") and m.group("hour") in ("一", "两", "二", "三")
+
+
+def parse_time_expressions(text: str, now: Optional[datetime] = None) -> List[TimeExpression]:
+    """识别文本中的中文时间表达并解析为具体时刻"""
+    now = now or datetime.now()
+    expressions = []
+    for atoms in _group_atoms(text):
+        if _is_ambiguous_clock(atoms):
+            continue
+        when = _resolve_group(atoms, now)
+        if when is None:
+            continue
+        kinds = {m.lastgroup for m in atoms}
+        has_time = bool(kinds & {"clock", "period", "day_period", "rel"}) and not (
+            kinds == {"rel"} and atoms[0].group("rel_unit") == "天"
+        )
+        is_future = when > now if has_time else when.date() > now.date()
+        start, end = atoms[0].start(), atoms[-1].end()
+        expressions.append(TimeExpression(start, end, text[start:end], when, has_time, is_future))
+    return expressions
+
+
+def strip_time_expressions(text: str) -> str:
+    """去掉文本中的时间表达（不做解析），用于比较标题"""
+    return _ATOM_RE.sub("", text)
+
+
+def _make_title(sentence: str, expression: TimeExpression, offset: int) -> str:
+    """去掉时间表达、主语与语气词，得到待办标题"""
+    start, end = expression.start - offset, expression.end - offset
+    title = sentence[:start] + sentence[end:]
+    title = _TITLE_PREFIX_RE.sub("", title.strip())
+    return _TITLE_SUFFIX_RE.sub("", title)
+
+
+def prefilter_todo_text(text: str, now: Optional[datetime] = None) -> TodoPrefilter:
+    """
+    在调用 Todo Agent 之前对文本做本地判断
+    - 没有指向将来的时间、也没有计划语气 -> 不可能有待办（actionable=False）
+    - 只有一句含有待办线索、其中恰好一个将来时间、且不含多件事的连接词 -> 本地生成一个 TodoItem
+    - 其他 -> todos=None，交给 LLM
+    """
+    now = now or datetime.now()
+    expressions = parse_time_expressions(text, now)
+    future = [e for e in expressions if e.is_future]
+    has_plan = bool(_PLAN_RE.search(text))
+
+    if not future and not has_plan:
+        return TodoPrefilter(False, [], expressions)
+
+    if len(future) != 1:
+        return TodoPrefilter(True, None, expressions)
+
+    expression = future[0]
+    sentences = [(m.start(), m.group()) for m in _SENTENCE_RE.finditer(text) if m.group().strip()]
+    candidates = [
+        (offset, s) for offset, s in sentences
+        if _PLAN_RE.search(s) or any(offset <= e.start < offset + len(s) for e in future)
+    ]
+    if len(candidates) != 1:
+        return TodoPrefilter(True, None, expressions)
+
+    offset, sentence = candidates[0]
+    if not offset <= expression.start < offset + len(sentence):
+        return TodoPrefilter(True, None, expressions)
+    if _MULTI_TASK_RE.search(sentence) or _PAST_RE.search(sentence.strip()):
+        return TodoPrefilter(True, None, expressions)
+    if _DESCRIPTIVE_RE.search(sentence) and not _PLAN_RE.search(sentence):
+        return TodoPrefilter(True, None, expressions)
+
+    title = _make_title(sentence, expression, offset)
+    if not 2 <= len(title) <= 30:
+        return TodoPrefilter(True, None, expressions)
+    return TodoPrefilter(True, [TodoItem(title=title, due_date=expression.when)], expressions)
@@ -0,0 +1,137 @@
+"""
+待办事项本地去重
+对未完成待办的标题建立字符 bigram 倒排索引，新提取的待办在写入前按
+标题 Jaccard 相似度与截止时间接近程度判断是否与已有待办重复：
+- 重复且已有待办没有截止时间、新待办有 -> 把截止时间合并到已有待办
+- 其余重复直接丢弃
+"""
+import re
+from collections import Counter
+from datetime import timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from src.models import TodoItem
+from .time_parser import strip_time_expressions
+
+
+# 标题 bigram 的 Jaccard 相似度达到该值视为同一件事
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+# 两个截止时间相差不超过该值视为同一次
+DEFAULT_DUE_TOLERANCE = timedelta(hours=6)
+
+# 比较标题时忽略的标点、空白与语气词
+_NOISE_RE = re.compile(r"[\s\W_]+|^(?:记得|别忘了|提醒我?|要|去)|[吧呀啊哦呢]$")
+
+
+class TodoDedupResult(NamedTuple):
+    """去重结果"""
+    new_todos: List[TodoItem]   # 需要新增的待办
+    merged: List[TodoItem]      # 补全了截止时间、需要更新的已有待办
+    dropped: int                # 丢弃的重复待办数
+
+
+def normalize_title(title: str) -> str:
+    """去掉时间表达、标点与语气词后的标题，用于相似度比较"""
+    return _NOISE_RE.sub("", strip_time_expressions(title).lower())
+
+
+def title_shingles(title: str) -> Set[str]:
+    """标题的字符 bigram 集合，单字标题退化为单字"""
+    text = normalize_title(title)
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class TodoIndex:
+    """待办标题的 bigram 倒排索引"""
+
+    def __init__(self, todos: Optional[List[TodoItem]] = None,
+                 threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 due_tolerance: timedelta = DEFAULT_DUE_TOLERANCE):
+        self.threshold = threshold
+        self.due_tolerance = due_tolerance
+        self._todos: List[TodoItem] = []
+        self._shingles: List[Set[str]] = []
+        self._postings: Dict[str, List[int]] = {}
+        for todo in todos or []:
+            self.add(todo)
+
+    def add(self, todo: TodoItem):
+        """加入一条待办"""
+        shingles = title_shingles(todo.title)
+        position = len(self._todos)
+        self._todos.append(todo)
+        self._shingles.append(shingles)
+        for shingle in shingles:
+            self._postings.setdefault(shingle, []).append(position)
+
+    def _due_close(self, a: TodoItem, b: TodoItem) -> bool:
+        """截止时间是否可视为同一次（任一方没有截止时间时视为接近）"""
+        if a.due_date is None or b.due_date is None:
+            return True
+        return abs(a.due_date - b.due_date) <= self.due_tolerance
+
+    def find_duplicate(self, todo: TodoItem) -> Optional[TodoItem]:
+        """返回与 todo 重复的已有待办中最相似的一条，没有则返回 None"""
+        shingles = title_shingles(todo.title)
+        if not shingles:
+            return None
+        overlaps = Counter(
+            position for shingle in shingles for position in self._postings.get(shingle, ())
+        )
+        best, best_score = None, self.threshold
+        for position, common in overlaps.items():
+            score = common / (len(shingles) + len(self._shingles[position]) - common)
+            if score >= best_score and self._due_close(todo, self._todos[position]):
+                best, best_score = self._todos[position], score
+        return best
+
+
+def dedupe_todos(new_todos: List[TodoItem], existing: List[TodoItem],
+                 threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 due_tolerance: timedelta = DEFAULT_DUE_TOLERANCE) -> TodoDedupResult:
+    """
+    写入前对新提取的待办去重（与已有待办以及同一批中的其他待办比较）
+    :param new_todos: 新提取的待办
+    :param existing: 未完成的已有待办（需要带 id 才能合并截止时间）
+    """
+    index = TodoIndex(existing, threshold, due_tolerance)
+    kept, merged, dropped = [], [], 0
+    merged_ids = set()
+    for todo in new_todos:
+        duplicate = index.find_duplicate(todo)
+        if duplicate is None:
+            kept.append(todo)
+            index.add(todo)
+            continue
+        dropped += 1
+        if duplicate.due_date is None and todo.due_date is not None:
+            duplicate.due_date = todo.due_date
+            if duplicate.id is not None and duplicate.id not in merged_ids:
+                merged_ids.add(duplicate.id)
+                merged.append(duplicate)
+    return TodoDedupResult(kept, merged, dropped)
+
+
+async def store_extracted_todos(db, extracted: List[TodoItem],
+                                is_current: Callable[[], bool] = lambda: True,
+                                include_completed: bool = False) -> Optional[TodoDedupResult]:
+    """
+    与未完成的待办去重后写入：新增与合并截止时间在同一事务中完成
+    :param db: AsyncDatabaseManager
+    :param is_current: 写入前确认结果仍然有效，返回 False 时放弃写入并返回 None
+    :param include_completed: 同时与已完成的待办去重（补全历史片段时避免重新加入已完成的事项）
+    """
+    existing = await (db.get_all_todos() if include_completed else db.get_active_todos())
+    result = dedupe_todos(extracted, existing)
+    if not is_current():
+        return None
+    if result.new_todos or result.merged:
+        def write(db):
+            db.add_todo_items(result.new_todos)
+            for todo in result.merged:
+                db.update_todo_info(todo.id, due_date=todo.due_date)
+        
+        await db.run_in_transaction(write)
+    return result
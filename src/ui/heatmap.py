@@ -0,0 +1,138 @@
+"""
+日历热力图控件
+按周为列、星期为行绘制日期格子，颜色深浅表示当天片段数量
+"""
+from typing import Dict, List
+
+from PyQt6.QtWidgets import QWidget, QToolTip
+from PyQt6.QtCore import Qt, QDate, QRect, QSize, pyqtSignal
+from PyQt6.QtGui import QPainter, QColor, QPen
+
+from src.models import DailyStats
+
+
+class CalendarHeatmap(QWidget):
+    """日历热力图（月 / 年视图）"""
+
+    # 点击某天的格子
+    dateClicked = pyqtSignal(QDate)
+
+    CELL = 12
+    GAP = 3
+
+    # 片段数量分级阈值与对应颜色（0 条为灰色）
+    LEVELS = [(1, "#cce4ff"), (3, "#80bdff"), (6, "#3395ff"), (10, "#007AFF")]
+    EMPTY_COLOR = "#ebedf0"
+    SUMMARY_COLOR = "#ffffff"
+    TODO_COLOR = "#ff9500"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        self.start = QDate.currentDate()
+        self.end = QDate.currentDate()
+        self.selected = QDate.currentDate()
+        self.stats: Dict[str, DailyStats] = {}
+        self._grid_start = self.start
+        self._weeks = 1
+
+    def set_range(self, start: QDate, end: QDate):
+        """设置显示的日期区间（含两端）"""
+        self.start, self.end = start, end
+        # 网格从 start 所在周的周一开始
+        self._grid_start = start.addDays(1 - start.dayOfWeek())
+        self._weeks = self._grid_start.daysTo(end) // 7 + 1
+        self.resize(self.sizeHint())
+        self.updateGeometry()
+        self.update()
+
+    def set_stats(self, stats: List[DailyStats]):
+        """设置区间内的统计数据"""
+        self.stats = {s.date: s for s in stats}
+        self.update()
+
+    def set_selected(self, date: QDate):
+        """设置高亮的当前日期"""
+        self.selected = date
+        self.update()
+
+    def sizeHint(self):
+        step = self.CELL + self.GAP
+        return QSize(self._weeks * step + self.GAP, 7 * step + self.GAP)
+
+    def minimumSizeHint(self):
+        return self.sizeHint()
+
+    def _cell_rect(self, date: QDate) -> QRect:
+        """日期对应的格子区域"""
+        offset = self._grid_start.daysTo(date)
+        step = self.CELL + self.GAP
+        return QRect(self.GAP + offset // 7 * step, self.GAP + offset % 7 * step, self.CELL, self.CELL)
+
+    def _date_at(self, pos):
+        """坐标对应的日期，不在区间内时返回 None"""
+        step = self.CELL + self.GAP
+        col = (pos.x() - self.GAP) // step
+        row = (pos.y() - self.GAP) // step
+        if col < 0 or not 0 <= row < 7:
+            return None
+        date = self._grid_start.addDays(col * 7 + row)
+        if date < self.start or date > self.end:
+            return None
+        return date
+
+    def _color_for(self, stats) -> QColor:
+        """按片段数量分级取色"""
+        color = self.EMPTY_COLOR
+        if stats:
+            for threshold, level_color in self.LEVELS:
+                if stats.entry_count >= threshold:
+                    color = level_color
+        return QColor(color)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        date = self.start
+        while date <= self.end:
+            rect = self._cell_rect(date)
+            stats = self.stats.get(date.toString("yyyy-MM-dd"))
+
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(self._color_for(stats))
+            painter.drawRoundedRect(rect, 2, 2)
+
+            if stats and stats.has_summary:
+                # 已有总结：中心白点
+                painter.setBrush(QColor(self.SUMMARY_COLOR))
+                painter.drawEllipse(rect.center(), 2, 2)
+            if stats and stats.open_todos:
+                # 有未完成待办：右上角橙色角标
+                painter.setBrush(QColor(self.TODO_COLOR))
+                painter.drawEllipse(rect.topRight(), 2, 2)
+            if date == self.selected:
+                painter.setPen(QPen(QColor("#333333"), 1.5))
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawRoundedRect(rect.adjusted(-1, -1, 1, 1), 2, 2)
+
+            date = date.addDays(1)
+
+    def mouseMoveEvent(self, event):
+        date = self._date_at(event.position().toPoint())
+        if date is None:
+            QToolTip.hideText()
+            return
+        stats = self.stats.get(date.toString("yyyy-MM-dd"))
+        lines = [date.toString("yyyy-MM-dd ddd")]
+        lines.append(f"碎片 {stats.entry_count if stats else 0} 条")
+        if stats and stats.has_summary:
+            lines.append("已生成总结")
+        if stats and stats.open_todos:
+            lines.append(f"未完成待办 {stats.open_todos} 项")
+        QToolTip.showText(event.globalPosition().toPoint(), "\n".join(lines), self)
+
+    def mousePressEvent(self, event):
+        date = self._date_at(event.position().toPoint())
+        if date is not None:
+            self.dateClicked.emit(date)
@@ -6,18 +6,24 @@ from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter,
     QTextEdit, QPushButton, QListWidget, QLabel, QListWidgetItem,
     QMessageBox, QTabWidget, QProgressBar, QMenu, QInputDialog,
-    QDialog, QDateTimeEdit, QDialogButtonBox, QDateEdit, QLineEdit
+    QDialog, QDateTimeEdit, QDialogButtonBox, QDateEdit, QLineEdit,
+    QComboBox, QScrollArea, QCheckBox
 )
 from PyQt6.QtCore import Qt, QTimer, QDate, QSettings
-from PyQt6.QtGui import QFont, QAction
+from PyQt6.QtGui import QFont, QAction, QTextCursor
 from datetime import datetime, timedelta
+from pathlib import Path
 import asyncio
 from qasync import asyncSlot
 
-from src.database import DatabaseManager
-from src.services import LLMService
+from src.config import Config
+from src.database import AsyncDatabaseManager, CachedDatabaseManager
+from src.services import (
+    PERIOD_NAMES, PERIODS, Backfiller, LLMJobWorker, LLMService, RelatedFragments, RollupBuilder, period_key, period_title, RequestTracker, fragment_hashes, is_transient_error, store_extracted_todos
+)
 from src.models import FragMind, TodoItem
 from src.ui.styles import MAIN_WINDOW_STYLE, DIALOG_STYLE, ABOUT_DIALOG_STYLE
+from src.ui.heatmap import CalendarHeatmap
 
 
 class SettingsDialog(QDialog):
@@ -124,6 +130,139 @@ class PromptSettingsDialog(QDialog):
         self.accept()
 
 
+class BackfillDialog(QDialog):
+    """批量补全对话框 - 选择日期区间"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("批量补全总结")
+        self.setFixedSize(420, 260)
+        
+        # 统一白色背景风格
+        self.setStyleSheet(DIALOG_STYLE)
+        
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(40, 30, 40, 30)
+        layout.setSpacing(12)
+        
+        label = QLabel("为区间内有片段但没有总结或总结已过期的日期生成总结")
+        label.setWordWrap(True)
+        layout.addWidget(label)
+        
+        # 日期区间，默认最近 30 天
+        range_layout = QHBoxLayout()
+        self.start_edit = QDateEdit(QDate.currentDate().addDays(-30))
+        self.start_edit.setCalendarPopup(True)
+        self.start_edit.setDisplayFormat("yyyy-MM-dd")
+        self.end_edit = QDateEdit(QDate.currentDate())
+        self.end_edit.setCalendarPopup(True)
+        self.end_edit.setDisplayFormat("yyyy-MM-dd")
+        range_layout.addWidget(self.start_edit)
+        range_layout.addWidget(QLabel("至"))
+        range_layout.addWidget(self.end_edit)
+        layout.addLayout(range_layout)
+        
+        self.todos_check = QCheckBox("同时重新提取这些日期片段中的待办")
+        layout.addWidget(self.todos_check)
+        
+        layout.addStretch()
+        
+        # 按钮组
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        
+        cancel_btn = QPushButton("取消")
+        cancel_btn.setStyleSheet("background-color: #e0e0e0; color: #333333;")
+        cancel_btn.clicked.connect(self.reject)
+        
+        start_btn = QPushButton("开始")
+        start_btn.clicked.connect(self.accept)
+        
+        btn_layout.addWidget(cancel_btn)
+        btn_layout.addWidget(start_btn)
+        
+        layout.addLayout(btn_layout)
+    
+    def values(self):
+        """返回 (开始日期, 结束日期, 是否提取待办)，起止颠倒时自动交换"""
+        start, end = sorted([self.start_edit.date(), self.end_edit.date()])
+        return start.toString("yyyy-MM-dd"), end.toString("yyyy-MM-dd"), self.todos_check.isChecked()
+
+
+class RollupDialog(QDialog):
+    """周 / 月 / 年回顾对话框（非模态，生成期间可继续使用主窗口）"""
+    def __init__(self, builder: RollupBuilder, parent=None):
+        super().__init__(parent)
+        self.builder = builder
+        self.setWindowTitle("阶段回顾")
+        self.resize(560, 520)
+        
+        # 统一白色背景风格
+        self.setStyleSheet(DIALOG_STYLE)
+        
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(30, 24, 30, 24)
+        layout.setSpacing(12)
+        
+        # 时间段选择：类型 + 该时间段内的任意一天
+        select_layout = QHBoxLayout()
+        self.period_combo = QComboBox()
+        for period in PERIODS:
+            self.period_combo.addItem(f"本{PERIOD_NAMES[period]}回顾", period)
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("yyyy-MM-dd")
+        self.generate_btn = QPushButton("生成回顾")
+        self.generate_btn.clicked.connect(self.generate)
+        select_layout.addWidget(self.period_combo)
+        select_layout.addWidget(self.date_edit)
+        select_layout.addStretch()
+        select_layout.addWidget(self.generate_btn)
+        layout.addLayout(select_layout)
+        
+        self.status_label = QLabel("回顾由已生成的每日总结逐级提炼，日记未变化时直接显示上次的结果")
+        self.status_label.setWordWrap(True)
+        self.status_label.setStyleSheet("color: #666;")
+        layout.addWidget(self.status_label)
+        
+        self.rollup_display = QTextEdit()
+        self.rollup_display.setReadOnly(True)
+        self.rollup_display.setStyleSheet("font-size: 15px; line-height: 1.6;")
+        layout.addWidget(self.rollup_display)
+    
+    def set_date(self, date: QDate):
+        """切换到包含该日期的时间段"""
+        self.date_edit.setDate(date)
+    
+    @asyncSlot()
+    async def generate(self):
+        """生成（或读取）所选时间段的回顾"""
+        period = self.period_combo.currentData()
+        key = period_key(period, self.date_edit.date().toString("yyyy-MM-dd"))
+        title = period_title(period, key)
+        self.generate_btn.setEnabled(False)
+        self.status_label.setText(f"正在生成 {title} 的回顾...")
+        try:
+            rollup = await self.builder.build(period, key)
+        except Exception as e:
+            self.status_label.setText(f"生成回顾时出错：{e}")
+            return
+        finally:
+            self.generate_btn.setEnabled(True)
+        
+        if rollup is None:
+            self.rollup_display.clear()
+            self.status_label.setText(f"{title} 还没有任何日记总结")
+            return
+        self.rollup_display.setText(rollup.summary)
+        status = f"{title}：依据 {len(rollup.source_summaries)} 篇" + ("月回顾" if period == "year" else "日记")
+        # 有片段但还没有总结的日期不参与回顾
+        candidates = await self.builder.db.get_backfill_candidates(rollup.start_date, rollup.end_date)
+        missing = sum(summary is None for _, summary in candidates)
+        if missing:
+            status += f"，另有 {missing} 天还没有总结（可用“工具 -> 批量补全总结”补全后重新生成）"
+        self.status_label.setText(status)
+
+
 class AboutDialog(QDialog):
     """关于对话框"""
     def __init__(self, parent=None):
@@ -178,8 +317,23 @@ class MainWindow(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.db = DatabaseManager()
-        self.llm_service = LLMService()
+        # 所有 SQL 都在后台线程执行，UI 通过 await 获取结果；按日期的读取带 LRU 缓存
+        self.db = AsyncDatabaseManager(CachedDatabaseManager())
+        self.llm_service = LLMService(self.db)
+        # 进行中的 LLM 操作：按目标（某天的总结、某条片段的待办提取）领取取消令牌
+        self._llm_requests = RequestTracker()
+        # 因断网、超时等失败的 LLM 任务记入数据库，由后台重放
+        self.job_worker = LLMJobWorker(
+            self.db, lambda: self.llm_service, self._llm_requests, self.on_llm_job_done
+        )
+        # 周 / 月 / 年回顾（由每日总结逐级生成并缓存）
+        self.rollups = RollupBuilder(self.db, lambda: self.llm_service)
+        self._rollup_dialog = None
+        # 进行中的批量补全（后台任务）及其 id
+        self._backfill_task = None
+        self._backfill_run_id = None
+        # 本地相关性索引（与数据库同目录），用于输入时提示相关的往日片段
+        self.related = RelatedFragments(self.db, Path(self.db.db.db_path).with_suffix(".related"))
         
         # 初始化日期控制
         self.selected_date = QDate.currentDate()
@@ -208,12 +362,138 @@ class MainWindow(QMainWindow):
         prompt_action.triggered.connect(self.open_prompt_settings_dialog)
         settings_menu.addAction(prompt_action)
         
+        settings_menu.addSeparator()
+        
+        # AI 结果缓存开关
+        cache_action = QAction("使用 AI 结果缓存", self)
+        cache_action.setCheckable(True)
+        cache_action.setChecked(QSettings("FragMind", "AppConfig").value("llm_cache_enabled", True, type=bool))
+        cache_action.setStatusTip("内容未变化时直接复用之前的生成结果，不再请求 API")
+        cache_action.toggled.connect(self.toggle_llm_cache)
+        settings_menu.addAction(cache_action)
+        
+        cache_stats_action = QAction("AI 缓存统计...", self)
+        cache_stats_action.triggered.connect(self.show_llm_cache_stats)
+        settings_menu.addAction(cache_stats_action)
+        
+        # 生成总结时附带往日相关片段
+        related_action = QAction("总结时参考往日相关片段", self)
+        related_action.setCheckable(True)
+        related_action.setChecked(QSettings("FragMind", "AppConfig").value("related_context_enabled", False, type=bool))
+        related_action.setStatusTip("生成总结时附上几条与今天内容相关的往日片段，供 AI 联想呼应")
+        related_action.toggled.connect(self.toggle_related_context)
+        settings_menu.addAction(related_action)
+        
+        # --- 工具菜单 ---
+        tools_menu = menubar.addMenu("工具")
+        backfill_action = QAction("批量补全总结...", self)
+        backfill_action.setStatusTip("为一段时间内缺少或过期的日记生成总结，在后台进行")
+        backfill_action.triggered.connect(self.open_backfill_dialog)
+        tools_menu.addAction(backfill_action)
+        
+        self.stop_backfill_action = QAction("停止批量补全", self)
+        self.stop_backfill_action.setEnabled(False)
+        self.stop_backfill_action.triggered.connect(self.stop_backfill)
+        tools_menu.addAction(self.stop_backfill_action)
+        
+        tools_menu.addSeparator()
+        
+        rollup_action = QAction("周 / 月 / 年回顾...", self)
+        rollup_action.setStatusTip("由每日总结生成一周、一个月或一年的回顾")
+        rollup_action.triggered.connect(self.open_rollup_dialog)
+        tools_menu.addAction(rollup_action)
+        
         # --- 帮助菜单 ---
         help_menu = menubar.addMenu("帮助")
         about_action = QAction("关于", self)
         about_action.triggered.connect(self.open_about_dialog)
         help_menu.addAction(about_action)
 
+    def toggle_llm_cache(self, checked):
+        """切换 AI 结果缓存"""
+        QSettings("FragMind", "AppConfig").setValue("llm_cache_enabled", checked)
+        self.statusbar.showMessage("已启用 AI 结果缓存" if checked else "已关闭 AI 结果缓存", 3000)
+
+    def toggle_related_context(self, checked):
+        """切换总结时是否附带往日相关片段"""
+        QSettings("FragMind", "AppConfig").setValue("related_context_enabled", checked)
+        self.statusbar.showMessage("生成总结时将参考往日相关片段" if checked else "生成总结时不再参考往日相关片段", 3000)
+
+    @asyncSlot()
+    async def show_llm_cache_stats(self):
+        """显示 AI 缓存统计，并可清空缓存"""
+        stats, report, calls = await asyncio.gather(
+            self.db.get_llm_cache_stats(), self.db.get_summary_generation_report(),
+            self.db.get_llm_call_report()
+        )
+        names = {"summary": "日记总结", "todo": "待办提取"}
+        lines = [f"缓存条目：{stats['entries']} 条（{stats['bytes'] / 1024:.1f} KB）"]
+        for kind, k in stats["kinds"].items():
+            lines.append(
+                f"{names.get(kind, kind)}：命中 {k['hits']} 次 / 未命中 {k['misses']} 次，"
+                f"命中率 {k['hit_rate']:.0%}，节省 {k['tokens_saved']} tokens"
+            )
+        modes = {"full": "全量重写", "incremental": "增量更新", "chunked": "分段总结"}
+        for mode, r in report.items():
+            lines.append(
+                f"{modes.get(mode, mode)}：{r['count']} 次，平均 prompt 约 {r['avg_prompt_tokens']:.0f} tokens，"
+                f"平均节省约 {r['avg_tokens_saved']:.0f} tokens"
+            )
+        agents = {
+            "summary": "日记总结", "map": "时段纪要", "rollup": "阶段回顾",
+            "todo": "待办提取", "todo_batch": "批量待办提取",
+        }
+        for agent, models in calls.items():
+            for model, c in models.items():
+                line = f"{agents.get(agent, agent)}（{model}）：{c['calls']} 次"
+                if c["failures"]:
+                    line += f"，失败 {c['failures']} 次"
+                line += (
+                    f"，输入 {c['input_tokens']} / 输出 {c['output_tokens']} tokens，"
+                    f"前缀缓存命中 {c['cache_hit_tokens']}（{c['hit_rate']:.0%}）"
+                )
+                if c["avg_latency_ms"] is not None:
+                    line += f"，平均耗时 {c['avg_latency_ms']:.0f} ms（P95 {c['p95_latency_ms']:.0f} ms）"
+                if c["avg_hit_latency_ms"] is not None and c["avg_miss_latency_ms"] is not None:
+                    line += f"，命中 {c['avg_hit_latency_ms']:.0f} ms / 未命中 {c['avg_miss_latency_ms']:.0f} ms"
+                lines.append(line)
+        jobs = await self.db.get_llm_job_stats()
+        breakers = {"closed": "正常", "open": "熔断中", "half_open": "试探中"}
+        queue = self.llm_service.queue.stats()
+        lines.append(
+            f"请求队列：进行中 {queue['running']}/{queue['max_concurrency']}，等待 {queue['depth']}"
+            f"（峰值 {queue['max_depth']}），平均等待 {queue['avg_wait_ms']:.0f} ms，"
+            f"最长等待 {queue['max_wait_ms']:.0f} ms"
+        )
+        lines.append(
+            f"合并请求：去重 {queue['deduplicated']} 次，{queue['batches']} 次批量提取合并了 "
+            f"{queue['batched_texts']} 段文本"
+        )
+        line = f"离线任务：等待重试 {jobs['pending']}，已放弃 {jobs['failed']}，服务状态 {breakers[queue['breaker']]}"
+        if jobs["next_attempt_at"] is not None:
+            line += f"，下次重试 {jobs['next_attempt_at'].strftime('%H:%M:%S')}"
+        lines.append(line)
+        box = QMessageBox(self)
+        box.setWindowTitle("AI 缓存统计")
+        box.setText("\n".join(lines))
+        clear_button = box.addButton("清空缓存", QMessageBox.ButtonRole.DestructiveRole)
+        box.addButton(QMessageBox.StandardButton.Close)
+        box.exec()
+        if box.clickedButton() is clear_button:
+            await self.db.clear_llm_cache()
+            self.statusbar.showMessage("AI 缓存已清空", 3000)
+
+    def open_rollup_dialog(self):
+        """打开阶段回顾对话框，默认定位到当前选中的日期"""
+        if not self.llm_service.is_available():
+            QMessageBox.warning(self, "提示", "请先在“设置”中配置 API Key")
+            return
+        if self._rollup_dialog is None:
+            self._rollup_dialog = RollupDialog(self.rollups, self)
+        self._rollup_dialog.set_date(self.selected_date)
+        self._rollup_dialog.show()
+        self._rollup_dialog.raise_()
+    
     def open_about_dialog(self):
         """打开关于对话框"""
         dialog = AboutDialog(self)
@@ -224,15 +504,34 @@ class MainWindow(QMainWindow):
         dialog = SettingsDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.statusbar.showMessage("API 设置已保存", 3000)
-            # 重新初始化 LLM Service 以应用新 Key
-            self.llm_service = LLMService()
+            # 重新初始化 LLM Service 以应用新 Key，并重试积压的离线任务
+            self.llm_service = LLMService(self.db)
+            self.job_worker.wake()
 
     def open_prompt_settings_dialog(self):
         """打开 Prompt 设置对话框"""
         dialog = PromptSettingsDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.statusbar.showMessage("Prompt 设置已保存", 3000)
-    
+
+    def closeEvent(self, event):
+        """窗口关闭时写入等待中的待办完成操作并释放数据库连接"""
+        # 未完成的离线任务与批量补全保留在数据库中，下次启动后继续
+        self.job_worker.stop()
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+        self._related_timer.stop()
+        timers = getattr(self, '_todo_timers', {})
+        if timers:
+            self.db.submit_write(self.db.db.update_todos_status, list(timers), True)
+            for timer in timers.values():
+                timer.stop()
+            timers.clear()
+        # close() 会等待写线程中排队的操作完成
+        self.related.close()
+        self.db.close()
+        super().closeEvent(event)
+
     def init_ui(self):
         """初始化 UI"""
         self.setWindowTitle("FragMind - 碎片化思维整理与日记生成")
@@ -315,19 +614,101 @@ class MainWindow(QMainWindow):
         btn_today.setStyleSheet("padding: 0px;")
         btn_today.clicked.connect(self.go_to_today)
         
+        # 日历热力图开关
+        self.btn_heatmap = QPushButton("📊")
+        self.btn_heatmap.setFixedSize(30, 30)
+        self.btn_heatmap.setToolTip("日历热力图")
+        self.btn_heatmap.setStyleSheet("padding: 0px;")
+        self.btn_heatmap.setCheckable(True)
+        self.btn_heatmap.toggled.connect(self.toggle_heatmap)
+        
         date_nav_layout.addWidget(btn_prev)
         date_nav_layout.addWidget(self.date_edit)
         date_nav_layout.addWidget(btn_next)
         date_nav_layout.addWidget(btn_today)
+        date_nav_layout.addWidget(self.btn_heatmap)
         
         layout.addLayout(date_nav_layout)
         
+        # --- 日历热力图 ---
+        self.heatmap_panel = QWidget()
+        heatmap_layout = QHBoxLayout(self.heatmap_panel)
+        heatmap_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.heatmap_mode = QComboBox()
+        self.heatmap_mode.addItems(["月", "年"])
+        self.heatmap_mode.setFixedWidth(56)
+        self.heatmap_mode.currentIndexChanged.connect(lambda _: self.schedule_heatmap_refresh())
+        heatmap_layout.addWidget(self.heatmap_mode, alignment=Qt.AlignmentFlag.AlignTop)
+        
+        self.heatmap = CalendarHeatmap()
+        self.heatmap.dateClicked.connect(self.date_edit.setDate)
+        heatmap_scroll = QScrollArea()
+        heatmap_scroll.setWidget(self.heatmap)
+        heatmap_scroll.setFrameShape(QScrollArea.Shape.NoFrame)
+        heatmap_scroll.setFixedHeight(self.heatmap.sizeHint().height() + 16)
+        heatmap_layout.addWidget(heatmap_scroll)
+        
+        self.heatmap_panel.hide()
+        layout.addWidget(self.heatmap_panel)
+        
+        # 多处写入可能在短时间内连续触发刷新，合并为一次查询
+        self._heatmap_timer = QTimer(self)
+        self._heatmap_timer.setSingleShot(True)
+        self._heatmap_timer.setInterval(100)
+        self._heatmap_timer.timeout.connect(self.load_heatmap)
+        
+        # --- 全文检索 ---
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("🔍 搜索碎片与日记...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setFixedHeight(30)
+        self.search_input.textChanged.connect(self.on_search_text_changed)
+        layout.addWidget(self.search_input)
+        
+        self.search_results = QListWidget()
+        self.search_results.setWordWrap(True)
+        self.search_results.setMaximumHeight(240)
+        self.search_results.itemClicked.connect(self.on_search_result_clicked)
+        self.search_results.verticalScrollBar().valueChanged.connect(self.on_search_results_scrolled)
+        self.search_results.hide()
+        layout.addWidget(self.search_results)
+        
+        # 输入防抖：停止输入 150ms 后再检索
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(lambda: self.run_search(reset=True))
+        self._search_loading = False
+        
         # 输入区
         self.quick_input = QTextEdit()
         self.quick_input.setPlaceholderText("想到什么就记下来...")
         self.quick_input.setMinimumHeight(400) 
         layout.addWidget(self.quick_input)
         
+        # 相关的往日片段：输入时按内容查找，输入框为空时显示那年今日
+        self.related_label = QLabel()
+        self.related_label.setStyleSheet("color: #666;")
+        self.related_label.hide()
+        layout.addWidget(self.related_label)
+        
+        self.related_list = QListWidget()
+        self.related_list.setWordWrap(True)
+        self.related_list.setMaximumHeight(140)
+        self.related_list.setToolTip("点击跳转到该日期")
+        self.related_list.itemClicked.connect(self.on_related_item_clicked)
+        self.related_list.hide()
+        layout.addWidget(self.related_list)
+        
+        # 输入防抖：停止输入 200ms 后再查找
+        self._related_timer = QTimer(self)
+        self._related_timer.setSingleShot(True)
+        self._related_timer.setInterval(200)
+        self._related_timer.timeout.connect(self.load_related)
+        self._related_seq = 0
+        self.quick_input.textChanged.connect(self._related_timer.start)
+        
         # 保存按钮区域
         btn_layout = QHBoxLayout()
         
@@ -391,11 +772,18 @@ class MainWindow(QMainWindow):
         self.summary_display.setStyleSheet("font-size: 16px; line-height: 1.6;")
         layout.addWidget(self.summary_display)
         
+        # 流式生成：增量文本先进入缓冲区，定时合并后一次性追加，避免逐 token 重绘
+        self._stream_buffer = []
+        self._stream_flush_timer = QTimer(self)
+        self._stream_flush_timer.setSingleShot(True)
+        self._stream_flush_timer.setInterval(self.STREAM_FLUSH_INTERVAL_MS)
+        self._stream_flush_timer.timeout.connect(self._flush_summary_stream)
+        
         # 操作按钮
         btn_layout = QHBoxLayout()
         self.btn_save_summary = QPushButton("保存修改")
         self.btn_save_summary.setFixedHeight(36)
-        self.btn_save_summary.clicked.connect(self.save_summary)
+        self.btn_save_summary.clicked.connect(self.on_save_summary_clicked)
         btn_layout.addWidget(self.btn_save_summary)
         layout.addLayout(btn_layout)
         
@@ -431,6 +819,7 @@ class MainWindow(QMainWindow):
         self.todo_list_completed.itemDoubleClicked.connect(self.on_todo_double_clicked)
         self.todo_list_completed.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.todo_list_completed.customContextMenuRequested.connect(lambda pos: self.show_todo_context_menu_from_list(self.todo_list_completed, pos))
+        self.todo_list_completed.verticalScrollBar().valueChanged.connect(self.on_completed_todos_scrolled)
         self.todo_tabs.addTab(self.todo_list_completed, "已完成")
         
         layout.addWidget(self.todo_tabs)
@@ -448,8 +837,10 @@ class MainWindow(QMainWindow):
         """回到今天"""
         self.date_edit.setDate(QDate.currentDate())
         
-    def on_date_changed(self, date):
+    @asyncSlot(QDate)
+    async def on_date_changed(self, date):
         """日期改变时的处理"""
+        previous_date = self.current_date
         self.selected_date = date
         self.current_date = date.toString("yyyy-MM-dd")
         
@@ -457,55 +848,212 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'list_label'):
             self.list_label.setText(f"片段列表 ({self.current_date})")
         
+        # 正在生成的总结属于原日期，停止生成
+        self._llm_requests.cancel(("summary", previous_date))
+        
         # 刷新数据
-        self.load_diary_entries()
-        self.load_summary()
+        self.heatmap.set_selected(date)
+        self._related_timer.start()
+        await asyncio.gather(self.load_diary_entries(), self.load_summary())
+
+    # ==================== 日历热力图 ====================
+    
+    def toggle_heatmap(self, checked):
+        """显示/隐藏日历热力图"""
+        self.heatmap_panel.setVisible(checked)
+        if checked:
+            self.schedule_heatmap_refresh()
+    
+    def schedule_heatmap_refresh(self):
+        """热力图可见时，安排一次（防抖的）刷新"""
+        if hasattr(self, 'heatmap_panel') and not self.heatmap_panel.isHidden():
+            self._heatmap_timer.start()
+    
+    def _heatmap_range(self):
+        """根据视图模式计算显示区间：所选日期所在的整月或整年"""
+        date = self.selected_date
+        if self.heatmap_mode.currentText() == "年":
+            return QDate(date.year(), 1, 1), QDate(date.year(), 12, 31)
+        start = QDate(date.year(), date.month(), 1)
+        return start, start.addMonths(1).addDays(-1)
+    
+    @asyncSlot()
+    async def load_heatmap(self):
+        """加载热力图数据，整个区间只需一次主键范围查询"""
+        start, end = self._heatmap_range()
+        stats = await self.db.get_daily_stats(start.toString("yyyy-MM-dd"), end.toString("yyyy-MM-dd"))
+        if (start, end) != self._heatmap_range():
+            return  # 等待期间已切换月份/年份
+        
+        self.heatmap.set_range(start, end)
+        self.heatmap.set_stats(stats)
+        self.heatmap.set_selected(self.selected_date)
+
+    # ==================== 全文检索 ====================
+    
+    SEARCH_PAGE_SIZE = 30
+    
+    def on_search_text_changed(self, text):
+        """检索框内容变化，防抖后执行检索"""
+        if not text.strip():
+            self._search_timer.stop()
+            self.search_results.clear()
+            self.search_results.hide()
+            return
+        self._search_timer.start()
+    
+    @asyncSlot()
+    async def run_search(self, reset=False):
+        """执行检索，reset 为 False 时追加下一页结果"""
+        query = self.search_input.text().strip()
+        if not query:
+            return
+        if not reset and (self._search_loading or getattr(self, '_search_exhausted', True)):
+            return
+        
+        offset = 0 if reset else self.search_results.count()
+        self._search_loading = True
+        try:
+            hits = await self.db.search(query, limit=self.SEARCH_PAGE_SIZE, offset=offset)
+        finally:
+            self._search_loading = False
+        
+        # 等待期间检索词已变化，丢弃过期结果
+        if query != self.search_input.text().strip():
+            return
+        
+        if reset:
+            self.search_results.clear()
+            self._search_exhausted = False
+        if len(hits) < self.SEARCH_PAGE_SIZE:
+            self._search_exhausted = True
+        
+        for hit in hits:
+            tag = "日记" if hit.source == "summary" else "碎片"
+            item = QListWidgetItem(f"[{hit.date} · {tag}] {hit.snippet}")
+            item.setData(Qt.ItemDataRole.UserRole, hit)
+            self.search_results.addItem(item)
+        
+        if reset and not hits:
+            item = QListWidgetItem("没有找到相关内容")
+            item.setFlags(Qt.ItemFlag.NoItemFlags)
+            self.search_results.addItem(item)
+        self.search_results.show()
+    
+    def on_search_results_scrolled(self, value):
+        """滚动到底部时加载下一页结果"""
+        if value == self.search_results.verticalScrollBar().maximum():
+            self.run_search()
+    
+    def on_search_result_clicked(self, item):
+        """点击检索结果，跳转到对应日期"""
+        hit = item.data(Qt.ItemDataRole.UserRole)
+        if hit:
+            self.date_edit.setDate(QDate.fromString(hit.date, "yyyy-MM-dd"))
+
+    # ==================== 往日相关片段 ====================
+
+    async def start_related_index(self):
+        """打开本地相关性索引并与数据库同步（补上命令行导入等索引之外的修改）"""
+        try:
+            added, removed = await self.related.start()
+        except Exception as e:
+            print(f"相关性索引同步失败：{e}")
+            return
+        if added or removed:
+            print(f"相关性索引已同步：更新 {added} 条，移除 {removed} 条")
+        self._related_timer.start()
+
+    @asyncSlot()
+    async def load_related(self):
+        """按输入框内容查找当前日期之前的相关片段；输入框为空时显示那年今日"""
+        self._related_seq += 1
+        seq = self._related_seq
+        text = self.quick_input.toPlainText().strip()
+        date = self.current_date
+        try:
+            if text:
+                entries = await self.related.related(text, Config.RELATED_DISPLAY_COUNT, before=date)
+            else:
+                entries = await self.related.on_this_day(date, Config.RELATED_DISPLAY_COUNT)
+        except Exception as e:
+            print(f"查找相关片段失败：{e}")
+            return
+        if seq != self._related_seq:
+            return  # 已有更新的查找
+
+        self.related_list.clear()
+        for entry in entries:
+            item = QListWidgetItem(f"[{entry.date}] {entry.content}")
+            item.setData(Qt.ItemDataRole.UserRole, entry)
+            self.related_list.addItem(item)
+        self.related_label.setText(f"相关的往日片段（{len(entries)}）" if text else f"那年今日（{len(entries)}）")
+        self.related_label.setVisible(bool(entries))
+        self.related_list.setVisible(bool(entries))
+
+    def on_related_item_clicked(self, item):
+        """点击相关片段，跳转到对应日期"""
+        entry = item.data(Qt.ItemDataRole.UserRole)
+        if entry:
+            self.date_edit.setDate(QDate.fromString(entry.date, "yyyy-MM-dd"))
 
     # ==================== 数据加载 ====================
     
-    def load_today_data(self):
+    @asyncSlot()
+    async def load_today_data(self):
         """加载初始数据"""
-        self.load_diary_entries()
-        self.load_summary()
-        self.load_todos()
+        self.job_worker.start()
+        asyncio.ensure_future(self.start_related_index())
+        await asyncio.gather(self.load_diary_entries(), self.load_summary(), self.load_todos())
+        # 上次退出时未完成的批量补全在后台继续
+        run = await self.db.get_backfill_run()
+        if run is not None and self.llm_service.is_available() and self._backfill_task is None:
+            self._start_backfill(run_id=run.id)
+            self.statusbar.showMessage(f"继续上次未完成的批量补全（{run.start_date} 至 {run.end_date}）", 3000)
     
-    def load_diary_entries(self):
+    async def load_diary_entries(self):
         """加载当前日期日记片段"""
-        self.entry_list.clear()
-        entries = self.db.get_frag_minds_by_date(self.current_date)
+        date = self.current_date
+        entries = await self.db.get_frag_minds_by_date(date)
+        if date != self.current_date:
+            return  # 等待期间已切换日期
         
+        self.entry_list.clear()
         for entry in entries:
             time_str = entry.created_at.strftime("%H:%M")
             item = QListWidgetItem(f"[{time_str}] {entry.content}")
             item.setData(Qt.ItemDataRole.UserRole, entry)
             self.entry_list.addItem(item)
+        self.schedule_heatmap_refresh()
     
-    def load_summary(self):
+    async def load_summary(self):
         """加载当前日期总结"""
-        summary = self.db.get_diary_summary(self.current_date)
+        date = self.current_date
+        summary = await self.db.get_diary_summary(date)
+        if date != self.current_date:
+            return  # 等待期间已切换日期
         if summary:
             self.summary_display.setText(summary.summary)
         else:
             self.summary_display.clear()
     
-    def load_todos(self):
+    async def load_todos(self):
         """加载并显示待办事项"""
+        self._todos_load_seq = getattr(self, '_todos_load_seq', 0) + 1
+        seq = self._todos_load_seq
+        # 未完成事项需要整体分组排序，全部加载；已完成事项只加载第一页，滚动时再分页追加
+        pending_todos, completed_todos = await asyncio.gather(
+            self.db.get_active_todos(),
+            self.db.get_todos_page(True, page_size=self.COMPLETED_TODOS_PAGE_SIZE)
+        )
+        if seq != self._todos_load_seq:
+            return  # 已有更新的加载请求
+        
         self.is_loading_todos = True
         
         self.todo_list_pending.clear()
         self.todo_list_completed.clear()
         
-        todos = self.db.get_all_todos()
-        
-        pending_todos = []
-        completed_todos = []
-        
-        for todo in todos:
-            if todo.completed:
-                completed_todos.append(todo)
-            else:
-                pending_todos.append(todo)
-        
         # 1. 按日期归类
         dated_todos = {}  
         no_date_todos = []
@@ -569,13 +1117,39 @@ class MainWindow(QMainWindow):
                 self._add_todo_item(self.todo_list_pending, todo)
                 
         # --- 处理已完成事项 ---
-        # 简单按截止时间倒序
-        completed_todos.sort(key=lambda t: t.due_date.replace(tzinfo=None) if t.due_date else datetime.max, reverse=True)
-        
-        for todo in completed_todos:
-            self._add_todo_item(self.todo_list_completed, todo)
+        # 按创建时间倒序分页
+        self._append_completed_todos(completed_todos)
             
         self.is_loading_todos = False
+        self.schedule_heatmap_refresh()
+    
+    COMPLETED_TODOS_PAGE_SIZE = 50
+    
+    def _append_completed_todos(self, todos):
+        """追加一页已完成事项，并记录下一页的游标"""
+        was_loading = getattr(self, 'is_loading_todos', False)
+        self.is_loading_todos = True
+        for todo in todos:
+            self._add_todo_item(self.todo_list_completed, todo)
+        self.is_loading_todos = was_loading
+        
+        if len(todos) < self.COMPLETED_TODOS_PAGE_SIZE:
+            self._completed_todos_cursor = None  # 已全部加载
+        else:
+            self._completed_todos_cursor = (todos[-1].created_at, todos[-1].id)
+    
+    @asyncSlot(int)
+    async def on_completed_todos_scrolled(self, value):
+        """已完成列表滚动到底部时加载下一页"""
+        cursor = getattr(self, '_completed_todos_cursor', None)
+        if cursor is None or value != self.todo_list_completed.verticalScrollBar().maximum():
+            return
+        
+        self._completed_todos_cursor = None  # 防止重复加载同一页
+        seq = self._todos_load_seq
+        todos = await self.db.get_todos_page(True, before=cursor, page_size=self.COMPLETED_TODOS_PAGE_SIZE)
+        if seq == self._todos_load_seq:
+            self._append_completed_todos(todos)
 
     def _add_todo_item(self, list_widget, todo, show_time=False):
         """添加单个 Todo 项到列表"""
@@ -624,7 +1198,7 @@ class MainWindow(QMainWindow):
                 
             timer = QTimer()
             timer.setSingleShot(True)
-            timer.timeout.connect(lambda: self._finalize_todo_completion(todo.id, True))
+            timer.timeout.connect(self._finalize_todo_completions)
             timer.start(10000)
             self._todo_timers[todo.id] = timer
             
@@ -674,15 +1248,18 @@ class MainWindow(QMainWindow):
             date=self.current_date
         )
         
-        entry_id = self.db.add_frag_mind(entry)
         self.quick_input.clear()
-        self.load_diary_entries()
+        entry_id = await self.db.add_frag_mind(entry)
+        # 当天片段已变化，进行中的总结作废
+        self._llm_requests.invalidate(("summary", entry.date))
+        await self.load_diary_entries()
+        await self.related.upsert(entry_id, content, entry.date)
         
         # 根据用户选择决定是否触发 Todo 提取
         if extract_todo:
             # 显示一个临时的状态提示
             self.statusbar.showMessage("正在分析待办事项...", 3000)
-            asyncio.create_task(self.process_todo_extraction(content))
+            asyncio.create_task(self.process_todo_extraction(content, ("todo", entry_id)))
         else:
             self.statusbar.showMessage("片段已保存", 2000)
     
@@ -696,101 +1273,285 @@ class MainWindow(QMainWindow):
             
         self.statusbar.showMessage("正在分析待办事项...", 3000)
         self.quick_input.clear()
-        await self.process_todo_extraction(content)
+        await self.process_todo_extraction(content, ("todo_text", content))
 
     @asyncSlot()
     async def generate_summary(self):
-        """手动触发日记总结"""
+        """手动触发日记总结；生成过程中再次点击则停止生成"""
+        target = ("summary", self.current_date)
+        if self._llm_requests.active(target) is not None:
+            self._llm_requests.cancel(target)
+            return
         await self.process_summary_generation()
 
-    async def process_todo_extraction(self, text_to_analyze: str):
+    async def process_todo_extraction(self, text_to_analyze: str, target):
         """
         执行 Todo 提取
         :param text_to_analyze: 待分析的文本
+        :param target: 取消令牌的目标；同一目标上的新提取或片段修改会取消本次提取
         """
+        token = self._llm_requests.begin(target)
+        now = datetime.now()
         # 显示进度条和状态栏
         self.progress_bar.show()
         self.progress_bar.setRange(0, 0)
         self.statusbar.showMessage("正在分析待办事项...", 0)
         
         try:
-            # 准备上下文
-            active_todos = self.db.get_active_todos()
-            existing_todo_titles = [t.title for t in active_todos]
+            # 执行提取（直接在事件循环中 await，不占用工作线程）
+            extracted = await self.llm_service.aparse_todos(text_to_analyze, now=now, raise_errors=True)
             
-            loop = asyncio.get_running_loop()
-            
-            # 执行提取
-            new_todos = await loop.run_in_executor(
-                None, 
-                self.llm_service.parse_todo_from_text, 
-                text_to_analyze, 
-                existing_todo_titles
+            # 写入前与未完成的待办去重，重复项丢弃或合并截止时间，整批一次性原子写入；
+            # 提取期间片段已修改或有了新的提取时丢弃过期结果
+            result = await store_extracted_todos(
+                self.db, extracted, lambda: self._llm_requests.is_current(token)
             )
+            if result is None:
+                return
+            if result.new_todos or result.merged:
+                await self.load_todos()
             
-            if new_todos:
-                for todo in new_todos:
-                    self.db.add_todo_item(todo)
-                self.load_todos()
-                self.statusbar.showMessage(f"成功提取 {len(new_todos)} 条待办事项", 3000)
+            if result.new_todos:
+                message = f"成功提取 {len(result.new_todos)} 条待办事项"
+                if result.dropped:
+                    message += f"，跳过 {result.dropped} 条重复"
+                self.statusbar.showMessage(message, 3000)
+            elif result.dropped:
+                self.statusbar.showMessage(f"提取的 {result.dropped} 条待办事项已存在", 3000)
             else:
                 self.statusbar.showMessage("未发现新的待办事项", 3000)
                 
+        except asyncio.CancelledError:
+            self.statusbar.showMessage("待办事项提取已取消", 3000)
         except Exception as e:
+            if is_transient_error(e):
+                # 断网或服务暂时不可用：记入离线任务，恢复后按本次的时刻解析相对时间
+                entry_id = target[1] if target[0] == "todo" else None
+                await self.job_worker.enqueue_todo(text_to_analyze, now, entry_id)
+                self.statusbar.showMessage("AI 服务暂时不可用，待办提取已加入后台队列，恢复后自动完成", 5000)
+                return
             print(f"Todo extraction failed: {e}")
             self.statusbar.showMessage("待办事项提取失败", 3000)
         finally:
+            self._llm_requests.finish(token)
             self.progress_bar.hide()
 
+    # 流式总结合并追加的间隔（毫秒）
+    STREAM_FLUSH_INTERVAL_MS = 50
+
     async def process_summary_generation(self):
         """
         执行日记总结生成
+        生成的文本流式追加到总结面板；中途取消或出错时恢复原内容，不保存不完整的结果
+        切换日期、再次点击或当天片段变化时取消令牌，随之关闭 HTTP 请求，过期结果不会保存
         """
+        date = self.current_date
+        token = self._llm_requests.begin(("summary", date))
+        previous_text = self.summary_display.toPlainText()
+        streaming = False
+        
         # UI 状态更新
-        self.btn_generate_summary.setEnabled(False)
-        self.btn_generate_summary.setText("正在生成...")
+        self.btn_generate_summary.setText("⏹ 停止生成")
         self.statusbar.showMessage("正在生成今日总结，请稍候...", 0) # 0 表示一直显示直到被覆盖
         self.progress_bar.show()
         self.progress_bar.setRange(0, 0)
         
         try:
             # 准备上下文
-            entries = self.db.get_frag_minds_by_date(self.current_date)
+            entries = await self.db.get_frag_minds_by_date(date)
             if not entries:
                 QMessageBox.warning(self, "提示", "今天还没有任何记录")
                 self.statusbar.clearMessage()
                 return
 
-            current_summary_obj = self.db.get_diary_summary(self.current_date)
+            current_summary_obj = await self.db.get_diary_summary(date)
             current_summary_text = current_summary_obj.summary if current_summary_obj else ""
+            sources = current_summary_obj.source_fragments if current_summary_obj else None
             
-            loop = asyncio.get_running_loop()
+            # 按设置附上几条与当天内容相关的往日片段
+            related = None
+            if QSettings("FragMind", "AppConfig").value("related_context_enabled", False, type=bool):
+                related = await self.related.related(
+                    "\n".join(e.content for e in entries), Config.RELATED_CONTEXT_COUNT, before=date
+                )
             
-            # 执行生成
-            new_summary = await loop.run_in_executor(
-                None,
-                self.llm_service.summarize_diary_entries,
-                entries,
-                self.current_date,
-                current_summary_text
-            )
+            # 执行生成（已有总结记录了来源片段时，只发送变化的片段）
+            async for delta in self.llm_service.astream_summary(
+                entries, date, current_summary_text, sources, related=related
+            ):
+                if not streaming:
+                    # 首个 token 到达：清空面板，生成期间禁止编辑与手动保存（不完整的文本不能入库）
+                    streaming = True
+                    self.progress_bar.hide()
+                    self.summary_display.clear()
+                    self.summary_display.setReadOnly(True)
+                    self.btn_save_summary.setEnabled(False)
+                self._stream_buffer.append(delta)
+                if not self._stream_flush_timer.isActive():
+                    self._stream_flush_timer.start()
+            self._flush_summary_stream()
             
-            if new_summary:
-                self.summary_display.setText(new_summary)
-                # 自动保存一次
-                self.save_summary(silent=True)
+            if date != self.current_date or not self._llm_requests.is_current(token):
+                # 结果属于已离开的日期或已变化的片段
+                self._discard_summary_stream(date, previous_text if streaming else None)
+                return
+            if self.summary_display.toPlainText().strip():
+                # 自动保存一次，并记录本次依据的片段供下次增量更新
+                await self.save_summary(silent=True, sources=fragment_hashes(entries), token=token)
                 self.statusbar.showMessage("今日总结生成完毕", 3000)
-            
+        
+        except asyncio.CancelledError:
+            # 停止生成或切换日期：丢弃不完整的文本
+            self._discard_summary_stream(date, previous_text if streaming else None)
+            self.statusbar.showMessage("已停止生成，未保存不完整的总结", 3000)
         except Exception as e:
-            QMessageBox.critical(self, "错误", f"生成总结失败：{str(e)}")
-            self.statusbar.showMessage("生成总结失败", 3000)
+            self._discard_summary_stream(date, previous_text if streaming else None)
+            if is_transient_error(e):
+                # 断网或服务暂时不可用：记入离线任务，恢复后在后台生成并保存
+                await self.job_worker.enqueue_summary(date)
+                self.statusbar.showMessage("AI 服务暂时不可用，总结已加入后台队列，恢复后自动生成", 5000)
+            else:
+                QMessageBox.critical(self, "错误", f"生成总结失败：{str(e)}")
+                self.statusbar.showMessage("生成总结失败", 3000)
         finally:
-            self.btn_generate_summary.setEnabled(True)
+            self._llm_requests.finish(token)
+            self.summary_display.setReadOnly(False)
+            self.btn_save_summary.setEnabled(True)
             self.btn_generate_summary.setText("✨ 生成今日总结")
             self.progress_bar.hide()
     
-    def save_summary(self, silent=False):
-        """保存总结到数据库"""
+    def on_llm_job_done(self, job, result):
+        """后台重放的离线任务完成：刷新相应的界面"""
+        if job.kind == "summary":
+            date = job.payload["date"]
+            self.schedule_heatmap_refresh()
+            if date == self.current_date and self._llm_requests.active(("summary", date)) is None:
+                asyncio.ensure_future(self.load_summary())
+            self.statusbar.showMessage(f"已在后台生成 {date} 的总结", 3000)
+        elif result is not None and result.new_todos:
+            asyncio.ensure_future(self.load_todos())
+            self.statusbar.showMessage(f"已在后台提取 {len(result.new_todos)} 条待办事项", 3000)
+        elif result is not None and result.merged:
+            asyncio.ensure_future(self.load_todos())
+    
+    # ==================== 批量补全 ====================
+    
+    @asyncSlot()
+    async def open_backfill_dialog(self):
+        """选择日期区间，在后台补全缺失或过期的总结；有未完成的补全时可选择继续"""
+        if self._backfill_task is not None:
+            QMessageBox.information(self, "批量补全", "批量补全正在后台进行，可在“工具”菜单中停止")
+            return
+        if not self.llm_service.is_available():
+            QMessageBox.warning(self, "提示", "请先在“设置”中配置 API Key")
+            return
+        run = await self.db.get_backfill_run()
+        if run is not None:
+            reply = QMessageBox.question(
+                self,
+                "批量补全",
+                f"上次的批量补全（{run.start_date} 至 {run.end_date}）还剩 {run.counts.get('pending', 0)} 项，"
+                f"是否继续？\n选择“否”将放弃上次的补全并重新选择日期。",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.Yes
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self._start_backfill(run_id=run.id)
+                return
+            await self.db.finish_backfill_run(run.id, "cancelled")
+        dialog = BackfillDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self._start_backfill(*dialog.values())
+    
+    def _start_backfill(self, start=None, end=None, include_todos=False, run_id=None):
+        """启动后台补全任务"""
+        self._backfill_run_id = None
+        self._backfill_task = asyncio.ensure_future(self.run_backfill(start, end, include_todos, run_id))
+        self.stop_backfill_action.setEnabled(True)
+    
+    async def run_backfill(self, start=None, end=None, include_todos=False, run_id=None):
+        """规划（或继续 run_id 指定的）补全并处理到结束；请求以后台优先级排队，不影响界面上的操作"""
+        backfiller = Backfiller(
+            self.db, lambda: self.llm_service, self._llm_requests, on_progress=self.on_backfill_progress
+        )
+        try:
+            if run_id is None:
+                run_id = await backfiller.plan(start, end, include_todos)
+            self._backfill_run_id = run_id
+            run = await backfiller.run(run_id)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            self.statusbar.showMessage(f"批量补全出错：{e}", 5000)
+            return
+        finally:
+            self._backfill_task = None
+            self.stop_backfill_action.setEnabled(False)
+        
+        done, failed = run.counts.get("done", 0), run.counts.get("failed", 0)
+        if run.status == "done":
+            message = f"批量补全完成：处理 {done} 项" + (f"，失败 {failed} 项" if failed else "")
+        else:
+            reason = f"（{backfiller.paused_reason}）" if backfiller.paused_reason else ""
+            message = f"批量补全已暂停{reason}，还剩 {run.counts.get('pending', 0)} 项，可在“工具”菜单中继续"
+        self.statusbar.showMessage(message, 8000)
+        self.schedule_heatmap_refresh()
+        if run.include_todos:
+            await self.load_todos()
+    
+    def on_backfill_progress(self, progress):
+        """补全完成一项：更新状态栏，刷新热力图与当前日期的总结"""
+        message = f"批量补全中：{progress.finished}/{progress.total}"
+        if progress.failed:
+            message += f"（失败 {progress.failed}）"
+        self.statusbar.showMessage(message)
+        if progress.kind == "summary":
+            self.schedule_heatmap_refresh()
+            date = progress.date
+            if date == self.current_date and self._llm_requests.active(("summary", date)) is None:
+                asyncio.ensure_future(self.load_summary())
+    
+    @asyncSlot()
+    async def stop_backfill(self):
+        """停止批量补全并放弃剩余条目（已生成的结果保留）"""
+        task = self._backfill_task
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if self._backfill_run_id is not None:
+            await self.db.finish_backfill_run(self._backfill_run_id, "cancelled")
+        self.statusbar.showMessage("批量补全已停止", 3000)
+    
+    def _flush_summary_stream(self):
+        """将缓冲的增量文本一次性追加到总结面板末尾"""
+        self._stream_flush_timer.stop()
+        if not self._stream_buffer:
+            return
+        text = "".join(self._stream_buffer)
+        self._stream_buffer.clear()
+        self.summary_display.moveCursor(QTextCursor.MoveOperation.End)
+        self.summary_display.insertPlainText(text)
+        self.summary_display.ensureCursorVisible()
+    
+    def _discard_summary_stream(self, date: str, previous_text):
+        """丢弃缓冲区，并在仍停留在原日期时恢复生成前的内容"""
+        self._stream_flush_timer.stop()
+        self._stream_buffer.clear()
+        if previous_text is not None and date == self.current_date:
+            self.summary_display.setPlainText(previous_text)
+    
+    @asyncSlot()
+    async def on_save_summary_clicked(self):
+        """点击保存修改按钮"""
+        await self.save_summary()
+    
+    async def save_summary(self, silent=False, sources=None, token=None):
+        """
+        保存总结到数据库
+        :param sources: 生成总结所依据的片段哈希；手动保存时为 None，保留原有记录
+        :param token: 生成总结的取消令牌；令牌已过期时不保存
+        """
         summary_text = self.summary_display.toPlainText().strip()
         if not summary_text:
             if not silent:
@@ -798,19 +1559,27 @@ class MainWindow(QMainWindow):
             return
         
         from src.models import DiarySummary
-        entries = self.db.get_frag_minds_by_date(self.current_date)
         
-        summary = DiarySummary(
-            date=self.current_date,
-            summary=summary_text,
-            entry_count=len(entries)
-        )
+        def count_and_save(db, date):
+            # 片段计数与写入在同一事务中完成，保证 entry_count 与保存时刻一致
+            summary = DiarySummary(
+                date=date,
+                summary=summary_text,
+                entry_count=db.count_frag_minds_by_date(date),
+                source_fragments=sources
+            )
+            db.save_diary_summary(summary)
         
-        self.db.save_diary_summary(summary)
+        # 检查与提交之间没有 await，过期的生成结果不会进入写队列
+        if token is not None and not self._llm_requests.is_current(token):
+            return
+        await self.db.run_in_transaction(count_and_save, self.current_date)
+        self.schedule_heatmap_refresh()
         if not silent:
             QMessageBox.information(self, "成功", "总结已保存")
     
-    def on_entry_double_clicked(self, item):
+    @asyncSlot(QListWidgetItem)
+    async def on_entry_double_clicked(self, item):
         """双击日记片段进行编辑"""
         entry = item.data(Qt.ItemDataRole.UserRole)
         
@@ -822,9 +1591,11 @@ class MainWindow(QMainWindow):
         )
         
         if ok and text.strip():
-            # 更新数据库
-            self.db.update_frag_mind_content(entry.id, text.strip())
-            self.load_diary_entries()
+            # 更新数据库；依赖该片段的进行中操作作废
+            self._invalidate_entry(entry)
+            await self.db.update_frag_mind_content(entry.id, text.strip())
+            await self.load_diary_entries()
+            await self.related.upsert(entry.id, text.strip(), entry.date)
 
     def show_entry_context_menu(self, position):
         """显示日记片段右键菜单"""
@@ -852,9 +1623,15 @@ class MainWindow(QMainWindow):
         """从日记片段提取待办"""
         entry = item.data(Qt.ItemDataRole.UserRole)
         self.statusbar.showMessage("正在分析待办事项...", 3000)
-        asyncio.create_task(self.process_todo_extraction(entry.content))
+        asyncio.create_task(self.process_todo_extraction(entry.content, ("todo", entry.id)))
 
-    def delete_current_entry(self, item):
+    def _invalidate_entry(self, entry: FragMind):
+        """片段被修改或删除：取消当天的总结生成与该片段的待办提取"""
+        self._llm_requests.invalidate(("summary", entry.date))
+        self._llm_requests.invalidate(("todo", entry.id))
+
+    @asyncSlot()
+    async def delete_current_entry(self, item):
         """删除当前选中的日记片段"""
         entry = item.data(Qt.ItemDataRole.UserRole)
         
@@ -867,22 +1644,37 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.db.delete_frag_mind(entry.id)
-            # 从列表中移除
+            # 先从列表中移除，再等待数据库删除
             row = self.entry_list.row(item)
             self.entry_list.takeItem(row)
+            self._invalidate_entry(entry)
+            await self.db.delete_frag_mind(entry.id)
+            self.schedule_heatmap_refresh()
+            await self.related.remove(entry.id)
     
-    def _finalize_todo_completion(self, todo_id, completed):
-        """延迟执行完成操作"""
-        self.db.update_todo_status(todo_id, completed)
-        self.load_todos()
+    @asyncSlot()
+    async def _finalize_todo_completions(self):
+        """
+        延迟执行完成操作
+        将所有已到期的待完成事项合并为一次批量写入
+        """
+        timers = getattr(self, '_todo_timers', {})
+        due_ids = [todo_id for todo_id, timer in timers.items() if not timer.isActive()]
+        if not due_ids:
+            return
+        
+        for todo_id in due_ids:
+            timers.pop(todo_id)
+        await self.db.run_in_transaction(lambda db: db.update_todos_status(due_ids, True))
+        await self.load_todos()
 
-    def edit_todo_item(self, todo: TodoItem):
+    @asyncSlot()
+    async def edit_todo_item(self, todo: TodoItem):
         """编辑 Todo 内容"""
         text, ok = QInputDialog.getText(self, "编辑待办", "内容:", text=todo.title)
         if ok and text:
-            self.db.update_todo_info(todo.id, title=text)
-            self.load_todos()
+            await self.db.update_todo_info(todo.id, title=text)
+            await self.load_todos()
 
     def show_todo_context_menu(self, todo: TodoItem, pos):
         """显示 Todo 右键菜单"""
@@ -907,12 +1699,14 @@ class MainWindow(QMainWindow):
         
         menu.exec(pos)
 
-    def restore_todo(self, todo: TodoItem):
+    @asyncSlot()
+    async def restore_todo(self, todo: TodoItem):
         """还原待办事项"""
-        self.db.update_todo_status(todo.id, False)
-        self.load_todos()
+        await self.db.update_todo_status(todo.id, False)
+        await self.load_todos()
 
-    def set_todo_date(self, todo: TodoItem):
+    @asyncSlot()
+    async def set_todo_date(self, todo: TodoItem):
         """设置截止时间"""
         dialog = QDialog(self)
         dialog.setWindowTitle("设置截止时间")
@@ -931,13 +1725,14 @@ class MainWindow(QMainWindow):
         
         if dialog.exec() == QDialog.DialogCode.Accepted:
             new_date = dt_edit.dateTime().toPyDateTime()
-            self.db.update_todo_info(todo.id, due_date=new_date)
-            self.load_todos()
+            await self.db.update_todo_info(todo.id, due_date=new_date)
+            await self.load_todos()
 
-    def delete_todo(self, todo: TodoItem):
+    @asyncSlot()
+    async def delete_todo(self, todo: TodoItem):
         """删除 Todo"""
         confirm = QMessageBox.question(self, "确认", f"确定要删除 '{todo.title}' 吗？", 
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if confirm == QMessageBox.StandardButton.Yes:
-            self.db.delete_todo_item(todo.id)
-            self.load_todos()
+            await self.db.delete_todo_item(todo.id)
+            await self.load_todos()